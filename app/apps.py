@@ -2,6 +2,7 @@ import os
 import sys
 import logging
 from django.apps import AppConfig
+from django.conf import settings
 
 logger = logging.getLogger(__name__)
 
@@ -10,6 +11,9 @@ class AppConfig(AppConfig):
     name = 'app'
 
     def ready(self):
+        self.load_cronjobs()
+
+    def load_cronjobs(self):
         if self._should_load_cronjobs():
             try:
                 from app.crons.cronjobs import register_cronjobs
@@ -21,10 +25,17 @@ class AppConfig(AppConfig):
     def _should_load_cronjobs(self):
         if any(cmd in sys.argv for cmd in ('test', 'migrate', 'makemigrations')):
             return False
+        # 独立扫描进程（run_scanner）自己启动定时任务
+        if not settings.SCHEDULER_IN_WEB or 'run_scanner' in sys.argv:
+            return False
         if 'runserver' in sys.argv:
             return os.environ.get('RUN_MAIN') == 'true'
 
-        # prod env
+        # prod env：proj/gunicorn.conf.py的post_fork只在worker中设置，不需要导入psutil；
+        # 不能按sys.argv判断，gunicorn主进程的sys.argv与worker相同，--preload时主进程也会执行到这里
+        if os.environ.get('ARBITRAGE_GUNICORN_WORKER') == '1':
+            return True
+        # 未使用proj/gunicorn.conf.py时：worker的父进程是gunicorn主进程
         try:
             import psutil
             parent_name = psutil.Process(os.getppid()).name().lower()
@@ -0,0 +1,80 @@
+import logging
+import threading
+from typing import Dict
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.request import ACCEPT_ENCODING
+
+logger = logging.getLogger('app')
+
+DEFAULT_TIMEOUT = (10, 30)
+
+
+class HttpClient:
+    """
+    共享的HTTP客户端，集思录和pushplus的请求都通过它发出
+    - 按host维护连接池，keep-alive复用连接，避免每次请求都重新TCP+TLS握手
+    - 自动协商gzip/deflate（安装brotli后支持br）压缩
+    """
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls, *args, **kwargs):
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = super(HttpClient, cls).__new__(cls, *args, **kwargs)
+                cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        with self._lock:
+            if self._initialized:
+                return
+            self.adapter = HTTPAdapter(
+                pool_connections=settings.HTTP_POOL_CONNECTIONS,
+                pool_maxsize=settings.HTTP_POOL_MAXSIZE,
+            )
+            self.session = requests.Session()
+            self.session.mount('https://', self.adapter)
+            self.session.mount('http://', self.adapter)
+            self.session.headers.update({
+                'Accept-Encoding': ACCEPT_ENCODING,
+                'Connection': 'keep-alive',
+            })
+            self._initialized = True
+
+    def get(self, url, **kwargs) -> requests.Response:
+        kwargs.setdefault('timeout', DEFAULT_TIMEOUT)
+        return self.session.get(url, **kwargs)
+
+    def post(self, url, **kwargs) -> requests.Response:
+        kwargs.setdefault('timeout', DEFAULT_TIMEOUT)
+        return self.session.post(url, **kwargs)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """
+        连接复用统计，按host汇总
+        :return: {host: {'requests': 请求数, 'connections': 新建连接数, 'reused': 复用次数}}
+        """
+        result = {}
+        pools = self.adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            host = f"{pool.scheme}://{pool.host}:{pool.port}"
+            item = result.setdefault(host, {'requests': 0, 'connections': 0, 'reused': 0})
+            item['requests'] += pool.num_requests
+            item['connections'] += pool.num_connections
+            item['reused'] += max(pool.num_requests - pool.num_connections, 0)
+        return result
+
+    def log_stats(self):
+        for host, item in self.stats().items():
+            logger.debug("http pool %s: requests=%d, connections=%d, reused=%d",
+                         host, item['requests'], item['connections'], item['reused'])
+
+
+http_client = HttpClient()
@@ -0,0 +1,28 @@
+import importlib
+import threading
+from types import ModuleType
+
+
+class LazyModule:
+    """
+    第一次访问属性时才导入的模块，用于启动时不一定用到的重依赖（numpy、chinese_calendar等）
+    np = LazyModule('numpy')
+    """
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self) -> ModuleType:
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = 'loaded' if self._module is not None else 'not loaded'
+        return f"<LazyModule {self._name!r} ({state})>"
@@ -0,0 +1,136 @@
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import timedelta
+from functools import wraps
+from typing import Callable
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from django.db.models import Q
+from django.db.models.functions import Now
+
+from app.models import SchedulerLease
+
+logger = logging.getLogger('app')
+
+
+class LeaderLease:
+    """
+    基于数据库租约行的主节点选举，所有进程、所有机器中只有持有租约的一个进程执行扫描和发送通知
+    - 租约有效期LEADER_LEASE_SECONDS秒，持有者每LEADER_RENEW_SECONDS秒续约
+    - 租约过期后其他进程在下一次续约时接管；正常退出时释放租约，其他进程立即接管
+    - 过期时间使用数据库时间比较，不受各机器时钟偏差影响
+    - 数据库不可用时视为不是主节点，宁可暂停扫描也不重复扫描
+    - 从非主节点变为主节点时调用add_acquire_listener注册的函数，丢弃其他进程执行扫描期间已过时的内存状态
+    """
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls, *args, **kwargs):
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = super(LeaderLease, cls).__new__(cls, *args, **kwargs)
+                cls._instance.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+                cls._instance._leader = False
+                cls._instance._valid_until = 0.0
+                cls._instance._renew_due = 0.0
+                cls._instance._acquire_listeners = []
+        return cls._instance
+
+    def add_acquire_listener(self, listener: Callable[[], None]):
+        """成为主节点时调用 listener()"""
+        self._acquire_listeners.append(listener)
+
+    def _notify_acquired(self):
+        for listener in list(self._acquire_listeners):
+            try:
+                listener()
+            except Exception as e:
+                logger.error("Leader acquire listener failed: %r", e)
+
+    def is_leader(self) -> bool:
+        """是否为主节点，到了续约时间时先续约"""
+        if time.monotonic() >= self._renew_due:
+            return self.renew()
+        return self._leader and time.monotonic() < self._valid_until
+
+    def renew(self) -> bool:
+        """获取或续约租约，返回是否为主节点"""
+        with self._lock:
+            acquired = False
+            start = time.monotonic()
+            ttl = timedelta(seconds=settings.LEADER_LEASE_SECONDS)
+            try:
+                connection.close_if_unusable_or_obsolete()
+                leader = self._acquire(ttl)
+            except DatabaseError as e:
+                logger.error("Renew leader lease failed: %r", e)
+                leader = False
+
+            if leader != self._leader:
+                if leader:
+                    logger.info("Became scheduler leader: %s", self.holder)
+                    acquired = True
+                else:
+                    logger.warning("Lost scheduler leadership: %s", self.holder)
+            self._leader = leader
+            # 按请求开始的时间计算本地有效期，保证早于数据库中的过期时间
+            self._valid_until = start + ttl.total_seconds() if leader else 0.0
+            self._renew_due = start + settings.LEADER_RENEW_SECONDS
+        if acquired:
+            self._notify_acquired()
+        return leader
+
+    def _acquire(self, ttl: timedelta) -> bool:
+        name = settings.LEADER_LEASE_NAME
+        # 自己持有或已过期时更新，一条UPDATE语句保证只有一个进程成功
+        updated = (
+            SchedulerLease.objects
+            .filter(name=name)
+            .filter(Q(holder=self.holder) | Q(expires_at__lt=Now()))
+            .update(holder=self.holder, expires_at=Now() + ttl)
+        )
+        if updated:
+            return True
+        if SchedulerLease.objects.filter(name=name).exists():
+            return False
+        try:
+            with transaction.atomic():
+                SchedulerLease.objects.create(name=name, holder=self.holder, expires_at=Now() + ttl)
+            return True
+        except IntegrityError:
+            # 其他进程同时创建了租约
+            return False
+
+    def release(self):
+        """释放租约，其他进程下一次续约时即可接管"""
+        with self._lock:
+            if not self._leader:
+                return
+            try:
+                SchedulerLease.objects.filter(name=settings.LEADER_LEASE_NAME, holder=self.holder).update(
+                    holder='', expires_at=Now())
+                logger.info("Released scheduler leadership: %s", self.holder)
+            except DatabaseError as e:
+                logger.error("Release leader lease failed: %r", e)
+            self._leader = False
+            self._valid_until = 0.0
+            self._renew_due = 0.0
+
+
+leader_lease = LeaderLease()
+
+
+def leader_only(func):
+    """只在主节点上执行的定时任务"""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if not leader_lease.is_leader():
+            logger.debug("Not leader, skip %s", func.__name__)
+            return None
+        return func(*args, **kwargs)
+    return wrapper
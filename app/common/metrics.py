@@ -0,0 +1,357 @@
+import bisect
+import fcntl
+import json
+import logging
+import os
+import socket
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+
+logger = logging.getLogger('app')
+
+# 秒
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+# 字节
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576)
+
+LabelValues = Tuple[str, ...]
+
+
+class _CounterChild:
+    __slots__ = ('value', '_lock')
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+
+class _HistogramChild:
+    __slots__ = ('buckets', 'counts', 'sum', '_lock')
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # 每个区间的次数（非累计），最后一个为+Inf
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[LabelValues, object] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values: str):
+        """按标签值取得子指标，子指标创建后缓存，热路径上只有一次字典查找"""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def collect(self) -> Dict[LabelValues, object]:
+        with self._lock:
+            return dict(self._children)
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+    def samples(self) -> Dict[LabelValues, float]:
+        return {values: child.value for values, child in self.collect().items()}
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def samples(self) -> Dict[LabelValues, Dict]:
+        samples = {}
+        for values, child in self.collect().items():
+            with child._lock:
+                samples[values] = {'counts': list(child.counts), 'sum': child.sum}
+        return samples
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def _merge_into(merged: Dict[str, Dict[str, object]], snapshot: Dict[str, Dict[str, object]]):
+    """把一个进程的数据加到merged中：计数器相加，直方图按区间相加（区间定义不同的跳过）"""
+    for name, samples in snapshot.items():
+        target = merged.setdefault(name, {})
+        for key, sample in samples.items():
+            if not isinstance(sample, dict):
+                target[key] = target.get(key, 0) + sample
+                continue
+            total = target.get(key)
+            if total is None:
+                target[key] = {'counts': list(sample['counts']), 'sum': sample['sum']}
+            elif len(total['counts']) == len(sample['counts']):
+                total['counts'] = [a + b for a, b in zip(total['counts'], sample['counts'])]
+                total['sum'] += sample['sum']
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # 无法检查（没有权限等）时视为仍在运行
+        return True
+    return True
+
+
+def _namespace_marker() -> str:
+    """主机名+PID命名空间，METRICS_DIR被多个容器共享时只有同一命名空间中的进程号可以检查"""
+    try:
+        namespace = ''.join(c for c in os.readlink('/proc/self/ns/pid') if c.isdigit())
+    except OSError:
+        namespace = 'unknown'
+    return f"{socket.gethostname()}-{namespace}".replace('_', '-')
+
+
+EXITED_FILE = 'exited.json'  # 已退出进程的数据合计
+LOCK_FILE = '.lock'
+
+
+@contextmanager
+def _dir_lock(directory: str, operation: int):
+    """读取时共享锁，合并已退出进程的文件时排它锁，读取方不会同时读到exited.json和已合并的文件"""
+    fd = os.open(os.path.join(directory, LOCK_FILE), os.O_RDONLY | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, operation)
+        yield
+    finally:
+        os.close(fd)
+
+
+class MetricsRegistry:
+    """
+    Prometheus文本格式的指标注册表，不依赖prometheus_client
+    - 每个进程在内存中累计，调度器每METRICS_FLUSH_SECONDS秒把本进程的数据写入METRICS_DIR
+    - /metrics返回本进程和METRICS_DIR中其他进程（扫描进程、其他worker、已退出的进程）数据的合计，
+      计数器和直方图按进程相加
+    - 写入时把已退出进程的文件合并到exited.json后删除，目录中的文件数不随worker重启增长
+    """
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls, *args, **kwargs):
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = super(MetricsRegistry, cls).__new__(cls, *args, **kwargs)
+                cls._instance._metrics = {}
+                # {命名空间}_{进程号}_{随机后缀}.json：进程号可能被复用，加随机后缀，已退出进程的计数不会被覆盖
+                cls._instance.marker = _namespace_marker()
+                cls._instance.file_name = f"{cls._instance.marker}_{os.getpid()}_{uuid.uuid4().hex[:8]}.json"
+        return cls._instance
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"metric {metric.name} already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def snapshot(self) -> Dict[str, Dict[str, object]]:
+        """本进程的数据 {指标名: {标签值JSON: 值}}"""
+        return {name: {json.dumps(values): sample for values, sample in metric.samples().items()}
+                for name, metric in list(self._metrics.items())}
+
+    def flush(self):
+        """把本进程的数据写入METRICS_DIR"""
+        directory = settings.METRICS_DIR
+        if not directory:
+            return
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.metrics')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self.snapshot(), f)
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, os.path.join(directory, self.file_name))
+            self._prune_exited(directory)
+        except OSError as e:
+            logger.error("Flush metrics to %r failed: %r", directory, e)
+
+    def _prune_exited(self, directory: str):
+        """
+        把进程已退出的文件合并到exited.json，排它锁保证多个进程不会重复合并、读取方不会重复计数
+        只检查同一命名空间中的进程，无法检查的文件视为进程仍在运行
+        """
+        with _dir_lock(directory, fcntl.LOCK_EX):
+            exited = []
+            for file_name in os.listdir(directory):
+                parts = file_name[:-len('.json')].rsplit('_', 2) if file_name.endswith('.json') else []
+                if (len(parts) == 3 and parts[0] == self.marker and parts[1].isdigit()
+                        and not _pid_alive(int(parts[1]))):
+                    exited.append(file_name)
+            if not exited:
+                return
+
+            merged = {}
+            for file_name in [EXITED_FILE] + exited:
+                try:
+                    with open(os.path.join(directory, file_name)) as f:
+                        _merge_into(merged, json.load(f))
+                except FileNotFoundError:
+                    pass
+                except ValueError as e:
+                    logger.warning("Load metrics file %r failed: %r", file_name, e)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.metrics')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(merged, f)
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, os.path.join(directory, EXITED_FILE))
+            for file_name in exited:
+                os.unlink(os.path.join(directory, file_name))
+            logger.info("Merged metrics of %d exited processes", len(exited))
+
+    def _load_others(self) -> List[Dict]:
+        directory = settings.METRICS_DIR
+        if not directory or not os.path.isdir(directory):
+            return []
+        snapshots = []
+        try:
+            with _dir_lock(directory, fcntl.LOCK_SH):
+                for file_name in os.listdir(directory):
+                    if not file_name.endswith('.json') or file_name == self.file_name:
+                        continue
+                    try:
+                        with open(os.path.join(directory, file_name)) as f:
+                            snapshots.append(json.load(f))
+                    except (OSError, ValueError) as e:
+                        logger.warning("Load metrics file %r failed: %r", file_name, e)
+        except OSError as e:
+            logger.warning("Lock metrics dir %r failed: %r", directory, e)
+        return snapshots
+
+    def render(self) -> str:
+        """Prometheus文本格式"""
+        all_merged = {}
+        for snapshot in [self.snapshot()] + self._load_others():
+            _merge_into(all_merged, snapshot)
+        lines = []
+        for name, metric in list(self._metrics.items()):
+            merged = all_merged.get(name, {})
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for key in sorted(merged):
+                values = json.loads(key)
+                sample = merged[key]
+                if metric.kind == 'counter':
+                    lines.append(f"{name}{_format_labels(metric.labelnames, values)} {_format_value(sample)}")
+                    continue
+                if len(sample['counts']) != len(metric.buckets) + 1:
+                    continue
+                cumulative = 0
+                for bound, count in zip(list(metric.buckets) + ['+Inf'], sample['counts']):
+                    cumulative += count
+                    le = bound if bound == '+Inf' else _format_value(bound)
+                    lines.append(f"{name}_bucket{_format_labels(metric.labelnames, values, ('le', le))} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(metric.labelnames, values)} {_format_value(sample['sum'])}")
+                lines.append(f"{name}_count{_format_labels(metric.labelnames, values)} {cumulative}")
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
+
+# 扫描流程的指标
+FETCH_SECONDS = metrics.histogram(
+    'arbitrage_fetch_seconds', 'Jisilu fetch latency including retries, cache misses only', ['endpoint'])
+FETCH_PAYLOAD_BYTES = metrics.histogram(
+    'arbitrage_fetch_payload_bytes', 'Jisilu response payload size', ['endpoint'], buckets=SIZE_BUCKETS)
+PARSE_SECONDS = metrics.histogram('arbitrage_parse_seconds', 'Time spent parsing changed rows', ['category'])
+RULE_EVAL_SECONDS = metrics.histogram(
+    'arbitrage_rule_eval_seconds', 'Time spent evaluating notify rules', ['category'])
+DB_SECONDS = metrics.histogram('arbitrage_db_seconds', 'Database query latency in scan cycles', ['operation'])
+NOTIFY_SECONDS = metrics.histogram('arbitrage_notify_seconds', 'Notification send latency', ['channel', 'result'])
+ROWS_PROCESSED = metrics.counter('arbitrage_rows_processed_total', 'Rows returned by jisilu', ['category'])
+ROWS_SKIPPED = metrics.counter('arbitrage_rows_skipped_total', 'Rows that failed to parse, changed rows only', ['category'])
+ALERTS_FIRED = metrics.counter(
+    'arbitrage_alerts_fired_total', 'New alerts committed to the notification outbox', ['category'])
+
+
+def endpoint_label(url: str) -> str:
+    """接口URL去掉域名，标签取值固定"""
+    return '/' + url.split('://', 1)[-1].split('/', 1)[-1] if '://' in url else url
+
+
+def record_db_time(execute, sql, params, many, context):
+    """connection.execute_wrapper使用：记录每条SQL的耗时，按语句类型区分"""
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        operation = sql.lstrip().split(' ', 1)[0].upper() if sql else 'UNKNOWN'
+        DB_SECONDS.labels(operation).observe(time.perf_counter() - start)
@@ -0,0 +1,237 @@
+import contextvars
+import logging
+import math
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, Tuple
+
+from django.conf import settings
+
+logger = logging.getLogger('app')
+
+_deadline = contextvars.ContextVar('cycle_deadline', default=None)
+
+
+@contextmanager
+def cycle_deadline(seconds: float):
+    """设置本次扫描周期的截止时间，周期内的重试、退避和请求超时都不会超过它"""
+    token = _deadline.set(time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining_time() -> Optional[float]:
+    """距离周期截止时间的剩余秒数，未设置截止时间时返回None"""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return max(deadline - time.monotonic(), 0.0)
+
+
+def request_timeout(timeout: Tuple[float, float]) -> Tuple[float, float]:
+    """按周期剩余时间收紧requests的(连接超时, 读取超时)"""
+    remaining = remaining_time()
+    if remaining is None:
+        return timeout
+    remaining = max(remaining, 0.1)
+    return min(timeout[0], remaining), min(timeout[1], remaining)
+
+
+class CircuitBreaker:
+    """
+    单个接口的熔断器
+    连续失败failure_threshold次后熔断，reset_timeout秒内直接失败；
+    之后放行一次试探请求，成功则恢复，失败则继续熔断
+    """
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                # 半开状态：放行一次试探请求
+                self._opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+
+class LatencyTracker:
+    """记录单个接口最近的成功请求耗时，用于计算对冲请求的触发阈值"""
+    def __init__(self, size: int = 100):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct: float, min_samples: int) -> Optional[float]:
+        with self._lock:
+            if len(self._samples) < min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[max(math.ceil(pct / 100 * len(ordered)), 1) - 1]
+
+
+class TokenBucket:
+    """
+    令牌桶限速：每秒补充rate个令牌，最多积累capacity个
+    """
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _wait_time(self) -> float:
+        """取走一个令牌，令牌不足时返回需要等待的秒数"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self, stop: Optional[threading.Event] = None) -> bool:
+        """
+        等待直到取得一个令牌
+        :param stop: 设置后放弃等待
+        :return: 是否取得令牌
+        """
+        while True:
+            wait_time = self._wait_time()
+            if wait_time <= 0:
+                return True
+            if stop is None:
+                time.sleep(wait_time)
+            elif stop.wait(wait_time):
+                return False
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_latencies: Dict[str, LatencyTracker] = {}
+_registry_lock = threading.Lock()
+_hedge_executor = ThreadPoolExecutor(max_workers=10, thread_name_prefix='fetch_hedge')
+
+
+def get_circuit_breaker(endpoint: str) -> CircuitBreaker:
+    with _registry_lock:
+        breaker = _breakers.get(endpoint)
+        if breaker is None:
+            breaker = _breakers[endpoint] = CircuitBreaker(
+                settings.CIRCUIT_FAILURE_THRESHOLD, settings.CIRCUIT_RESET_SECONDS)
+        return breaker
+
+
+def get_latency_tracker(endpoint: str) -> LatencyTracker:
+    with _registry_lock:
+        tracker = _latencies.get(endpoint)
+        if tracker is None:
+            tracker = _latencies[endpoint] = LatencyTracker()
+        return tracker
+
+
+def resilient_fetch(endpoint: str, fetch: Callable[[], Optional[Dict]]) -> Optional[Dict]:
+    """
+    带重试、对冲请求和熔断的查询
+    :param endpoint: 接口标识（URL），熔断和耗时统计按它区分
+    :param fetch: 实际查询函数，失败时返回None
+    :return: 数据或None
+    """
+    breaker = get_circuit_breaker(endpoint)
+    if not breaker.allow():
+        logger.warning("Circuit open, skip query: %r", endpoint)
+        return None
+
+    retries = settings.FETCH_RETRIES
+    for attempt in range(retries + 1):
+        data = _hedged_fetch(endpoint, fetch)
+        if data is not None:
+            breaker.record_success()
+            return data
+
+        if attempt == retries:
+            break
+        # 指数退避 + 随机抖动，不超过周期剩余时间
+        backoff = min(settings.FETCH_BACKOFF_MAX, settings.FETCH_BACKOFF_BASE * 2 ** attempt)
+        backoff *= random.uniform(0.5, 1.0)
+        remaining = remaining_time()
+        if remaining is not None and remaining <= backoff:
+            logger.warning("Cycle deadline reached, give up query: %r", endpoint)
+            break
+        logger.info("Retry query %r in %.2fs (attempt %d/%d)", endpoint, backoff, attempt + 1, retries)
+        time.sleep(backoff)
+
+    breaker.record_failure()
+    if breaker.is_open:
+        logger.error("Circuit opened for %r", endpoint)
+    return None
+
+
+def _timed_fetch(endpoint: str, fetch: Callable[[], Optional[Dict]]) -> Optional[Dict]:
+    start = time.monotonic()
+    data = fetch()
+    if data is not None:
+        get_latency_tracker(endpoint).add(time.monotonic() - start)
+    return data
+
+
+def _hedged_fetch(endpoint: str, fetch: Callable[[], Optional[Dict]]) -> Optional[Dict]:
+    """
+    请求耗时超过历史耗时的FETCH_HEDGE_PERCENTILE分位时，再发出一个相同的请求，取先成功的结果
+    """
+    threshold = None
+    if settings.FETCH_HEDGE_PERCENTILE > 0:
+        threshold = get_latency_tracker(endpoint).percentile(
+            settings.FETCH_HEDGE_PERCENTILE, settings.FETCH_HEDGE_MIN_SAMPLES)
+    if threshold is None:
+        return _timed_fetch(endpoint, fetch)
+
+    primary = _hedge_executor.submit(contextvars.copy_context().run, _timed_fetch, endpoint, fetch)
+    done, _ = wait([primary], timeout=threshold)
+    if done:
+        return primary.result()
+
+    logger.info("Query %r slower than %.2fs, send hedged request", endpoint, threshold)
+    hedge = _hedge_executor.submit(contextvars.copy_context().run, _timed_fetch, endpoint, fetch)
+    pending = {primary, hedge}
+    while pending:
+        done, pending = wait(pending, timeout=remaining_time(), return_when=FIRST_COMPLETED)
+        if not done:
+            logger.warning("Cycle deadline reached, give up query: %r", endpoint)
+            return None
+        for future in done:
+            data = future.result()
+            if data is not None:
+                return data
+    return None
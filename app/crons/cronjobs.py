@@ -1,6 +1,17 @@
 from apscheduler.schedulers.background import BackgroundScheduler
-from django_apscheduler.jobstores import MemoryJobStore
+from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
+from django.conf import settings
+from apscheduler.jobstores.memory import MemoryJobStore
+from app.common.leader import leader_lease, leader_only
+from app.common.metrics import metrics
+from app.crons.scan_jobs import SCAN_JOB_ID, run_pending_scan_jobs, set_scheduler
+from app.crons.triggers import TradingSessionTrigger
 from app.query.query_funds import monitor_funds_and_notify
+from app.notify.dispatcher import notify_dispatcher
+from app.query.premium_rollup import rollup_and_purge_premium_history
+from app.query.trading_time import china_tz
+from datetime import datetime, timedelta
 import threading
 import logging
 import atexit
@@ -36,23 +47,81 @@ class Cronjobs:
             try:
                 self.scheduler = BackgroundScheduler()
                 self.scheduler.add_jobstore(MemoryJobStore(), 'default')
+                # 每个进程都启动调度器，只有持有租约的进程执行扫描，其他进程持续尝试接管
+                self.scheduler.add_job(
+                    id="leader_lease",
+                    func=leader_lease.renew,
+                    trigger=IntervalTrigger(seconds=settings.LEADER_RENEW_SECONDS),
+                    next_run_time=datetime.now(),
+                    max_instances=1,
+                    coalesce=True,
+                    replace_existing=True
+                )
                 self.scheduler.add_job(
                     id="fund_monitor",  # 建议指定唯一ID
-                    func=monitor_funds_and_notify,
-                    trigger='interval',
-                    minutes=7,
+                    func=leader_only(monitor_funds_and_notify),
+                    trigger=self._fund_monitor_trigger(),
+                    max_instances=1,  # 上一轮未结束时不启动新的一轮
+                    coalesce=True,
+                    replace_existing=True
+                )
+                # 手动触发的扫描任务，与定时扫描在同一进程中依次执行
+                self.scheduler.add_job(
+                    id=SCAN_JOB_ID,
+                    func=leader_only(run_pending_scan_jobs),
+                    trigger=IntervalTrigger(seconds=settings.SCAN_JOB_POLL_SECONDS),
+                    max_instances=1,
+                    coalesce=True,
+                    replace_existing=True
+                )
+                # 本进程的指标写入METRICS_DIR，由/metrics合计
+                self.scheduler.add_job(
+                    id="metrics_flush",
+                    func=metrics.flush,
+                    trigger=IntervalTrigger(seconds=settings.METRICS_FLUSH_SECONDS),
+                    max_instances=1,
+                    coalesce=True,
+                    replace_existing=True
+                )
+                self.scheduler.add_job(
+                    id="premium_rollup",
+                    func=leader_only(rollup_and_purge_premium_history),
+                    trigger=CronTrigger(
+                        day_of_week='mon-fri',
+                        hour=settings.PREMIUM_ROLLUP_HOUR,
+                        minute=settings.PREMIUM_ROLLUP_MINUTE,
+                        timezone=china_tz,
+                    ),
+                    max_instances=1,
+                    coalesce=True,
                     replace_existing=True
                 )
                 self.scheduler.start()
+                set_scheduler(self.scheduler)
+                # 继续发送上次退出时未发送完的通知
+                notify_dispatcher.start()
                 atexit.register(self.shutdown)  # 确保程序退出时关闭
                 logger.info("Cronjobs registered successfully")
             except Exception as e:
                 logger.critical(f"Cronjob registration failed: {str(e)}")
                 raise
 
+    def _fund_monitor_trigger(self):
+        if settings.SCAN_SCHEDULE == 'session':
+            return TradingSessionTrigger(
+                session_interval=timedelta(seconds=settings.SCAN_SESSION_INTERVAL_SECONDS),
+                near_close_interval=timedelta(seconds=settings.SCAN_NEAR_CLOSE_INTERVAL_SECONDS),
+            )
+        return IntervalTrigger(minutes=settings.SCAN_INTERVAL_MINUTES)
+
     def shutdown(self):
         if self.scheduler and self.scheduler.running:
             self.scheduler.shutdown()
+            # 等待扫描周期结束后，再发送完已入队的通知
+            notify_dispatcher.shutdown()
+            # 释放租约，其他进程下一次续约时立即接管
+            leader_lease.release()
+            metrics.flush()
             logger.info("Cronjobs shutdown gracefully")
 
 def register_cronjobs():
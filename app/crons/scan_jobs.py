@@ -0,0 +1,122 @@
+import logging
+import traceback
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from app.models import ScanJob
+from app.query.trading_time import china_tz
+
+logger = logging.getLogger('app')
+
+SCAN_JOB_ID = 'scan_jobs'  # 调度器中执行手动扫描任务的job
+
+_scheduler = None  # 本进程运行的调度器，未运行时由主节点轮询执行
+
+
+def set_scheduler(scheduler):
+    global _scheduler
+    _scheduler = scheduler
+
+
+def enqueue_scan_job() -> Tuple[ScanJob, bool]:
+    """
+    创建手动扫描任务，立即返回，不等待扫描
+    :return: (任务, 是否新建)，已有未完成的任务时返回该任务
+    """
+    # 没有主节点时不会执行清理，触发时也检查一次，过期的任务不会一直合并之后的触发
+    _expire_stale_jobs()
+    while True:
+        job = ScanJob.objects.filter(active=True).first()
+        if job is not None:
+            return job, False
+        try:
+            with transaction.atomic():
+                job = ScanJob.objects.create(created_at=timezone.now())
+        except IntegrityError:
+            # 其他请求同时创建了任务，重新读取
+            continue
+        wake_scan_jobs()
+        return job, True
+
+
+def wake_scan_jobs():
+    """本进程运行调度器时立即执行；本进程不是主节点时由主节点在SCAN_JOB_POLL_SECONDS秒内执行"""
+    scheduler = _scheduler
+    if scheduler is None or not scheduler.running:
+        return
+    try:
+        scheduler.modify_job(SCAN_JOB_ID, next_run_time=datetime.now(china_tz))
+    except Exception as e:
+        logger.warning("Wake scan jobs failed: %r", e)
+
+
+def run_pending_scan_jobs():
+    """执行最早的等待中任务，由主节点的调度器调用"""
+    _expire_stale_jobs()
+    job = ScanJob.objects.filter(status=ScanJob.PENDING).order_by('created_at').first()
+    if job is None:
+        return
+    # 条件更新，只有一个进程能开始执行
+    if not ScanJob.objects.filter(id=job.id, status=ScanJob.PENDING).update(
+            status=ScanJob.RUNNING, started_at=timezone.now()):
+        return
+
+    from app.query.query_funds import SCAN_CATEGORIES, monitor_funds_and_notify
+    progress = {'total': len(SCAN_CATEGORIES), 'done': 0, 'categories': {}}
+    ScanJob.objects.filter(id=job.id).update(progress=progress)
+
+    def on_category_done(name, seconds, funds):
+        progress['done'] += 1
+        progress['categories'][name] = {'seconds': round(seconds, 3), 'funds': funds}
+        ScanJob.objects.filter(id=job.id).update(progress=progress)
+
+    logger.info("Scan job %d started", job.id)
+    try:
+        # 刚执行过定时扫描时复用其快照
+        result = monitor_funds_and_notify(on_category_done=on_category_done, use_snapshot_cache=True)
+        if result is None:
+            result = {'skipped': 'not trading time'}
+        status, error = ScanJob.SUCCEEDED, ''
+    except Exception as e:
+        logger.error("Scan job %d failed: %r, tb: %r", job.id, e, traceback.format_exc())
+        result, status, error = None, ScanJob.FAILED, repr(e)[:200]
+    ScanJob.objects.filter(id=job.id).update(
+        status=status, active=None, finished_at=timezone.now(), result=result, error=error)
+    logger.info("Scan job %d finished: %s", job.id, ScanJob.STATUS_NAMES[status])
+
+
+def _expire_stale_jobs():
+    """
+    超时的任务标记为失败，避免之后的触发一直合并到该任务
+    - 执行中的进程退出后任务不会完成：开始执行超过SCAN_JOB_TIMEOUT_SECONDS秒
+    - 没有主节点执行（所有调度器都已停止）：等待超过SCAN_JOB_PENDING_TIMEOUT_SECONDS秒
+    """
+    now = timezone.now()
+    expired = ScanJob.objects.filter(
+        status=ScanJob.RUNNING, started_at__lt=now - timedelta(seconds=settings.SCAN_JOB_TIMEOUT_SECONDS),
+    ).update(status=ScanJob.FAILED, active=None, finished_at=now, error='timed out')
+    expired += ScanJob.objects.filter(
+        status=ScanJob.PENDING, created_at__lt=now - timedelta(seconds=settings.SCAN_JOB_PENDING_TIMEOUT_SECONDS),
+    ).update(status=ScanJob.FAILED, active=None, finished_at=now, error='not picked up by any scheduler')
+    if expired:
+        logger.warning("%d scan jobs timed out", expired)
+
+
+def scan_job_data(job: ScanJob) -> Dict:
+    def isoformat(value: Optional[datetime]) -> Optional[str]:
+        return value.isoformat() if value else None
+
+    return {
+        'job_id': job.id,
+        'status': ScanJob.STATUS_NAMES[job.status],
+        'created_at': isoformat(job.created_at),
+        'started_at': isoformat(job.started_at),
+        'finished_at': isoformat(job.finished_at),
+        'progress': job.progress,
+        'result': job.result,
+        'error': job.error,
+    }
@@ -0,0 +1,43 @@
+from datetime import datetime, timedelta
+
+from apscheduler.triggers.base import BaseTrigger
+
+from app.query.trading_time import (
+    NEAR_CLOSE_START, china_tz, is_near_close, is_trading_time, next_session_open,
+)
+
+
+class TradingSessionTrigger(BaseTrigger):
+    """
+    按交易时段调度的触发器
+    - 非交易时间直接等到下一个开盘时间（上午9:30或下午13:00）
+    - 交易时间内按session_interval轮询，临近收盘窗口（14:30-14:50）按near_close_interval轮询
+    """
+    def __init__(self, session_interval: timedelta, near_close_interval: timedelta):
+        self.session_interval = session_interval
+        self.near_close_interval = near_close_interval
+
+    def get_next_fire_time(self, previous_fire_time, now):
+        base = (previous_fire_time or now).astimezone(china_tz)
+        if not is_trading_time(base):
+            return next_session_open(base)
+
+        interval = self.near_close_interval if is_near_close(base) else self.session_interval
+        next_time = base + interval
+
+        # 跨入临近收盘窗口时，从窗口开始时间起按快速频率轮询
+        near_close_start = china_tz.localize(datetime.combine(base.date(), NEAR_CLOSE_START))
+        if base < near_close_start < next_time:
+            next_time = near_close_start
+
+        if not is_trading_time(next_time):
+            return next_session_open(next_time)
+        return next_time
+
+    def __str__(self):
+        return (f"trading_session[session={self.session_interval}, "
+                f"near_close={self.near_close_interval}]")
+
+    def __repr__(self):
+        return (f"<{self.__class__.__name__} (session_interval={self.session_interval!r}, "
+                f"near_close_interval={self.near_close_interval!r})>")
@@ -0,0 +1,102 @@
+import math
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_databases, teardown_databases
+from django.test import override_settings
+
+from app.common.leader import leader_lease
+from app.models import FundNotification, NotificationOutbox
+from app.notify.dispatcher import notify_dispatcher
+from app.notify.ledger import notification_ledger
+from app.query.fingerprint import invalidate_fingerprint_indexes
+from app.query.query_funds import monitor_funds_and_notify
+from app.replay.server import ReplayServer
+
+
+def percentile(values, pct):
+    """最近秩百分位数"""
+    ordered = sorted(values)
+    rank = max(math.ceil(pct / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+class Command(BaseCommand):
+    help = "Run monitor_funds_and_notify against a local jisilu/pushplus replay server and report cycle timings"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cycles', type=int, default=20, help='number of scan cycles')
+        parser.add_argument('--rows', type=int, default=200, help='synthetic rows per category')
+        parser.add_argument('--latency', type=float, default=0.05, help='fixed response latency in seconds')
+        parser.add_argument('--jitter', type=float, default=0.05, help='max random extra latency in seconds')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='probability of an HTTP 500 response')
+        parser.add_argument('--change-ratio', type=float, default=0.1, help='fraction of rows changed per request')
+        parser.add_argument('--fixtures', default=None, help='directory with recorded jisilu payloads')
+        parser.add_argument('--cold', action='store_true', help='clear fingerprint indexes before every cycle')
+        parser.add_argument('--keepdb', action='store_true', help='keep the test database between runs')
+
+    def handle(self, *args, **options):
+        # 与测试用例一样在单独的测试数据库中运行，不读写正在运行的扫描进程使用的数据库
+        real_name = connection.settings_dict['NAME']
+        old_config = setup_databases(verbosity=0, interactive=False, keepdb=options['keepdb'])
+        try:
+            if connection.settings_dict['NAME'] == real_name:
+                raise CommandError("bench_cycle refuses to run against the configured database")
+            self._run(options)
+        finally:
+            teardown_databases(old_config, verbosity=0, keepdb=options['keepdb'])
+
+    def _run(self, options):
+        FundNotification.objects.all().delete()
+        NotificationOutbox.objects.all().delete()
+        notification_ledger.reset()
+        # 发送线程只在主节点上发送；测试数据库中没有其他进程，本进程取得租约
+        if not leader_lease.renew():
+            raise CommandError("bench_cycle could not acquire the scheduler lease in the test database")
+
+        server = ReplayServer(
+            rows=options['rows'],
+            latency=options['latency'],
+            jitter=options['jitter'],
+            error_rate=options['error_rate'],
+            change_ratio=options['change_ratio'],
+            fixtures_dir=options['fixtures'],
+        )
+        durations = []
+        with server, override_settings(
+            JISILU_BASE_URL=server.url,
+            PUSHPLUS_URL=f'{server.url}/send',
+            SNAPSHOT_CACHE_TTL=0,
+            NOTIFY_RATE_PER_MINUTE=60000,
+            NOTIFY_RATE_BURST=1000,
+            # 不覆盖web进程读取的最新数据和指标
+            LATEST_PREMIUM_FILE='',
+            METRICS_DIR='',
+        ):
+            invalidate_fingerprint_indexes()
+            for _ in range(options['cycles']):
+                if options['cold']:
+                    invalidate_fingerprint_indexes()
+                start = time.perf_counter()
+                monitor_funds_and_notify(ignore_trading_time=True)
+                durations.append(time.perf_counter() - start)
+                # 清理压测产生的通知记录，保证每个周期都会重新通知
+                FundNotification.objects.all().delete()
+                notification_ledger.reset()
+                # 通知异步发送，等待发送完后清理，保证下个周期相同内容的通知不会被去重
+                if not notify_dispatcher.flush():
+                    self.stderr.write("notifications not delivered within 30s")
+                NotificationOutbox.objects.all().delete()
+            invalidate_fingerprint_indexes()
+            notification_ledger.reset()
+        # 发送线程的数据库连接关闭后才能删除测试数据库
+        notify_dispatcher.shutdown(timeout=5)
+        leader_lease.release()
+
+        total = sum(durations)
+        self.stdout.write(f"cycles:            {len(durations)}")
+        self.stdout.write(f"cycle p50:         {percentile(durations, 50) * 1000:.1f} ms")
+        self.stdout.write(f"cycle p99:         {percentile(durations, 99) * 1000:.1f} ms")
+        self.stdout.write(f"rows/sec:          {server.rows_served / total:.1f}")
+        self.stdout.write(f"notifications/sec: {len(server.messages) / total:.1f}")
@@ -0,0 +1,55 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from app.query.fund_index import fund_index
+from app.query.notify_condition import (
+    build_notify_columns, check_notify_condition, check_notify_condition_batch, get_notify_rules,
+)
+
+
+class Command(BaseCommand):
+    help = "Compare check_notify_condition with the compiled notify rules (per row and batch)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000, help='rows per category')
+        parser.add_argument('--repeat', type=int, default=200, help='number of evaluations')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        fund_ids = list(fund_index.snapshot().funds) + [str(900000 + i) for i in range(options['rows'])]
+        rows = [
+            (rng.choice(fund_ids), round(rng.gauss(0, 3), 2), rng.choice(['开放申购', '暂停申购', '限100']),
+             rng.choice(['开放赎回', '暂停赎回']), rng.random() < 0.2)
+            for _ in range(options['rows'])
+        ]
+        rules = get_notify_rules()
+        repeat = options['repeat']
+
+        def legacy(near_close):
+            return [check_notify_condition(fund_id, premium, apply_status, redeem_status, near_close, holding)
+                    for fund_id, premium, apply_status, redeem_status, holding in rows]
+
+        def compiled(near_close):
+            match = rules.matcher(near_close)
+            return [match(fund_id, premium, apply_status, redeem_status, holding)
+                    for fund_id, premium, apply_status, redeem_status, holding in rows]
+
+        def batch(near_close):
+            return check_notify_condition_batch(build_notify_columns(rows), near_close).tolist()
+
+        for near_close in (False, True):
+            expected = legacy(near_close)
+            if compiled(near_close) != expected or batch(near_close) != expected:
+                self.stderr.write(self.style.ERROR(f"results differ (near_close={near_close})"))
+                return
+
+        self.stdout.write(f"rows: {len(rows)}, repeat: {repeat}")
+        for name, func in (('check_notify_condition', legacy), ('compiled per row', compiled), ('compiled batch', batch)):
+            start = time.perf_counter()
+            for i in range(repeat):
+                func(bool(i % 2))
+            elapsed = time.perf_counter() - start
+            self.stdout.write(f"{name:24} {elapsed / repeat * 1000:8.3f} ms/cycle {elapsed / repeat / len(rows) * 1e9:8.0f} ns/row")
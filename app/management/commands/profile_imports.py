@@ -0,0 +1,82 @@
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+IMPORT_TIME_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$')
+
+# 在子进程中执行：与gunicorn worker相同的启动步骤，URL配置加载完即可处理第一个请求
+PROFILE_SCRIPT = '''
+import importlib, json, sys, time
+start = time.perf_counter()
+import django
+django.setup()
+setup = time.perf_counter()
+from django.core.wsgi import get_wsgi_application
+from django.urls import get_resolver
+get_wsgi_application()
+get_resolver().url_patterns
+ready = time.perf_counter()
+for name in sys.argv[1:]:
+    importlib.import_module(name)
+done = time.perf_counter()
+print(json.dumps({"setup": setup - start, "ready": ready - start, "modules": done - ready}))
+'''
+
+
+class Command(BaseCommand):
+    help = ("Profile import time of a fresh worker (python -X importtime): django.setup, "
+            "the WSGI application and URL conf, then the given modules")
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('modules', nargs='*', help='extra modules to import after the worker is ready')
+        parser.add_argument('--top', type=int, default=20, help='number of modules to list')
+        parser.add_argument('--sort', choices=['self', 'cumulative'], default='cumulative')
+
+    def handle(self, *args, **options):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings.SETTINGS_MODULE)
+        start = time.perf_counter()
+        proc = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', PROFILE_SCRIPT] + options['modules'],
+            env=env, capture_output=True, text=True, cwd=settings.BASE_DIR,
+        )
+        wall = time.perf_counter() - start
+        if proc.returncode != 0:
+            raise CommandError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else 'profile failed')
+
+        imports = []
+        for line in proc.stderr.splitlines():
+            match = IMPORT_TIME_LINE.match(line)
+            if match:
+                imports.append((match.group(4), int(match.group(1)), int(match.group(2)), len(match.group(3)) // 2))
+        timings = json.loads(proc.stdout.strip().splitlines()[-1])
+
+        key = 2 if options['sort'] == 'cumulative' else 1
+        self.stdout.write(f"{'cumulative(ms)':>15} {'self(ms)':>9}  module")
+        for name, self_us, cumulative_us, _ in sorted(imports, key=lambda item: -item[key])[:options['top']]:
+            self.stdout.write(f"{cumulative_us / 1000:>15.1f} {self_us / 1000:>9.1f}  {name}")
+
+        # 按顶层包汇总自身耗时
+        packages = defaultdict(int)
+        for name, self_us, _, _ in imports:
+            packages[name.split('.')[0]] += self_us
+        self.stdout.write('')
+        self.stdout.write(f"{'self(ms)':>15}  package")
+        for name, self_us in sorted(packages.items(), key=lambda item: -item[1])[:options['top']]:
+            self.stdout.write(f"{self_us / 1000:>15.1f}  {name}")
+
+        total = sum(self_us for _, self_us, _, _ in imports) / 1000
+        self.stdout.write('')
+        self.stdout.write(
+            f"modules imported: {len(imports)}, total import time: {total:.1f}ms\n"
+            f"django.setup: {timings['setup'] * 1000:.1f}ms, "
+            f"ready for first request: {timings['ready'] * 1000:.1f}ms, "
+            f"extra modules: {timings['modules'] * 1000:.1f}ms, process wall time: {wall * 1000:.1f}ms"
+        )
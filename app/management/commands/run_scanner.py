@@ -0,0 +1,43 @@
+import logging
+import signal
+import threading
+import time
+
+import psutil
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from app.crons.cronjobs import Cronjobs
+
+logger = logging.getLogger('app')
+
+
+class Command(BaseCommand):
+    help = ("Run the fund scanner and notification sender without the web stack, "
+            "use --settings=proj.scanner_settings to load the ORM only")
+    requires_system_checks = []
+
+    def handle(self, *args, **options):
+        process = psutil.Process()
+        stop = threading.Event()
+
+        def on_signal(signum, frame):
+            logger.info("Received %s, stopping scanner", signal.Signals(signum).name)
+            stop.set()
+
+        for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+            signal.signal(signum, on_signal)
+
+        cronjobs = Cronjobs()
+        cronjobs.register_all_cronjobs()
+        # 从进程创建开始计时，包括解释器启动和django.setup
+        startup = time.time() - process.create_time()
+        logger.info("Scanner started in %.2fs, rss %.1f MB, %d apps loaded (PID: %s)",
+                    startup, process.memory_info().rss / 2 ** 20, len(apps.get_app_configs()), process.pid)
+
+        while not stop.wait(1):
+            pass
+
+        # 等待正在进行的扫描周期结束，发送完已入队的通知，释放主节点租约
+        cronjobs.shutdown()
+        logger.info("Scanner stopped, rss %.1f MB", process.memory_info().rss / 2 ** 20)
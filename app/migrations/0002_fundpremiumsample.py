@@ -0,0 +1,29 @@
+# Generated by Django 4.2.20 on 2026-10-18 04:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FundPremiumSample',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fund_id', models.CharField(max_length=20)),
+                ('ts', models.DateTimeField()),
+                ('premium', models.FloatField()),
+                ('apply_code', models.PositiveSmallIntegerField()),
+                ('redeem_code', models.PositiveSmallIntegerField()),
+            ],
+            options={
+                'verbose_name': 'fund_premium_sample',
+                'verbose_name_plural': 'fund_premium_sample',
+                'indexes': [models.Index(fields=['fund_id', 'ts'], name='premium_sample_fund_ts')],
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.20 on 2026-10-18 04:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0002_fundpremiumsample'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FundPremiumDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fund_id', models.CharField(max_length=20)),
+                ('trade_date', models.DateField()),
+                ('premium_open', models.FloatField()),
+                ('premium_high', models.FloatField()),
+                ('premium_low', models.FloatField()),
+                ('premium_close', models.FloatField()),
+                ('sample_count', models.IntegerField(default=0)),
+                ('seconds_above', models.IntegerField(default=0)),
+                ('seconds_below', models.IntegerField(default=0)),
+                ('premium_threshold', models.FloatField(null=True)),
+                ('discount_threshold', models.FloatField()),
+            ],
+            options={
+                'verbose_name': 'fund_premium_daily',
+                'verbose_name_plural': 'fund_premium_daily',
+                'constraints': [models.UniqueConstraint(fields=('fund_id', 'trade_date'), name='unique_fund_premium_daily')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.20 on 2026-10-18 05:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0004_notificationoutbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificationoutbox',
+            name='delivered_channels',
+            field=models.CharField(blank=True, default='', max_length=200),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.20 on 2026-10-18 05:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0005_notificationoutbox_delivered_channels'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SchedulerLease',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('holder', models.CharField(blank=True, default='', max_length=100)),
+                ('expires_at', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': 'scheduler_lease',
+                'verbose_name_plural': 'scheduler_lease',
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.20 on 2026-10-18 06:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0006_schedulerlease'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScanJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('active', models.BooleanField(default=True, null=True, unique=True)),
+                ('status', models.PositiveSmallIntegerField(default=0)),
+                ('created_at', models.DateTimeField()),
+                ('started_at', models.DateTimeField(null=True)),
+                ('finished_at', models.DateTimeField(null=True)),
+                ('progress', models.JSONField(default=dict)),
+                ('result', models.JSONField(null=True)),
+                ('error', models.CharField(blank=True, default='', max_length=200)),
+            ],
+            options={
+                'verbose_name': 'scan_job',
+                'verbose_name_plural': 'scan_job',
+                'indexes': [models.Index(fields=['status', 'created_at'], name='scan_job_status_created')],
+            },
+        ),
+    ]
@@ -18,3 +18,136 @@ class FundNotification(models.Model):
 
     def __str__(self):
         return f"{self.fund_id} - {self.notify_date}"
+
+
+class FundPremiumSample(models.Model):
+    """
+    盘中溢价率采样，只在一行数据与上次采样相比有变化时写入，
+    每条采样在下一条采样之前一直有效
+    """
+    fund_id = models.CharField(max_length=20)
+    ts = models.DateTimeField()
+    premium = models.FloatField()
+    # 申购状态编码见notify_rules.APPLY_*，赎回状态编码见premium_history.REDEEM_*
+    apply_code = models.PositiveSmallIntegerField()
+    redeem_code = models.PositiveSmallIntegerField()
+
+    class Meta:
+        verbose_name = "fund_premium_sample"
+        verbose_name_plural = verbose_name
+        indexes = [
+            models.Index(fields=["fund_id", "ts"], name="premium_sample_fund_ts"),
+        ]
+
+    def __str__(self):
+        return f"{self.fund_id} - {self.ts} - {self.premium}"
+
+
+class FundPremiumDaily(models.Model):
+    """
+    每个交易日的溢价率汇总，由FundPremiumSample按天汇总得到
+    seconds_above/seconds_below为交易时段内溢价率高于通知阈值、折价超过所需折价的秒数
+    """
+    fund_id = models.CharField(max_length=20)
+    trade_date = models.DateField()
+    premium_open = models.FloatField()
+    premium_high = models.FloatField()
+    premium_low = models.FloatField()
+    premium_close = models.FloatField()
+    sample_count = models.IntegerField(default=0)
+    seconds_above = models.IntegerField(default=0)
+    seconds_below = models.IntegerField(default=0)
+    # 汇总时使用的阈值，调整规则后仍能对照
+    premium_threshold = models.FloatField(null=True)
+    discount_threshold = models.FloatField()
+
+    class Meta:
+        verbose_name = "fund_premium_daily"
+        verbose_name_plural = verbose_name
+        constraints = [
+            models.UniqueConstraint(
+                fields=["fund_id", "trade_date"],
+                name="unique_fund_premium_daily"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.fund_id} - {self.trade_date}"
+
+
+class NotificationOutbox(models.Model):
+    """
+    待发送的通知，与FundNotification在同一个事务中写入，发送成功后标记为已发送
+    dedupe_key唯一，同一条通知不会重复写入
+    """
+    PENDING = 0  # 待发送（含等待重试）
+    SENT = 1     # 已发送
+    FAILED = 2   # 超过最大重试次数
+
+    dedupe_key = models.CharField(max_length=64, unique=True)
+    title = models.CharField(max_length=200)
+    message = models.TextField()
+    status = models.PositiveSmallIntegerField(default=PENDING)
+    attempts = models.IntegerField(default=0)
+    next_attempt_at = models.DateTimeField()
+    created_at = models.DateTimeField()
+    sent_at = models.DateTimeField(null=True)
+    last_error = models.CharField(max_length=200, blank=True, default='')
+    # 已发送成功的渠道（逗号分隔），重试时只发送其余渠道
+    delivered_channels = models.CharField(max_length=200, blank=True, default='')
+
+    class Meta:
+        verbose_name = "notification_outbox"
+        verbose_name_plural = verbose_name
+        indexes = [
+            models.Index(fields=["status", "next_attempt_at"], name="outbox_status_next_attempt"),
+        ]
+
+    def __str__(self):
+        return f"{self.title} - {self.status}"
+
+
+class SchedulerLease(models.Model):
+    """定时任务的主节点租约，holder为当前持有者，expires_at之后其他进程可以接管"""
+    name = models.CharField(max_length=50, unique=True)
+    holder = models.CharField(max_length=100, blank=True, default='')
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        verbose_name = "scheduler_lease"
+        verbose_name_plural = verbose_name
+
+    def __str__(self):
+        return f"{self.name} - {self.holder}"
+
+
+class ScanJob(models.Model):
+    """
+    手动触发的扫描任务，由主节点的调度器执行
+    active在未完成时为True、完成后为NULL，唯一约束保证同一时间只有一个未完成的任务，重复触发合并到该任务
+    """
+    PENDING = 0    # 等待执行
+    RUNNING = 1    # 执行中
+    SUCCEEDED = 2  # 已完成
+    FAILED = 3     # 执行失败
+    STATUS_NAMES = {PENDING: 'pending', RUNNING: 'running', SUCCEEDED: 'succeeded', FAILED: 'failed'}
+
+    active = models.BooleanField(null=True, default=True, unique=True)
+    status = models.PositiveSmallIntegerField(default=PENDING)
+    created_at = models.DateTimeField()
+    started_at = models.DateTimeField(null=True)
+    finished_at = models.DateTimeField(null=True)
+    # 各分类的进度和耗时 {分类名: {"seconds": 耗时, "funds": 需通知的基金数}}
+    progress = models.JSONField(default=dict)
+    result = models.JSONField(null=True)
+    error = models.CharField(max_length=200, blank=True, default='')
+
+    class Meta:
+        verbose_name = "scan_job"
+        verbose_name_plural = verbose_name
+        indexes = [
+            models.Index(fields=["status", "created_at"], name="scan_job_status_created"),
+        ]
+
+    def __str__(self):
+        return f"{self.id} - {self.STATUS_NAMES.get(self.status)}"
@@ -0,0 +1,196 @@
+import json
+import logging
+import smtplib
+import threading
+import time
+import traceback
+from email.message import EmailMessage
+from typing import Dict, List, Tuple
+
+from django.conf import settings
+
+from app.common.http_client import http_client
+from app.common.resilience import LatencyTracker
+
+logger = logging.getLogger('app')
+
+PUSHPLUS_HEADERS = {
+    'Content-Type': 'application/json',
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+
+def plain_text(message: str) -> str:
+    """摘要使用pushplus的html换行，纯文本渠道换成\\n"""
+    return message.replace('<br>', '\n')
+
+
+class NotifyChannel:
+    """
+    通知渠道基类，子类实现_send
+    每个渠道有自己的超时时间和成功、失败次数及耗时统计
+    """
+    name = 'base'
+
+    def __init__(self, timeout: float):
+        self.timeout = timeout
+        self.success = 0
+        self.failure = 0
+        self.latency = LatencyTracker(size=1000)
+        self._lock = threading.Lock()
+
+    def send(self, title: str, message: str) -> Tuple[bool, float]:
+        """
+        发送一条消息，不抛异常
+        :return: (是否成功, 耗时秒数)
+        """
+        start = time.monotonic()
+        try:
+            ok = self._send(title, message)
+        except Exception as e:
+            logger.error("Channel %s send exception: %r, tb: %r", self.name, e, traceback.format_exc())
+            ok = False
+        return ok, time.monotonic() - start
+
+    def record(self, ok: bool, seconds: float):
+        with self._lock:
+            if ok:
+                self.success += 1
+            else:
+                self.failure += 1
+        if ok:
+            self.latency.add(seconds)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = {'success': self.success, 'failure': self.failure}
+        stats['latency_p50'] = self.latency.percentile(50, 1)
+        stats['latency_p99'] = self.latency.percentile(99, 1)
+        return stats
+
+    def _http_timeout(self):
+        return min(10, self.timeout), self.timeout
+
+    def _send(self, title: str, message: str) -> bool:
+        raise NotImplementedError
+
+
+# refer to https://www.pushplus.plus
+class PushplusChannel(NotifyChannel):
+    name = 'pushplus'
+
+    def __init__(self, token: str, timeout: float):
+        super().__init__(timeout)
+        self.token = token
+
+    def _send(self, title: str, message: str) -> bool:
+        body = {
+            "token": self.token,
+            "title": title,
+            "content": message
+        }
+        resp = http_client.post(settings.PUSHPLUS_URL, json=body, headers=PUSHPLUS_HEADERS, timeout=self._http_timeout())
+        if resp.status_code != 200:
+            logger.error("send message failed, http_code: %r", resp.status_code)
+            return False
+
+        resp_data = resp.json()
+        logger.info("send message %r, resp_data: %r", message, resp_data)
+        return resp_data.get('code') == 200
+
+
+class WebhookChannel(NotifyChannel):
+    """POST JSON {"title": 标题, "content": 内容} 到任意地址，2xx视为成功"""
+    name = 'webhook'
+
+    def __init__(self, url: str, timeout: float):
+        super().__init__(timeout)
+        self.url = url
+
+    def _send(self, title: str, message: str) -> bool:
+        resp = http_client.post(self.url, json={"title": title, "content": plain_text(message)},
+                                timeout=self._http_timeout())
+        if not 200 <= resp.status_code < 300:
+            logger.error("Webhook %r failed, http_code: %r", self.url, resp.status_code)
+            return False
+        return True
+
+
+class SmtpChannel(NotifyChannel):
+    name = 'smtp'
+
+    def __init__(self, host: str, port: int, sender: str, recipients: List[str], timeout: float,
+                 user: str = '', password: str = '', use_ssl: bool = False):
+        super().__init__(timeout)
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.recipients = recipients
+        self.user = user
+        self.password = password
+        self.use_ssl = use_ssl
+
+    def _send(self, title: str, message: str) -> bool:
+        mail = EmailMessage()
+        mail['Subject'] = title
+        mail['From'] = self.sender
+        mail['To'] = ', '.join(self.recipients)
+        mail.set_content(plain_text(message))
+
+        smtp_class = smtplib.SMTP_SSL if self.use_ssl else smtplib.SMTP
+        with smtp_class(self.host, self.port, timeout=self.timeout) as smtp:
+            if self.user:
+                smtp.login(self.user, self.password)
+            smtp.send_message(mail)
+        return True
+
+
+class FileChannel(NotifyChannel):
+    """每条消息追加一行JSON到本地文件，用于测试和本地调试"""
+    name = 'file'
+
+    def __init__(self, path: str, timeout: float):
+        super().__init__(timeout)
+        self.path = path
+        self._file_lock = threading.Lock()
+
+    def _send(self, title: str, message: str) -> bool:
+        line = json.dumps({"ts": time.time(), "title": title, "content": plain_text(message)}, ensure_ascii=False)
+        with self._file_lock, open(self.path, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+        return True
+
+
+def build_channels(cfg) -> List[NotifyChannel]:
+    """
+    按config.ini创建通知渠道
+    - [DEFAULT] token：pushplus
+    - [webhook] url
+    - [smtp] host、port、from、to（逗号分隔）、user、password、ssl
+    - [file] path
+    每个渠道可以用timeout覆盖默认超时NOTIFY_CHANNEL_TIMEOUT（秒）
+    """
+    default_timeout = settings.NOTIFY_CHANNEL_TIMEOUT
+    defaults = cfg.defaults()
+    channels = []
+    if defaults.get('token'):
+        channels.append(PushplusChannel(defaults['token'], float(defaults.get('timeout', default_timeout))))
+    if cfg.has_section('webhook'):
+        section = cfg['webhook']
+        channels.append(WebhookChannel(section['url'], section.getfloat('timeout', default_timeout)))
+    if cfg.has_section('smtp'):
+        section = cfg['smtp']
+        channels.append(SmtpChannel(
+            host=section['host'],
+            port=section.getint('port', 25),
+            sender=section['from'],
+            recipients=[to.strip() for to in section['to'].split(',') if to.strip()],
+            timeout=section.getfloat('timeout', default_timeout),
+            user=section.get('user', ''),
+            password=section.get('password', ''),
+            use_ssl=section.getboolean('ssl', False),
+        ))
+    if cfg.has_section('file'):
+        section = cfg['file']
+        channels.append(FileChannel(section['path'], section.getfloat('timeout', default_timeout)))
+    return channels
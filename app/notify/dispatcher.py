@@ -0,0 +1,217 @@
+import logging
+import queue
+import threading
+import time
+import traceback
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.db import DatabaseError, connection
+
+from app.common.leader import leader_lease
+from app.common.resilience import LatencyTracker, TokenBucket
+from app.models import NotificationOutbox
+from app.notify.notify import notify_handler
+from app.notify.outbox import due_notifications, mark_failed, mark_sent
+
+logger = logging.getLogger('app')
+
+_STOP = None  # 通知发送线程退出
+
+
+class NotifyDispatcher:
+    """
+    从NotificationOutbox异步发送通知，扫描周期写入outbox后调用wake即返回，不等待pushplus
+    - 轮询线程每NOTIFY_OUTBOX_POLL_SECONDS秒（或被wake唤醒时）取出到期的通知放入有界队列，队列满时等待（背压）
+    - NOTIFY_WORKERS个发送线程共用一个令牌桶，发送速率不超过pushplus的限制
+    - 发送失败按指数退避重试，超过最大次数标记为失败并记录错误
+    - 发送成功后才标记为已发送，进程重启后从outbox继续发送未完成的通知
+    - shutdown时不再取新的通知，等待已入队的通知发送完
+    - 记录每条通知从写入outbox到发送成功的耗时
+    - 多进程部署时只有主节点（leader_lease）轮询outbox，避免重复发送
+    """
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls, *args, **kwargs):
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = super(NotifyDispatcher, cls).__new__(cls, *args, **kwargs)
+                cls._instance._queue = None
+                cls._instance._threads = []
+                cls._instance._poller = None
+                cls._instance._stop = threading.Event()
+                cls._instance._wakeup = threading.Event()
+                cls._instance._in_flight = set()
+                cls._instance._bucket = None
+                cls._instance._counts = {'sent': 0, 'retried': 0, 'failed': 0}
+                cls._instance.latency = LatencyTracker(size=1000)
+        return cls._instance
+
+    def start(self):
+        """启动轮询和发送线程，shutdown之后调用可重新开始发送"""
+        with self._lock:
+            if self._poller is not None:
+                return
+            self._stop = threading.Event()
+            self._in_flight = set()
+            self._queue = queue.Queue(maxsize=settings.NOTIFY_QUEUE_SIZE)
+            self._bucket = TokenBucket(settings.NOTIFY_RATE_PER_MINUTE / 60, settings.NOTIFY_RATE_BURST)
+            self._threads = [
+                threading.Thread(target=self._work, args=(self._queue,), name=f'notify_worker_{i}', daemon=True)
+                for i in range(max(settings.NOTIFY_WORKERS, 1))
+            ]
+            self._poller = threading.Thread(target=self._poll, name='notify_outbox_poller', daemon=True)
+            for thread in self._threads + [self._poller]:
+                thread.start()
+
+    def wake(self):
+        """outbox有新通知，立即轮询"""
+        self.start()
+        self._wakeup.set()
+
+    def _poll(self):
+        stop = self._stop
+        try:
+            while not stop.is_set():
+                self._wakeup.clear()
+                try:
+                    if leader_lease.is_leader():
+                        self._enqueue_due(stop)
+                except Exception as e:
+                    logger.error("Poll notification outbox failed: %r, tb: %r", e, traceback.format_exc())
+                    connection.close()
+                self._wakeup.wait(settings.NOTIFY_OUTBOX_POLL_SECONDS)
+        finally:
+            connection.close()
+
+    def _enqueue_due(self, stop: threading.Event):
+        with self._lock:
+            in_flight = set(self._in_flight)
+        for outbox in due_notifications(settings.NOTIFY_QUEUE_SIZE, in_flight):
+            with self._lock:
+                self._in_flight.add(outbox.id)
+            # 队列满时在这里等待，扫描周期不受影响
+            while not stop.is_set():
+                try:
+                    self._queue.put(outbox, timeout=1)
+                    break
+                except queue.Full:
+                    continue
+            else:
+                with self._lock:
+                    self._in_flight.discard(outbox.id)
+                return
+
+    def _work(self, messages: queue.Queue):
+        try:
+            while True:
+                outbox = messages.get()
+                try:
+                    if outbox is _STOP:
+                        return
+                    self._deliver(outbox)
+                finally:
+                    messages.task_done()
+        finally:
+            connection.close()
+
+    def _deliver(self, outbox: NotificationOutbox):
+        try:
+            self._bucket.acquire()
+            delivered = set(filter(None, outbox.delivered_channels.split(',')))
+            try:
+                # 重试时跳过已经发送成功的渠道
+                results = notify_handler.deliver(outbox.message, outbox.title, exclude=delivered)
+                failed = sorted(name for name, ok in results.items() if not ok)
+                delivered.update(name for name, ok in results.items() if ok)
+                ok, error = not failed, f"channels failed: {', '.join(failed)}"
+            except Exception as e:
+                ok, error = False, repr(e)
+            outbox.delivered_channels = ','.join(sorted(delivered))
+
+            if ok:
+                self._save_result(mark_sent, outbox)
+                latency = (outbox.sent_at - outbox.created_at).total_seconds()
+                self.latency.add(latency)
+                self._count('sent')
+                logger.info("Notification %r delivered in %.3fs", outbox.title, latency)
+            else:
+                self._save_result(mark_failed, outbox, error)
+                self._count('failed' if outbox.status == NotificationOutbox.FAILED else 'retried')
+        except Exception as e:
+            logger.error("Dispatch notification %r failed: %r, tb: %r", outbox.title, e, traceback.format_exc())
+        finally:
+            with self._lock:
+                self._in_flight.discard(outbox.id)
+
+    @staticmethod
+    def _save_result(mark, outbox: NotificationOutbox, *args):
+        """
+        记录发送结果，数据库暂时不可用时重试几次，避免已发送的通知因为状态没有保存而重复发送
+        """
+        for attempt in range(3):
+            try:
+                connection.close_if_unusable_or_obsolete()
+                return mark(outbox, *args)
+            except DatabaseError as e:
+                if attempt == 2:
+                    raise
+                logger.warning("Save notification %r result failed: %r, retry", outbox.title, e)
+                connection.close()
+                time.sleep(0.1 * (attempt + 1))
+
+    def _count(self, key: str):
+        with self._lock:
+            self._counts[key] += 1
+
+    def flush(self, timeout: float = 30) -> bool:
+        """
+        等待到期的通知发送完（压测、测试用）
+        :return: 是否在超时前发送完
+        """
+        self.wake()
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._lock:
+                idle = not self._in_flight
+            if idle and not due_notifications(1):
+                return True
+            self._wakeup.set()
+            time.sleep(0.05)
+        return False
+
+    def shutdown(self, timeout: Optional[float] = None):
+        """
+        停止轮询，等待已入队的通知发送完；未发送的通知留在outbox中，下次启动后继续发送
+        :param timeout: 最长等待时间（秒），默认NOTIFY_DRAIN_TIMEOUT
+        """
+        timeout = settings.NOTIFY_DRAIN_TIMEOUT if timeout is None else timeout
+        with self._lock:
+            poller, threads, messages = self._poller, self._threads, self._queue
+            self._poller, self._threads = None, []
+        if poller is None:
+            return
+        self._stop.set()
+        self._wakeup.set()
+        deadline = time.monotonic() + timeout
+        poller.join(max(deadline - time.monotonic(), 0))
+        # 退出标记排在已入队的通知之后；队列满时put会阻塞，放在后台放入
+        threading.Thread(target=lambda: [messages.put(_STOP) for _ in threads], daemon=True).start()
+        for thread in threads:
+            thread.join(max(deadline - time.monotonic(), 0))
+        if any(thread.is_alive() for thread in threads):
+            logger.error("Notify dispatcher drain timed out, %d notifications left in outbox", messages.qsize())
+        else:
+            logger.info("Notify dispatcher stopped")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._counts)
+            stats['in_flight'] = len(self._in_flight)
+        stats['latency_p50'] = self.latency.percentile(50, 1)
+        stats['latency_p99'] = self.latency.percentile(99, 1)
+        return stats
+
+
+notify_dispatcher = NotifyDispatcher()
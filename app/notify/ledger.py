@@ -0,0 +1,98 @@
+import logging
+import threading
+from typing import Iterable, Set
+
+from django.db import transaction
+from django.db.models import F
+
+from app.models import FundNotification
+from app.query.trading_time import china_today
+
+logger = logging.getLogger('app')
+
+
+def get_notified_today(fund_ids: Iterable[str]) -> Set[str]:
+    """
+    一次查询得到今天已通知过的基金
+    :param fund_ids: 待检查的基金代码
+    :return: 其中今天已通知过的基金代码
+    """
+    fund_ids = set(fund_ids)
+    if not fund_ids:
+        return set()
+    return set(
+        FundNotification.objects
+        .filter(notify_date=china_today(), fund_id__in=fund_ids)
+        .values_list('fund_id', flat=True)
+    )
+
+
+def record_notifications(fund_ids: Iterable[str]):
+    """
+    两条语句批量记录今天的通知：先插入不存在的记录（已存在时忽略），再把所有记录的notify_count加1
+    """
+    fund_ids = set(fund_ids)
+    if not fund_ids:
+        return
+    today = china_today()
+    # 在扫描周期的事务中执行时不另建保存点
+    with transaction.atomic(savepoint=False):
+        FundNotification.objects.bulk_create(
+            [FundNotification(fund_id=fund_id, notify_date=today, notify_count=0) for fund_id in fund_ids],
+            ignore_conflicts=True,
+        )
+        FundNotification.objects.filter(notify_date=today, fund_id__in=fund_ids).update(
+            notify_count=F('notify_count') + 1)
+
+
+class NotificationLedger:
+    """
+    进程内的当日通知记录
+    - 每天第一次使用时从FundNotification加载当天已通知的基金，之后判断是否已通知不再查询数据库
+    - 新通知先写数据库再写内存
+    - 按北京时间日期自动切换到新的一天
+    """
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls, *args, **kwargs):
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = super(NotificationLedger, cls).__new__(cls, *args, **kwargs)
+                cls._instance._date = None
+                cls._instance._fund_ids = set()
+        return cls._instance
+
+    def _ensure_today(self):
+        today = china_today()
+        if self._date != today:
+            self._fund_ids = set(
+                FundNotification.objects.filter(notify_date=today).values_list('fund_id', flat=True)
+            )
+            self._date = today
+            logger.info("Notification ledger warmed for %s: %d funds", today, len(self._fund_ids))
+
+    def notified_today(self, fund_ids: Iterable[str]) -> Set[str]:
+        """返回其中今天已通知过的基金"""
+        with self._lock:
+            self._ensure_today()
+            return self._fund_ids.intersection(fund_ids)
+
+    def record(self, fund_ids: Iterable[str]):
+        """记录今天的新通知"""
+        fund_ids = set(fund_ids)
+        if not fund_ids:
+            return
+        with self._lock:
+            self._ensure_today()
+            record_notifications(fund_ids)
+            self._fund_ids |= fund_ids
+
+    def reset(self):
+        """丢弃内存记录，下次使用时重新从数据库加载"""
+        with self._lock:
+            self._date = None
+            self._fund_ids = set()
+
+
+notification_ledger = NotificationLedger()
@@ -1,13 +1,31 @@
 import configparser
 import logging
 import os
-import requests
 import threading
-import traceback
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from typing import Dict, Iterable, List, Tuple
+from django.utils.functional import SimpleLazyObject
+from app.common.metrics import NOTIFY_SECONDS
+from app.notify.channels import NotifyChannel, build_channels
 
 logger = logging.getLogger('app')
 
-# refer to https://www.pushplus.plus
+# 摘要中各分类的显示名称，按此顺序排列
+CATEGORY_TITLES = {
+    'stock_lof': '股票LOF',
+    'index_lof': '指数LOF',
+    'hk_qdii': '港股QDII',
+    'us_qdii': '美股QDII',
+    'commodity_qdii': '商品QDII',
+}
+DIGEST_SPLIT = 'split'        # 超长时拆成多条消息
+DIGEST_TRUNCATE = 'truncate'  # 超长时只发一条，截断多余的基金
+
+# 各渠道并发发送，单个渠道超时不影响其他渠道
+_channel_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='notify_channel')
+
+
 class NotifyHandler:
     _instance = None
     _lock = threading.Lock()
@@ -19,10 +37,10 @@ class NotifyHandler:
         return cls._instance
 
     def __init__(self):
-        self.token = None
-        self.init_token()
+        self.channels: List[NotifyChannel] = []
+        self.init_channels()
 
-    def init_token(self):
+    def init_channels(self):
         config_file='/config.ini'
         if not os.path.exists(config_file):
             raise FileNotFoundError(f'config.ini not found')
@@ -31,33 +49,95 @@ class NotifyHandler:
         cfg.read(config_file)
 
         try:
-            self.token = cfg['DEFAULT']['token']
-        except KeyError as e:
+            self.channels = build_channels(cfg)
+        except (KeyError, ValueError) as e:
+            raise ValueError(f'invalid notify channel in config.ini: {e!r}')
+        if not self.channels:
             raise ValueError('token not found in config.ini')
 
+    def deliver(self, message, title, exclude: Iterable[str] = ()) -> Dict[str, bool]:
+        """
+        并发发送到所有渠道（exclude中的渠道除外），每个渠道最多等待自己的超时时间
+        :return: {渠道名: 是否成功}，超时视为失败
+        """
+        exclude = set(exclude)
+        start = time.monotonic()
+        futures = [(channel, _channel_executor.submit(channel.send, title, message))
+                   for channel in self.channels if channel.name not in exclude]
+        results = {}
+        for channel, future in futures:
+            try:
+                ok, seconds = future.result(timeout=max(start + channel.timeout - time.monotonic(), 0))
+            except FuturesTimeoutError:
+                logger.error("Channel %s timed out after %.1fs", channel.name, channel.timeout)
+                ok, seconds = False, channel.timeout
+            channel.record(ok, seconds)
+            NOTIFY_SECONDS.labels(channel.name, 'success' if ok else 'failure').observe(seconds)
+            results[channel.name] = ok
+        return results
 
-    def send_message(self, message, title):
-        url = 'https://www.pushplus.plus/send'
-        headers = {
-            'Content-Type': 'application/json',
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        body = {
-            "token": self.token,
-            "title": title,
-            "content": message
-		}
-        try:
-            resp = requests.post(url, json=body, headers=headers, timeout=(10,30))
-            if resp.status_code != 200:
-                logger.error("send message failed, http_code: %r", resp.status_code)
-                return
+    def send_message(self, message, title) -> bool:
+        """发送到所有渠道，全部成功时返回True"""
+        return all(self.deliver(message, title).values())
+
+    def channel_stats(self) -> Dict[str, Dict]:
+        """各渠道的成功、失败次数和耗时"""
+        return {channel.name: channel.stats() for channel in self.channels}
+
+
+# 第一次发送时才读取/config.ini，导入本模块不要求配置文件存在
+notify_handler = SimpleLazyObject(NotifyHandler)
+
+
+def build_digest(alerts: Dict[str, List[Tuple[str, str]]], max_chars: int,
+                 split_policy: str = DIGEST_SPLIT) -> List[Tuple[str, str]]:
+    """
+    把一个扫描周期的所有提醒合并成摘要，按分类分组
+    :param alerts: {分类名: [(fund_id, 提醒内容)]}
+    :param max_chars: 单条消息内容的最大长度（单行超长时该行单独成一条）
+    :param split_policy: DIGEST_SPLIT 超长时拆成多条；DIGEST_TRUNCATE 只发一条，末尾注明省略的数量
+    :return: [(标题, 内容)]，没有提醒时为空列表
+    """
+    order = list(CATEGORY_TITLES)
+    categories = sorted((name for name in alerts if alerts[name]),
+                        key=lambda name: order.index(name) if name in order else len(order))
+    total = sum(len(alerts[name]) for name in categories)
+    if not total:
+        return []
 
-            resp_data = resp.json()
-            resp_code = resp_data.get('code')
-            logging.info("send message %r, resp_data: %r", message, resp_data)
-        except Exception as e:
-            logging.error("send message exception: %r, tb: %r", e, traceback.format_exc())
+    separator = '<br>'
+    truncate = split_policy == DIGEST_TRUNCATE
+    omitted_note = "……另有{}只基金未列出"
+    # 截断时为末尾的说明预留长度
+    limit = max_chars - len(separator + omitted_note.format(total)) if truncate else max_chars
 
+    entries = [(f"【{CATEGORY_TITLES.get(name, name)}】", f"{fund_id} {message}")
+               for name in categories for fund_id, message in alerts[name]]
+    parts = []
+    lines, length, current_header = [], 0, None
+    listed = 0
+    for header, line in entries:
+        # 每条消息中每个分类先写分类标题
+        added = len(line) + len(separator)
+        if header != current_header:
+            added += len(header) + len(separator)
+        if lines and length + added > limit:
+            if truncate:
+                break
+            parts.append(lines)
+            lines, length, current_header = [], 0, None
+        if header != current_header:
+            lines.append(header)
+            length += len(header) + len(separator)
+            current_header = header
+        lines.append(line)
+        length += len(line) + len(separator)
+        listed += 1
+    parts.append(lines)
+    if listed < total:
+        parts[-1].append(omitted_note.format(total - listed))
 
-notify_handler = NotifyHandler()
+    title = f"基金提醒 {total}只"
+    if len(parts) == 1:
+        return [(title, separator.join(parts[0]))]
+    return [(f"{title} ({i}/{len(parts)})", separator.join(part)) for i, part in enumerate(parts, 1)]
@@ -0,0 +1,68 @@
+import hashlib
+import logging
+from datetime import timedelta
+from typing import Iterable, List, Tuple
+
+from django.conf import settings
+from django.utils import timezone
+
+from app.models import NotificationOutbox
+from app.query.trading_time import china_today
+
+logger = logging.getLogger('app')
+
+
+def dedupe_key(title: str, message: str) -> str:
+    """同一天内标题和内容都相同的通知视为同一条"""
+    return hashlib.sha256(f"{china_today()}\n{title}\n{message}".encode('utf-8')).hexdigest()
+
+
+def enqueue_notifications(messages: Iterable[Tuple[str, str]]):
+    """
+    一条语句写入待发送的通知，已存在的通知（dedupe_key相同）忽略
+    调用方负责与通知记录放在同一个事务中
+    :param messages: [(标题, 内容)]
+    """
+    now = timezone.now()
+    objs = [
+        NotificationOutbox(dedupe_key=dedupe_key(title, message), title=title[:200], message=message,
+                           next_attempt_at=now, created_at=now)
+        for title, message in messages
+    ]
+    if objs:
+        NotificationOutbox.objects.bulk_create(objs, ignore_conflicts=True)
+
+
+def due_notifications(limit: int, exclude_ids: Iterable[int] = ()) -> List[NotificationOutbox]:
+    """按写入顺序取到期的待发送通知"""
+    return list(
+        NotificationOutbox.objects
+        .filter(status=NotificationOutbox.PENDING, next_attempt_at__lte=timezone.now())
+        .exclude(id__in=list(exclude_ids))
+        .order_by('next_attempt_at', 'id')[:limit]
+    )
+
+
+def mark_sent(outbox: NotificationOutbox):
+    outbox.status = NotificationOutbox.SENT
+    outbox.attempts += 1
+    outbox.sent_at = timezone.now()
+    outbox.last_error = ''
+    outbox.save(update_fields=['status', 'attempts', 'sent_at', 'last_error', 'delivered_channels'])
+
+
+def mark_failed(outbox: NotificationOutbox, error: str):
+    """
+    记录一次发送失败，按指数退避安排重试，超过NOTIFY_MAX_ATTEMPTS次后不再重试
+    """
+    outbox.attempts += 1
+    outbox.last_error = error[:200]
+    if outbox.attempts >= settings.NOTIFY_MAX_ATTEMPTS:
+        outbox.status = NotificationOutbox.FAILED
+        logger.error("Give up notification %r after %d attempts: %s", outbox.title, outbox.attempts, error)
+    else:
+        backoff = min(settings.NOTIFY_RETRY_MAX_SECONDS, settings.NOTIFY_RETRY_BASE_SECONDS * 2 ** (outbox.attempts - 1))
+        outbox.next_attempt_at = timezone.now() + timedelta(seconds=backoff)
+        logger.warning("Notification %r failed (attempt %d), retry in %ds: %s",
+                       outbox.title, outbox.attempts, backoff, error)
+    outbox.save(update_fields=['status', 'attempts', 'next_attempt_at', 'last_error', 'delivered_channels'])
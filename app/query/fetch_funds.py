@@ -0,0 +1,47 @@
+import contextvars
+import logging
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional, Tuple
+
+from django.conf import settings
+
+logger = logging.getLogger('app')
+
+# 分类名 -> (查询函数, 处理函数)
+CategorySpec = Tuple[Callable[[], Optional[Dict]], Callable[[Dict, str], List[Tuple[str, float, str, str]]]]
+
+
+def fetch_and_process(categories: Dict[str, CategorySpec],
+                      on_done: Optional[Callable[[str, float, int], None]] = None
+                      ) -> Dict[str, List[Tuple[str, float, str, str]]]:
+    """
+    并发查询所有分类的数据，每个分类的数据一返回就立即处理（按分类做增量判断）
+    :param categories: {分类名: (查询函数, 处理函数)}
+    :param on_done: 每个分类处理完后调用 on_done(分类名, 从开始到处理完的秒数, 需通知的基金数)
+    :return: {分类名: 需通知的基金列表}，查询或处理失败的分类为空列表
+    """
+    result = {name: [] for name in categories}
+    if not categories:
+        return result
+
+    max_workers = min(len(categories), settings.FETCH_MAX_WORKERS)
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='fund_fetch') as executor:
+        # 复制上下文，使查询线程能读取到周期截止时间
+        futures = {executor.submit(contextvars.copy_context().run, query): name
+                   for name, (query, _) in categories.items()}
+        for future in as_completed(futures):
+            name = futures[future]
+            _, process = categories[name]
+            try:
+                data = future.result()
+                if data:
+                    result[name] = process(data, name)
+            except Exception as e:
+                logger.error("Fetch category %r failed: %r, tb: %r", name, e, traceback.format_exc())
+            if on_done is not None:
+                on_done(name, time.monotonic() - start, len(result[name]))
+
+    return result
@@ -0,0 +1,90 @@
+import logging
+import threading
+from typing import Dict, Iterable, Optional, Tuple
+
+logger = logging.getLogger('app')
+
+# 未命中标记，区分“无缓存结果”和“缓存结果为不通知(None)”
+MISS = object()
+
+
+def row_fingerprint(item: Dict, is_holding: bool) -> int:
+    """计算一行数据中影响通知判断的字段的指纹"""
+    return hash((
+        item.get('discount_rt'),
+        item.get('apply_status'),
+        item.get('redeem_status'),
+        is_holding,
+    ))
+
+
+class FingerprintIndex:
+    """
+    单个分类的指纹索引：fund_id -> (指纹, 上次判断结果)
+    每个周期只重新处理指纹变化的行，未变化的行直接复用上次的判断结果
+    临近收盘状态切换或基金索引（持仓、赎回费、规则）版本变化时清空索引，强制全量重新判断
+    处理一个周期期间需持有lock，避免定时任务和/test/接口同时处理同一分类
+    """
+    def __init__(self, category: str):
+        self.category = category
+        self.lock = threading.Lock()
+        self._entries = {}
+        self._near_close = None
+        self._version = None
+        self.changed = 0
+        self.total = 0
+
+    def begin_cycle(self, near_close: bool, version: Optional[int] = None):
+        if near_close != self._near_close or version != self._version:
+            if self._near_close is not None:
+                logger.info("分类 %s 临近收盘状态或基金索引变化，全量重新判断", self.category)
+            self._entries.clear()
+            self._near_close = near_close
+            self._version = version
+        self.changed = 0
+        self.total = 0
+
+    def lookup(self, fund_id: str, fingerprint: int):
+        """
+        :return: 指纹未变化时返回上次的结果(可能为None)，否则返回MISS
+        """
+        self.total += 1
+        entry = self._entries.get(fund_id)
+        if entry is not None and entry[0] == fingerprint:
+            return entry[1]
+        self.changed += 1
+        return MISS
+
+    def store(self, fund_id: str, fingerprint: int, result: Optional[Tuple]):
+        self._entries[fund_id] = (fingerprint, result)
+
+    def end_cycle(self, seen_ids: Iterable[str]):
+        """移除本周期数据中已不存在的基金"""
+        seen = set(seen_ids)
+        for fund_id in [k for k in self._entries if k not in seen]:
+            del self._entries[fund_id]
+
+    def invalidate(self):
+        with self.lock:
+            self._entries.clear()
+            self._near_close = None
+            self._version = None
+
+
+_indexes: Dict[str, FingerprintIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_fingerprint_index(category: str) -> FingerprintIndex:
+    with _indexes_lock:
+        index = _indexes.get(category)
+        if index is None:
+            index = _indexes[category] = FingerprintIndex(category)
+        return index
+
+
+def invalidate_fingerprint_indexes():
+    """判断条件或持仓变化时调用，下个周期全量重新判断"""
+    with _indexes_lock:
+        for index in _indexes.values():
+            index.invalidate()
@@ -0,0 +1,151 @@
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, FrozenSet, NamedTuple, Optional
+
+from django.conf import settings
+
+from app.query.notify_rules import CompiledRules, compile_rules
+
+logger = logging.getLogger('app')
+
+
+class FundInfo(NamedTuple):
+    """单只基金的配置"""
+    fund_id: str
+    category: Optional[str]
+    is_holding: bool
+    redemption_fee: Optional[float]
+    required_discount: float
+
+
+class FundIndexSnapshot(NamedTuple):
+    """
+    基金索引的一个不可变版本：基金配置 + 按它编译的通知规则
+    扫描周期开始时取一次快照，整个周期使用同一版本
+    """
+    version: int
+    funds: Dict[str, FundInfo]
+    holding_funds: FrozenSet[str]
+    rules: CompiledRules
+
+    def redemption_fee(self, fund_id: str) -> Optional[float]:
+        fund = self.funds.get(fund_id)
+        return fund.redemption_fee if fund else None
+
+
+def build_snapshot(funds_config: Dict, rules_config: Dict, version: int) -> FundIndexSnapshot:
+    """
+    根据基金配置和规则配置构建索引
+    :param funds_config: 基金配置，格式见funds.json
+    :param rules_config: 规则配置，格式见notify_rules.json
+    """
+    redemption_fees = {}
+    for fund_id, item in funds_config.get('funds', {}).items():
+        if item.get('redemption_fee') is not None:
+            redemption_fees[fund_id] = float(item['redemption_fee'])
+    rules = compile_rules(rules_config, redemption_fees)
+
+    funds = {}
+    for fund_id, item in funds_config.get('funds', {}).items():
+        holding = item.get('holding', False)
+        if not isinstance(holding, bool):
+            raise ValueError(f"fund {fund_id!r}: holding must be true/false")
+        funds[fund_id] = FundInfo(
+            fund_id=fund_id,
+            category=item.get('category'),
+            is_holding=holding,
+            redemption_fee=redemption_fees.get(fund_id),
+            required_discount=rules.required_discount(fund_id),
+        )
+
+    holding_funds = frozenset(fund_id for fund_id, fund in funds.items() if fund.is_holding)
+    return FundIndexSnapshot(version, funds, holding_funds, rules)
+
+
+def _read_json(path: str) -> Dict:
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+class FundIndex:
+    """
+    持仓、赎回费和通知规则的索引（FUND_INDEX_FILE、NOTIFY_RULES_FILE）
+    - 后台线程每FUND_INDEX_RELOAD_SECONDS秒检查文件修改时间，变化时重新构建
+    - 新索引构建完成后整体替换引用，扫描周期不会读到构建了一半的索引，也不会等待重新加载
+    - 配置有误时保留旧索引
+    """
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls, *args, **kwargs):
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = super(FundIndex, cls).__new__(cls, *args, **kwargs)
+                cls._instance._snapshot = None
+                cls._instance._mtimes = None
+                cls._instance._watcher = None
+        return cls._instance
+
+    def snapshot(self) -> FundIndexSnapshot:
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._lock:
+                if self._snapshot is None:
+                    self._load()
+                    self._start_watcher()
+                snapshot = self._snapshot
+        return snapshot
+
+    def reload(self) -> bool:
+        """配置文件有变化时重新加载，返回是否替换了索引"""
+        with self._lock:
+            mtimes = self._current_mtimes()
+            if mtimes == self._mtimes:
+                return False
+            # 加载失败时也记录修改时间，等文件再次修改后重试
+            self._mtimes = mtimes
+            try:
+                self._load()
+            except Exception as e:
+                logger.error("Reload fund index failed, keep version %d: %r",
+                             self._snapshot.version if self._snapshot else 0, e)
+                return False
+            return True
+
+    def _paths(self):
+        return settings.FUND_INDEX_FILE, settings.NOTIFY_RULES_FILE
+
+    def _current_mtimes(self):
+        return tuple(os.stat(path).st_mtime_ns if os.path.exists(path) else None for path in self._paths())
+
+    def _load(self):
+        mtimes = self._current_mtimes()
+        funds_path, rules_path = self._paths()
+        version = self._snapshot.version + 1 if self._snapshot else 1
+        snapshot = build_snapshot(_read_json(funds_path), _read_json(rules_path), version)
+        # 整体替换引用
+        self._snapshot = snapshot
+        self._mtimes = mtimes
+        logger.info("Fund index v%d loaded: %d funds, %d holdings, rules: %s", version, len(snapshot.funds),
+                    len(snapshot.holding_funds), ', '.join(rule.name for rule in snapshot.rules.rules))
+
+    def _start_watcher(self):
+        interval = settings.FUND_INDEX_RELOAD_SECONDS
+        if interval <= 0 or self._watcher is not None:
+            return
+        self._watcher = threading.Thread(target=self._watch, args=(interval,), name='fund_index_watcher', daemon=True)
+        self._watcher.start()
+
+    def _watch(self, interval: float):
+        while True:
+            time.sleep(interval)
+            try:
+                self.reload()
+            except Exception as e:
+                logger.error("Fund index watcher error: %r", e)
+
+
+fund_index = FundIndex()
@@ -0,0 +1,255 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Callable, Collection, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from django.conf import settings
+from django.utils import timezone
+
+logger = logging.getLogger('app')
+
+
+class PremiumRow(NamedTuple):
+    """一只基金的最新数据，fragment为预先序列化好的JSON"""
+    fund_id: str
+    category: str
+    premium: float
+    holding: bool
+    fragment: str
+
+
+class CategoryView(NamedTuple):
+    updated_at: str
+    rows: List[PremiumRow]
+    body: str  # 未过滤时的rows数组
+
+
+class PremiumView(NamedTuple):
+    """
+    最近一个扫描周期所有分类的数据，发布后不再修改，整体替换引用
+    etag只由数据决定，数据不变时客户端可以继续使用缓存
+    alerts为本周期新发出的提醒，fragment为提醒内容
+    """
+    etag: str
+    updated_at: Optional[str]
+    categories: Dict[str, CategoryView]
+    funds: Dict[str, PremiumRow]
+    alerts: List[PremiumRow]
+
+
+EMPTY_VIEW = PremiumView(etag='empty', updated_at=None, categories={}, funds={}, alerts=[])
+
+
+def _entry(row, category: str) -> Dict:
+    return {
+        'fund_id': row.fund_id,
+        'fund_name': row.fund_name,
+        'category': category,
+        'premium': row.premium_rate,
+        'apply_status': row.apply_status,
+        'redeem_status': row.redeem_status,
+        'holding': row.is_holding,
+    }
+
+
+def _premium_row(entry: Dict) -> PremiumRow:
+    return PremiumRow(entry['fund_id'], entry['category'], entry['premium'], entry['holding'],
+                      json.dumps(entry, ensure_ascii=False))
+
+
+def row_filter(holding: bool = False, min_abs_premium: Optional[float] = None,
+               categories: Optional[Collection[str]] = None,
+               fund_ids: Optional[Collection[str]] = None) -> Optional[Callable[[PremiumRow], bool]]:
+    """
+    接口的过滤条件，没有任何条件时返回None
+    :param holding: 只保留持有的基金
+    :param min_abs_premium: 只保留|溢价率|>=该值的基金
+    """
+    if not holding and min_abs_premium is None and not categories and not fund_ids:
+        return None
+
+    def match(row: PremiumRow) -> bool:
+        return ((not holding or row.holding)
+                and (min_abs_premium is None or abs(row.premium) >= min_abs_premium)
+                and (not categories or row.category in categories)
+                and (not fund_ids or row.fund_id in fund_ids))
+    return match
+
+
+class LatestPremiumStore:
+    """
+    各分类最新解析出的数据，供只读接口直接从内存返回，不查询集思录和数据库
+    - 扫描周期中process_rows按分类更新（只有变化的行重新序列化），周期结束时publish生成新的PremiumView
+    - 执行扫描的进程把数据写入LATEST_PREMIUM_FILE，其他进程（gunicorn的其他worker、独立扫描进程时的web进程）
+      最多每LATEST_PREMIUM_RELOAD_SECONDS秒检查一次文件修改时间，变化时重新加载
+    """
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls, *args, **kwargs):
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = super(LatestPremiumStore, cls).__new__(cls, *args, **kwargs)
+                cls._instance._listeners = []
+                cls._instance._reset()
+        return cls._instance
+
+    def _reset(self):
+        self._rows: Dict[str, Dict[str, PremiumRow]] = {}   # {分类: {fund_id: 行}}，保持集思录返回的顺序
+        self._updated_at: Dict[str, str] = {}
+        self._dirty = set()
+        self._view = EMPTY_VIEW
+        self._file_mtime = None
+        self._checked_at = 0.0
+
+    def reset(self):
+        with self._lock:
+            self._reset()
+
+    def add_listener(self, listener: Callable[[PremiumView, PremiumView], None]):
+        """数据更新（本进程发布或从文件加载）后调用 listener(旧数据, 新数据)"""
+        self._listeners.append(listener)
+
+    def _notify(self, previous: PremiumView, view: PremiumView):
+        for listener in list(self._listeners):
+            try:
+                listener(previous, view)
+            except Exception as e:
+                logger.error("Latest premium listener failed: %r", e)
+
+    def update(self, category: str, parsed: Iterable, present_ids: Optional[Iterable[str]] = None,
+               removed_ids: Iterable[str] = ()):
+        """
+        更新一个分类
+        :param parsed: 本周期重新解析的行（FundRow）
+        :param present_ids: 本周期返回的所有fund_id（按返回顺序），未重新解析的行沿用上个周期的数据；
+                            为None时parsed即为全部数据
+        :param removed_ids: 本周期解析失败的fund_id
+        """
+        changed = {row.fund_id: _premium_row(_entry(row, category)) for row in parsed}
+        with self._lock:
+            previous = self._rows.get(category, {})
+            order = changed if present_ids is None else present_ids
+            removed = set(removed_ids)
+            rows = {}
+            for fund_id in order:
+                row = changed.get(fund_id) or previous.get(fund_id)
+                if row is not None and fund_id not in removed:
+                    rows[fund_id] = row
+            self._rows[category] = rows
+            self._updated_at[category] = timezone.now().isoformat()
+            self._dirty.add(category)
+
+    def publish(self, alerts: Iterable[Tuple[str, Tuple[str, float, str, str]]] = ()):
+        """
+        扫描周期结束时调用：生成新的PremiumView，并写入LATEST_PREMIUM_FILE
+        :param alerts: 本周期新发出的提醒 [(分类名, (fund_id, 溢价率, 申购状态, 赎回状态))]
+        """
+        with self._lock:
+            alerts = [self._alert_row(category, fund) for category, fund in alerts]
+            if not self._dirty and not alerts:
+                return
+            self._dirty.clear()
+            previous = self._view
+            view = self._view = self._build_view(self._rows, self._updated_at, alerts)
+        # 直接拼接已序列化的行
+        categories = ','.join(
+            f'{json.dumps(name)}:{{"updated_at":{json.dumps(category.updated_at)},"rows":{category.body}}}'
+            for name, category in view.categories.items())
+        self._write_file(f'{{"updated_at":{json.dumps(view.updated_at)},"categories":{{{categories}}},'
+                         f'"alerts":[{",".join(row.fragment for row in view.alerts)}]}}')
+        self._notify(previous, view)
+
+    def _alert_row(self, category: str, fund: Tuple[str, float, str, str]) -> PremiumRow:
+        fund_id, premium, apply_status, redeem_status = fund
+        row = self._rows.get(category, {}).get(fund_id)
+        return _premium_row({
+            'fund_id': fund_id,
+            'category': category,
+            'premium': premium,
+            'apply_status': apply_status,
+            'redeem_status': redeem_status,
+            'holding': row.holding if row else False,
+        })
+
+    @staticmethod
+    def _build_view(rows: Dict[str, Dict[str, PremiumRow]], updated_at: Dict[str, str],
+                    alerts: List[PremiumRow]) -> PremiumView:
+        categories = {}
+        funds = {}
+        digest = hashlib.sha1()
+        for name in sorted(rows):
+            body = '[' + ','.join(row.fragment for row in rows[name].values()) + ']'
+            categories[name] = CategoryView(updated_at[name], list(rows[name].values()), body)
+            funds.update(rows[name])
+            digest.update(name.encode() + body.encode('utf-8'))
+        return PremiumView(
+            etag=digest.hexdigest()[:16],
+            updated_at=max(updated_at.values()) if updated_at else None,
+            categories=categories,
+            funds=funds,
+            alerts=alerts,
+        )
+
+    def _write_file(self, content: str):
+        path = settings.LATEST_PREMIUM_FILE
+        if not path:
+            return
+        try:
+            directory = os.path.dirname(path) or '.'
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.latest_premium')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(content)
+            os.chmod(tmp_path, 0o644)
+            # 原子替换，读取的进程不会读到写了一半的文件
+            os.replace(tmp_path, path)
+            with self._lock:
+                self._file_mtime = os.stat(path).st_mtime_ns
+        except OSError as e:
+            logger.error("Write latest premium file %r failed: %r", path, e)
+
+    def _reload_file(self, force: bool = False):
+        path = settings.LATEST_PREMIUM_FILE
+        now = time.monotonic()
+        if not path or (not force and now - self._checked_at < settings.LATEST_PREMIUM_RELOAD_SECONDS):
+            return
+        self._checked_at = now
+        try:
+            mtime = os.stat(path).st_mtime_ns
+            if mtime == self._file_mtime:
+                return
+            with open(path, encoding='utf-8') as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError) as e:
+            if not isinstance(e, FileNotFoundError):
+                logger.warning("Load latest premium file %r failed: %r", path, e)
+            return
+
+        rows = {name: {entry['fund_id']: _premium_row(entry) for entry in category['rows']}
+                for name, category in snapshot.get('categories', {}).items()}
+        updated_at = {name: category['updated_at'] for name, category in snapshot.get('categories', {}).items()}
+        alerts = [_premium_row(entry) for entry in snapshot.get('alerts', [])]
+        view = self._build_view(rows, updated_at, alerts)
+        with self._lock:
+            previous = self._view
+            self._rows, self._updated_at, self._view = rows, updated_at, view
+            self._file_mtime = mtime
+        self._notify(previous, view)
+
+    def refresh(self):
+        """立即重新加载其他进程写入的文件（成为主节点时），不等待LATEST_PREMIUM_RELOAD_SECONDS"""
+        with self._lock:
+            self._file_mtime = None
+        self._reload_file(force=True)
+
+    def view(self) -> PremiumView:
+        """当前数据，本进程不执行扫描时先检查其他进程写入的文件"""
+        self._reload_file()
+        return self._view
+
+
+latest_premiums = LatestPremiumStore()
@@ -1,21 +1,67 @@
+from __future__ import annotations
+
 import logging
 from datetime import datetime
-from typing import Dict, List, Tuple, Set
+from typing import Dict, List, Sequence, Tuple, Set
+
+from app.common.lazy import LazyModule
+from app.query.fund_index import fund_index
+from app.query.notify_rules import CompiledRules, apply_status_code
 
 logger = logging.getLogger('app')
 
-FUND_REDEMPTION_FEES = {
-    '501305': 0.1,
-    '501306': 0.1,
-    '501307': 0.1,
-    '164705': 0.0,
-    '501310': 0.5,
-    '501301': 0.5,
-    '501302': 0.5,
-    '160924': 0.5,
-    '160717': 0.5,
-    '161831': 0.5
-}
+np = LazyModule('numpy')
+
+
+def get_notify_rules() -> CompiledRules:
+    """获取当前基金索引版本对应的编译后通知规则"""
+    return fund_index.snapshot().rules
+
+
+def is_full_open(apply_status: str) -> bool:
+    """判断是否开放申购（完全开放）"""
+    return apply_status not in ['暂停申购']
+
+
+def is_limited_open(apply_status: str) -> bool:
+    """判断是否小额开放申购"""
+    return apply_status not in ['暂停申购', '开放申购']
+
+
+def is_redeemable(redeem_status: str) -> bool:
+    """判断是否开放赎回"""
+    return "开放赎回" in redeem_status
+
+
+def required_discount(fund_id: str) -> float:
+    """
+    折价套利要求的最小折价（不带百分号）
+    """
+    # 获取该基金的赎回费率（不带百分号），如果没有则使用默认阈值1%
+    redemption_fee = fund_index.snapshot().redemption_fee(fund_id)
+
+    if redemption_fee is not None:
+        # 指定基金：要求折价 > (赎回费 + 0.6%)
+        return redemption_fee + 0.6
+    # 非指定基金：默认要求折价 > 1%
+    return 1.0
+
+
+def is_significant_discount(fund_id: str, premium: float) -> bool:
+    """
+    判断是否有显著折价（用于套利）
+    
+    参数说明:
+    - fund_id: 基金代码
+    - premium: 溢价率（不带百分号，如-1.0表示1%折价）
+    
+    返回:
+    - True: 当折价空间（考虑赎回费后）足够
+    - False: 不满足条件
+    """
+    # premium是负值表示折价，所以判断是否小于负的required_discount
+    return premium < -required_discount(fund_id)
+
 
 def check_notify_condition(
     fund_id: str,
@@ -35,43 +81,6 @@ def check_notify_condition(
     :return: 是否满足通知条件
     """
 
-    def is_full_open(apply_status: str) -> bool:
-        """判断是否开放申购（完全开放）"""
-        return apply_status not in ['暂停申购']
-    
-    def is_limited_open(apply_status: str) -> bool:
-        """判断是否小额开放申购"""
-        return apply_status not in ['暂停申购', '开放申购']
-    
-    def is_redeemable(redeem_status: str) -> bool:
-        """判断是否开放赎回"""
-        return "开放赎回" in redeem_status
-    
-    def is_significant_discount(fund_id: str, premium: float) -> bool:
-        """
-        判断是否有显著折价（用于套利）
-        
-        参数说明:
-        - fund_id: 基金代码
-        - premium: 溢价率（不带百分号，如-1.0表示1%折价）
-        
-        返回:
-        - True: 当折价空间（考虑赎回费后）足够
-        - False: 不满足条件
-        """
-        # 获取该基金的赎回费率（不带百分号），如果没有则使用默认阈值1%
-        redemption_fee = FUND_REDEMPTION_FEES.get(fund_id, None)
-        
-        if redemption_fee is not None:
-            # 指定基金：要求折价 > (赎回费 + 0.6%)
-            required_discount = redemption_fee + 0.6
-        else:
-            # 非指定基金：默认要求折价 > 1%
-            required_discount = 1.0
-        
-        # premium是负值表示折价，所以判断是否小于负的required_discount
-        return premium < -required_discount
-
     # 对于持有的基金
     if is_holding:
         # 盘中溢价>5%通知
@@ -93,3 +102,32 @@ def check_notify_condition(
             return True
     
     return False
+
+
+def build_notify_columns(rows: Sequence[Tuple[str, float, str, str, bool]]) -> Dict[str, np.ndarray]:
+    """
+    将一个分类的数据转换为列
+    :param rows: [(fund_id, 溢价率, 申购状态, 赎回状态, 是否持有)]
+    :return: {'fund_id', 'premium', 'apply_code', 'redeemable', 'holding', 'required_discount'}
+    """
+    rules = get_notify_rules()
+    return {
+        'fund_id': np.array([row[0] for row in rows], dtype=object),
+        'premium': np.array([row[1] for row in rows], dtype=np.float64),
+        'apply_code': np.array([apply_status_code(row[2]) for row in rows], dtype=np.int8),
+        'redeemable': np.array([is_redeemable(row[3]) for row in rows], dtype=bool),
+        'holding': np.array([row[4] for row in rows], dtype=bool),
+        'required_discount': np.array([rules.required_discount(row[0]) for row in rows], dtype=np.float64),
+    }
+
+
+def check_notify_condition_batch(columns: Dict[str, np.ndarray], is_near_close: bool) -> np.ndarray:
+    """
+    按通知规则（NOTIFY_RULES_FILE）批量检查通知条件，
+    使用默认规则时结果与逐行调用check_notify_condition一致
+
+    :param columns: build_notify_columns返回的列
+    :param is_near_close: 是否临近收盘
+    :return: 与输入行一一对应的bool数组，True表示需通知
+    """
+    return get_notify_rules().evaluate_batch(columns, is_near_close)
@@ -0,0 +1,227 @@
+from __future__ import annotations
+
+import logging
+import re
+from typing import Callable, Dict, Iterable, NamedTuple, Optional
+
+from app.common.lazy import LazyModule
+
+# 只有批量检查时才用到numpy，web进程启动时不导入
+np = LazyModule('numpy')
+
+logger = logging.getLogger('app')
+
+# 规则名会写入生成的匹配函数的注释中，只允许字母、数字、下划线、点和横线
+RULE_NAME_RE = re.compile(r'[\w.-]+')
+
+APPLY_SUSPENDED = 0  # 暂停申购
+APPLY_OPEN = 1       # 开放申购
+APPLY_LIMITED = 2    # 小额开放申购（限额）
+
+APPLY_STATES = {
+    'suspended': APPLY_SUSPENDED,
+    'open': APPLY_OPEN,
+    'limited': APPLY_LIMITED,
+}
+APPLY_ANY = sum(1 << code for code in APPLY_STATES.values())
+# 暂停申购、开放申购之外的申购状态都视为小额开放申购
+APPLY_STATUS_TEXT = {
+    APPLY_SUSPENDED: '暂停申购',
+    APPLY_OPEN: '开放申购',
+}
+REDEEMABLE_STATUS = '开放赎回'
+
+RULE_KEYS = {'name', 'holding', 'near_close', 'premium_above', 'discount_above', 'apply', 'redeemable'}
+
+
+def apply_status_code(apply_status: str) -> int:
+    """申购状态编码"""
+    if apply_status == '暂停申购':
+        return APPLY_SUSPENDED
+    if apply_status == '开放申购':
+        return APPLY_OPEN
+    return APPLY_LIMITED
+
+
+def _apply_condition(apply_mask: int) -> str:
+    """生成申购状态判断表达式"""
+    if apply_mask & (1 << APPLY_LIMITED):
+        excluded = tuple(text for code, text in APPLY_STATUS_TEXT.items() if not apply_mask & (1 << code))
+        return f'apply_status not in {excluded!r}'
+    allowed = tuple(text for code, text in APPLY_STATUS_TEXT.items() if apply_mask & (1 << code))
+    return f'apply_status in {allowed!r}'
+
+
+class CompiledRule(NamedTuple):
+    """
+    一条编译后的规则，所有条件同时满足时通知，None表示不限制
+    discount_below为溢价率上限（溢价率 < discount_below，即折价超过阈值），
+    per_fund_discount为True时改用每只基金各自的折价阈值
+    """
+    name: str
+    holding: Optional[bool]
+    near_close: Optional[bool]
+    premium_above: Optional[float]
+    discount_below: Optional[float]
+    per_fund_discount: bool
+    apply_mask: int
+    redeemable: Optional[bool]
+
+
+class CompiledRules:
+    """
+    编译后的通知规则表
+    - 按是否临近收盘预先筛选出适用的规则，并生成对应的单行判断函数
+    - 预先计算每只基金的折价阈值
+    """
+    def __init__(self, rules: Iterable[CompiledRule], required_discounts: Dict[str, float], default_discount: float):
+        self.rules = tuple(rules)
+        self.required_discounts = required_discounts
+        self.default_discount = default_discount
+        self._discount_below = {fund_id: -discount for fund_id, discount in required_discounts.items()}
+        self._default_discount_below = -default_discount
+        self._rules_by_near_close = {
+            near_close: tuple(rule for rule in self.rules if rule.near_close in (None, near_close))
+            for near_close in (False, True)
+        }
+        self._matchers = {near_close: self._generate_matcher(near_close) for near_close in (False, True)}
+
+    def required_discount(self, fund_id: str) -> float:
+        """折价套利要求的最小折价（不带百分号）"""
+        return self.required_discounts.get(fund_id, self.default_discount)
+
+    def premium_threshold(self, is_holding: bool) -> Optional[float]:
+        """适用于持有/未持有基金的规则中最低的溢价阈值，没有溢价规则时返回None"""
+        thresholds = [rule.premium_above for rule in self.rules
+                      if rule.premium_above is not None and rule.holding in (None, is_holding)]
+        return min(thresholds) if thresholds else None
+
+    def matcher(self, is_near_close: bool) -> Callable[[str, float, str, str, bool], bool]:
+        """
+        获取单行判断函数 f(fund_id, 溢价率, 申购状态, 赎回状态, 是否持有) -> bool
+        函数由规则表生成，阈值以常量内联，调用时不分配对象
+        """
+        return self._matchers[is_near_close]
+
+    def matches(self, fund_id: str, premium_rate: float, apply_status: str, redeem_status: str,
+                is_near_close: bool, is_holding: bool) -> bool:
+        """判断单行数据是否满足任一规则，参数与check_notify_condition一致"""
+        return self._matchers[is_near_close](fund_id, premium_rate, apply_status, redeem_status, is_holding)
+
+    def _generate_matcher(self, is_near_close: bool):
+        lines = [
+            "def match(fund_id, premium_rate, apply_status, redeem_status, is_holding,",
+            "          _discount_below=_discount_below, _default_discount_below=_default_discount_below):",
+        ]
+        for rule in self._rules_by_near_close[is_near_close]:
+            conditions = []
+            if rule.holding is not None:
+                conditions.append('is_holding' if rule.holding else 'not is_holding')
+            if rule.premium_above is not None:
+                conditions.append(f'premium_rate > {rule.premium_above!r}')
+            if rule.apply_mask != APPLY_ANY:
+                conditions.append(_apply_condition(rule.apply_mask))
+            if rule.redeemable is not None:
+                conditions.append(f"{'' if rule.redeemable else 'not '}{REDEEMABLE_STATUS!r} in redeem_status")
+            if rule.per_fund_discount:
+                conditions.append('premium_rate < _discount_below.get(fund_id, _default_discount_below)')
+            elif rule.discount_below is not None:
+                conditions.append(f'premium_rate < {rule.discount_below!r}')
+            lines.append(f"    # {rule.name}")
+            lines.append(f"    if {' and '.join(conditions) or 'True'}:")
+            lines.append("        return True")
+        lines.append("    return False")
+
+        namespace = {
+            '_discount_below': self._discount_below,
+            '_default_discount_below': self._default_discount_below,
+        }
+        exec(compile('\n'.join(lines), f'<notify_rules near_close={is_near_close}>', 'exec'), namespace)
+        return namespace['match']
+
+    def evaluate_batch(self, columns: Dict[str, np.ndarray], is_near_close: bool) -> np.ndarray:
+        """
+        批量判断一个分类的数据
+        :param columns: build_notify_columns返回的列
+        :return: 与输入行一一对应的bool数组
+        """
+        premium = columns['premium']
+        result = np.zeros(len(premium), dtype=bool)
+        for rule in self._rules_by_near_close[is_near_close]:
+            mask = np.ones(len(premium), dtype=bool)
+            if rule.holding is not None:
+                mask &= columns['holding'] if rule.holding else ~columns['holding']
+            if rule.premium_above is not None:
+                mask &= premium > rule.premium_above
+            if rule.apply_mask != APPLY_ANY:
+                mask &= (np.left_shift(1, columns['apply_code'].astype(np.int64)) & rule.apply_mask) != 0
+            if rule.redeemable is not None:
+                mask &= columns['redeemable'] if rule.redeemable else ~columns['redeemable']
+            if rule.per_fund_discount:
+                mask &= premium < -columns['required_discount']
+            elif rule.discount_below is not None:
+                mask &= premium < rule.discount_below
+            result |= mask
+        return result
+
+
+def _optional_bool(rule: Dict, key: str) -> Optional[bool]:
+    value = rule.get(key)
+    if value is not None and not isinstance(value, bool):
+        raise ValueError(f"rule {rule.get('name')!r}: {key} must be true/false/null")
+    return value
+
+
+def _optional_float(rule: Dict, key: str) -> Optional[float]:
+    value = rule.get(key)
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"rule {rule.get('name')!r}: {key} must be a number")
+    return float(value)
+
+
+def compile_rules(config: Dict, redemption_fees: Dict[str, float]) -> CompiledRules:
+    """
+    编译规则配置
+    :param config: 规则配置，格式见notify_rules.json
+    :param redemption_fees: {基金代码: 赎回费率}，用于计算每只基金的折价阈值
+    """
+    discount_cfg = config.get('required_discount', {})
+    fee_margin = float(discount_cfg.get('fee_margin', 0.6))
+    default_discount = float(discount_cfg.get('default', 1.0))
+    required_discounts = {fund_id: fee + fee_margin for fund_id, fee in redemption_fees.items()}
+
+    compiled = []
+    for rule in config.get('rules', []):
+        unknown = set(rule) - RULE_KEYS
+        if unknown:
+            raise ValueError(f"rule {rule.get('name')!r}: unknown keys {sorted(unknown)}")
+        name = rule.get('name', f'rule_{len(compiled)}')
+        if not isinstance(name, str) or not RULE_NAME_RE.fullmatch(name):
+            raise ValueError(f"rule {name!r}: name may only contain letters, digits, '_', '.' and '-'")
+
+        apply_mask = APPLY_ANY
+        if rule.get('apply') is not None:
+            try:
+                apply_mask = sum(1 << APPLY_STATES[state] for state in set(rule['apply']))
+            except KeyError as e:
+                raise ValueError(f"rule {rule.get('name')!r}: unknown apply state {e}")
+
+        discount = rule.get('discount_above')
+        per_fund_discount = discount == 'required'
+        discount_below = None if per_fund_discount else _optional_float(rule, 'discount_above')
+
+        compiled.append(CompiledRule(
+            name=name,
+            holding=_optional_bool(rule, 'holding'),
+            near_close=_optional_bool(rule, 'near_close'),
+            premium_above=_optional_float(rule, 'premium_above'),
+            discount_below=None if discount_below is None else -discount_below,
+            per_fund_discount=per_fund_discount,
+            apply_mask=apply_mask,
+            redeemable=_optional_bool(rule, 'redeemable'),
+        ))
+
+    return CompiledRules(compiled, required_discounts, default_discount)
+
@@ -0,0 +1,177 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from typing import Callable, List, Optional
+
+from django.conf import settings
+
+from app.query.latest_premium import PremiumRow, PremiumView, latest_premiums
+
+logger = logging.getLogger('app')
+
+PREMIUM_EVENT = 'premium'  # 溢价率等数据有变化的基金
+ALERT_EVENT = 'alert'      # 本周期新发出的提醒
+
+
+def sse_message(event: str, data: str) -> bytes:
+    return f"event: {event}\ndata: {data}\n\n".encode('utf-8')
+
+
+HEARTBEAT = b": ping\n\n"
+DROPPED = sse_message('dropped', '{"reason": "buffer full"}')
+
+
+class EventClient:
+    """
+    一个SSE连接：有界缓冲区 + 过滤条件
+    缓冲区满（客户端读取太慢）时断开该连接，不会无限占用内存，客户端可以重新连接
+    """
+    def __init__(self, broker: 'PremiumEventBroker', match: Optional[Callable[[PremiumRow], bool]], buffer_size: int):
+        self.broker = broker
+        self.match = match
+        self.buffer_size = buffer_size
+        self.dropped = False
+        self._buffer = deque()
+        self._lock = threading.Lock()
+        self._event = threading.Event()
+        self._wake_async = None
+
+    def push(self, event: str, row: PremiumRow, message: bytes):
+        if self.match is not None and not self.match(row):
+            return
+        with self._lock:
+            if self.dropped:
+                return
+            if len(self._buffer) >= self.buffer_size:
+                self.dropped = True
+                self._buffer.clear()
+                logger.warning("SSE client too slow, dropped")
+            else:
+                self._buffer.append(message)
+        self._event.set()
+        if self._wake_async is not None:
+            self._wake_async()
+
+    def _drain(self) -> List[bytes]:
+        with self._lock:
+            messages = list(self._buffer)
+            self._buffer.clear()
+        return messages
+
+    def _poll_interval(self) -> float:
+        # 本进程不执行扫描时，定期检查其他进程写入的数据
+        return max(min(settings.SSE_HEARTBEAT_SECONDS, settings.LATEST_PREMIUM_RELOAD_SECONDS), 0.1)
+
+    def __iter__(self):
+        """WSGI（gunicorn）使用的同步迭代器，最长SSE_WSGI_MAX_SECONDS秒后结束，释放worker，客户端按retry重连"""
+        try:
+            yield b"retry: 5000\n\n"
+            last_sent = time.monotonic()
+            deadline = last_sent + settings.SSE_WSGI_MAX_SECONDS
+            while time.monotonic() < deadline:
+                self._event.clear()
+                messages = self._drain()
+                if messages:
+                    yield b''.join(messages)
+                    last_sent = time.monotonic()
+                elif self.dropped:
+                    yield DROPPED
+                    return
+                else:
+                    self._event.wait(max(min(self._poll_interval(), deadline - time.monotonic()), 0))
+                    latest_premiums.view()
+                    if time.monotonic() - last_sent >= settings.SSE_HEARTBEAT_SECONDS:
+                        yield HEARTBEAT
+                        last_sent = time.monotonic()
+        finally:
+            self.broker.unsubscribe(self)
+
+    async def aiter(self):
+        """ASGI使用的异步迭代器，等待时不占用线程"""
+        loop = asyncio.get_running_loop()
+        wakeup = asyncio.Event()
+        self._wake_async = lambda: loop.call_soon_threadsafe(wakeup.set)
+        try:
+            yield b"retry: 5000\n\n"
+            last_sent = time.monotonic()
+            while True:
+                wakeup.clear()
+                messages = self._drain()
+                if messages:
+                    yield b''.join(messages)
+                    last_sent = time.monotonic()
+                elif self.dropped:
+                    yield DROPPED
+                    return
+                else:
+                    try:
+                        await asyncio.wait_for(wakeup.wait(), self._poll_interval())
+                    except asyncio.TimeoutError:
+                        pass
+                    latest_premiums.view()
+                    if time.monotonic() - last_sent >= settings.SSE_HEARTBEAT_SECONDS:
+                        yield HEARTBEAT
+                        last_sent = time.monotonic()
+        finally:
+            self.broker.unsubscribe(self)
+
+
+class PremiumEventBroker:
+    """
+    每次最新数据更新后，把有变化的基金和新提醒推送给所有SSE连接
+    - 每个事件只序列化一次，所有连接共用同一份数据
+    - 每个连接按自己的过滤条件选择事件
+    """
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls, *args, **kwargs):
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = super(PremiumEventBroker, cls).__new__(cls, *args, **kwargs)
+                cls._instance._clients = set()
+                cls._instance.published = 0
+                latest_premiums.add_listener(cls._instance.broadcast)
+        return cls._instance
+
+    def subscribe(self, match: Optional[Callable[[PremiumRow], bool]] = None) -> Optional[EventClient]:
+        """
+        :return: 新连接，连接数已达到SSE_MAX_CLIENTS时返回None
+        """
+        with self._lock:
+            if len(self._clients) >= settings.SSE_MAX_CLIENTS:
+                return None
+            client = EventClient(self, match, settings.SSE_CLIENT_BUFFER)
+            self._clients.add(client)
+            return client
+
+    def unsubscribe(self, client: EventClient):
+        with self._lock:
+            self._clients.discard(client)
+
+    @property
+    def client_count(self) -> int:
+        with self._lock:
+            return len(self._clients)
+
+    def broadcast(self, previous: PremiumView, view: PremiumView):
+        with self._lock:
+            clients = list(self._clients)
+        if not clients:
+            return
+        events = [(PREMIUM_EVENT, row) for fund_id, row in view.funds.items()
+                  if getattr(previous.funds.get(fund_id), 'fragment', None) != row.fragment]
+        events.extend((ALERT_EVENT, row) for row in view.alerts)
+        for event, row in events:
+            message = sse_message(event, row.fragment)
+            for client in clients:
+                client.push(event, row, message)
+        self.published += len(events)
+        # 断开的慢连接不再计入连接数
+        with self._lock:
+            self._clients.difference_update(client for client in clients if client.dropped)
+
+
+premium_events = PremiumEventBroker()
@@ -0,0 +1,141 @@
+import logging
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from django.db.models import Max
+from django.utils import timezone
+
+from app.models import FundPremiumSample
+from app.query.notify_rules import REDEEMABLE_STATUS, apply_status_code
+
+logger = logging.getLogger('app')
+
+REDEEM_SUSPENDED = 0  # 不可赎回
+REDEEM_OPEN = 1       # 开放赎回
+
+
+class PremiumPoint(NamedTuple):
+    """一条溢价率采样"""
+    ts: datetime
+    premium: float
+    apply_code: int
+    redeem_code: int
+
+
+class _SampleBatch:
+    """一个扫描周期收集到的采样，所有采样使用周期开始时间"""
+    def __init__(self):
+        self.ts = timezone.now()
+        self.samples: List[FundPremiumSample] = []
+
+
+_current_batch: ContextVar[Optional[_SampleBatch]] = ContextVar('premium_sample_batch', default=None)
+
+
+def redeem_status_code(redeem_status: str) -> int:
+    """赎回状态编码"""
+    return REDEEM_OPEN if REDEEMABLE_STATUS in redeem_status else REDEEM_SUSPENDED
+
+
+@contextmanager
+def collect_premium_samples():
+    """
+    收集本周期解析出的数据，退出时一条语句批量写入
+    未处于收集状态时add_premium_samples不做任何事
+    """
+    batch = _SampleBatch()
+    token = _current_batch.set(batch)
+    try:
+        yield batch
+    finally:
+        _current_batch.reset(token)
+    save_premium_samples(batch.samples)
+
+
+def add_premium_samples(rows: Iterable) -> None:
+    """
+    记录解析后的行（FundRow）
+    处理函数只会解析与上个周期相比有变化的行，所以这里只记录变化
+    """
+    batch = _current_batch.get()
+    if batch is None:
+        return
+    batch.samples.extend(
+        FundPremiumSample(
+            fund_id=row.fund_id,
+            ts=batch.ts,
+            premium=row.premium_rate,
+            apply_code=apply_status_code(row.apply_status),
+            redeem_code=redeem_status_code(row.redeem_status),
+        )
+        for row in rows
+    )
+
+
+def save_premium_samples(samples: List[FundPremiumSample]) -> int:
+    """
+    批量写入采样，写入失败只记录日志，不影响扫描
+    :return: 写入的条数
+    """
+    if not samples:
+        return 0
+    try:
+        # 一个周期最多几千行，不分批，一条INSERT语句写入
+        FundPremiumSample.objects.bulk_create(samples, batch_size=None)
+    except Exception as e:
+        logger.error("Save %d premium samples failed: %r", len(samples), e)
+        return 0
+    logger.debug("Saved %d premium samples", len(samples))
+    return len(samples)
+
+
+def get_premium_history(
+    fund_ids: Iterable[str],
+    start: datetime,
+    end: datetime,
+    include_previous: bool = True,
+) -> Dict[str, List[PremiumPoint]]:
+    """
+    查询一批基金在[start, end)内的采样，按时间排序
+    :param include_previous: 是否带上start之前的最后一条采样（即start时刻的状态）
+    :return: {基金代码: [PremiumPoint]}，没有采样的基金不在结果中
+    """
+    fund_ids = list(set(fund_ids))
+    history = defaultdict(list)
+    if not fund_ids:
+        return {}
+
+    fields = ('fund_id', 'ts', 'premium', 'apply_code', 'redeem_code')
+    if include_previous:
+        # 利用(fund_id, ts)索引，先按基金分组取start之前的最后时间，再取对应的行
+        last_ts = dict(
+            FundPremiumSample.objects
+            .filter(fund_id__in=fund_ids, ts__lt=start)
+            .values('fund_id')
+            .annotate(last_ts=Max('ts'))
+            .values_list('fund_id', 'last_ts')
+        )
+        if last_ts:
+            previous = (
+                FundPremiumSample.objects
+                .filter(fund_id__in=list(last_ts), ts__in=set(last_ts.values()))
+                .order_by('fund_id', 'ts', 'id')
+                .values_list(*fields)
+            )
+            for fund_id, ts, premium, apply_code, redeem_code in previous:
+                if ts == last_ts[fund_id]:
+                    history[fund_id] = [PremiumPoint(ts, premium, apply_code, redeem_code)]
+
+    samples = (
+        FundPremiumSample.objects
+        .filter(fund_id__in=fund_ids, ts__gte=start, ts__lt=end)
+        .order_by('fund_id', 'ts', 'id')
+        .values_list(*fields)
+        .iterator(chunk_size=5000)
+    )
+    for fund_id, ts, premium, apply_code, redeem_code in samples:
+        history[fund_id].append(PremiumPoint(ts, premium, apply_code, redeem_code))
+    return dict(history)
@@ -0,0 +1,190 @@
+import logging
+from datetime import date, datetime, time, timedelta
+from typing import List, Optional
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from app.models import FundPremiumDaily, FundPremiumSample
+from app.query.fund_index import fund_index
+from app.query.premium_history import PremiumPoint, get_premium_history
+from app.query.trading_time import TRADING_SESSIONS, china_today, china_tz, is_trading_time
+
+logger = logging.getLogger('app')
+
+# 每次查询汇总的基金数
+ROLLUP_FUND_CHUNK = 200
+
+
+def _day_start(day: date) -> datetime:
+    return china_tz.localize(datetime.combine(day, time(0)))
+
+
+def _sessions(day: date):
+    return [(china_tz.localize(datetime.combine(day, start)), china_tz.localize(datetime.combine(day, end)))
+            for start, end in TRADING_SESSIONS]
+
+
+def rollup_fund_day(
+    fund_id: str,
+    day: date,
+    points: List[PremiumPoint],
+    premium_threshold: Optional[float],
+    discount_threshold: float,
+) -> Optional[FundPremiumDaily]:
+    """
+    汇总一只基金一天的采样
+    :param points: 按时间排序的采样，第一条可以是当天之前的最后一条（开盘时的状态）
+    :param premium_threshold: 溢价阈值，None表示不统计高于阈值的时间
+    :param discount_threshold: 所需折价（不带负号）
+    :return: 当天没有采样时返回None
+    """
+    day_start = _day_start(day)
+    day_end = day_start + timedelta(days=1)
+    today_points = [point for point in points if point.ts >= day_start]
+    if not today_points:
+        return None
+
+    premiums = [point.premium for point in today_points]
+    seconds_above = seconds_below = 0.0
+    sessions = _sessions(day)
+    # 每条采样一直有效到下一条采样，只统计交易时段内的时间
+    for i, point in enumerate(points):
+        valid_from = point.ts
+        valid_to = points[i + 1].ts if i + 1 < len(points) else day_end
+        above = premium_threshold is not None and point.premium > premium_threshold
+        below = point.premium < -discount_threshold
+        if not above and not below:
+            continue
+        overlap = sum(max((min(valid_to, end) - max(valid_from, start)).total_seconds(), 0)
+                      for start, end in sessions)
+        if above:
+            seconds_above += overlap
+        else:
+            seconds_below += overlap
+
+    return FundPremiumDaily(
+        fund_id=fund_id,
+        trade_date=day,
+        premium_open=premiums[0],
+        premium_high=max(premiums),
+        premium_low=min(premiums),
+        premium_close=premiums[-1],
+        sample_count=len(today_points),
+        seconds_above=round(seconds_above),
+        seconds_below=round(seconds_below),
+        premium_threshold=premium_threshold,
+        discount_threshold=discount_threshold,
+    )
+
+
+def _save_daily(rows: List[FundPremiumDaily]):
+    # 重复汇总同一天时覆盖之前的结果；MySQL的ON DUPLICATE KEY UPDATE不能指定冲突字段
+    unique_fields = None
+    if connection.features.supports_update_conflicts_with_target:
+        unique_fields = ['fund_id', 'trade_date']
+    FundPremiumDaily.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=unique_fields,
+        update_fields=['premium_open', 'premium_high', 'premium_low', 'premium_close', 'sample_count',
+                       'seconds_above', 'seconds_below', 'premium_threshold', 'discount_threshold'],
+    )
+
+
+def rollup_day(day: date) -> int:
+    """
+    汇总一个交易日所有基金的采样，按ROLLUP_FUND_CHUNK只基金分批查询、写入
+    :return: 汇总的基金数
+    """
+    day_start = _day_start(day)
+    day_end = day_start + timedelta(days=1)
+    fund_ids = sorted(
+        FundPremiumSample.objects.filter(ts__gte=day_start, ts__lt=day_end)
+        .values_list('fund_id', flat=True).distinct()
+    )
+    snapshot = fund_index.snapshot()
+    total = 0
+    for i in range(0, len(fund_ids), ROLLUP_FUND_CHUNK):
+        chunk = fund_ids[i:i + ROLLUP_FUND_CHUNK]
+        history = get_premium_history(chunk, day_start, day_end)
+        rows = []
+        for fund_id in chunk:
+            row = rollup_fund_day(
+                fund_id, day, history.get(fund_id, []),
+                snapshot.rules.premium_threshold(fund_id in snapshot.holding_funds),
+                snapshot.rules.required_discount(fund_id),
+            )
+            if row is not None:
+                rows.append(row)
+        _save_daily(rows)
+        total += len(rows)
+    return total
+
+
+def purge_premium_samples(before: datetime, chunk_size: int) -> Optional[int]:
+    """
+    按主键分批删除before之前的采样，每批单独提交，避免长时间锁表
+    :return: 删除的行数，进入交易时间而中止时返回None
+    """
+    deleted = 0
+    while True:
+        if is_trading_time():
+            logger.warning("Trading time started, stop purging premium samples after %d rows", deleted)
+            return None
+        ids = list(FundPremiumSample.objects.filter(ts__lt=before).order_by('id').values_list('id', flat=True)[:chunk_size])
+        if not ids:
+            return deleted
+        FundPremiumSample.objects.filter(id__in=ids).delete()
+        deleted += len(ids)
+
+
+def rollup_and_purge_premium_history():
+    """
+    收盘后汇总溢价率历史并清理过期的原始采样
+    - 从最近汇总过的一天开始，汇总到最近一个已收盘的交易日
+    - 只删除已汇总、且超过PREMIUM_HISTORY_RETENTION_DAYS天的采样
+    - 交易时间内不执行，执行过程中进入交易时间则中止
+    """
+    connection.close_if_unusable_or_obsolete()
+    if is_trading_time():
+        logger.warning("Skip premium rollup during trading time")
+        return
+
+    now = timezone.now().astimezone(china_tz)
+    last_day = china_today()
+    if now.time() <= TRADING_SESSIONS[-1][1]:
+        last_day -= timedelta(days=1)
+
+    # 最近汇总过的一天可能只汇总了一部分，重新汇总
+    day = FundPremiumDaily.objects.aggregate(day=Max('trade_date'))['day']
+
+    rolled_up = []
+    while day is None or day <= last_day:
+        if is_trading_time():
+            logger.warning("Trading time started, stop premium rollup at %s", day)
+            return
+        # 跳过没有采样的日期
+        samples = FundPremiumSample.objects.all()
+        if day is not None:
+            samples = samples.filter(ts__gte=_day_start(day))
+        next_ts = samples.aggregate(ts=Min('ts'))['ts']
+        if next_ts is None:
+            break
+        day = next_ts.astimezone(china_tz).date()
+        if day > last_day:
+            break
+        rolled_up.append((day, rollup_day(day)))
+        day += timedelta(days=1)
+    logger.info("Premium rollup: %s", ', '.join(f'{day}: {count}' for day, count in rolled_up) or 'nothing to do')
+
+    # 只清理已完整汇总的日期
+    before = min(
+        now - timedelta(days=settings.PREMIUM_HISTORY_RETENTION_DAYS),
+        _day_start(last_day + timedelta(days=1)),
+    )
+    deleted = purge_premium_samples(before, settings.PREMIUM_HISTORY_CHUNK_SIZE)
+    if deleted is not None:
+        logger.info("Purged %d premium samples before %s", deleted, before)
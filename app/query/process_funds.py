@@ -0,0 +1,123 @@
+import logging
+import time
+from contextlib import nullcontext
+from typing import Callable, Dict, FrozenSet, List, NamedTuple, Optional, Tuple
+
+from app.common.metrics import PARSE_SECONDS, ROWS_PROCESSED, ROWS_SKIPPED, RULE_EVAL_SECONDS
+from app.query.fingerprint import MISS, get_fingerprint_index, row_fingerprint
+from app.query.fund_index import fund_index
+from app.query.latest_premium import latest_premiums
+from app.query.premium_history import add_premium_samples
+
+logger = logging.getLogger('app')
+
+
+class FundRow(NamedTuple):
+    """解析后的一行基金数据"""
+    fund_id: str
+    fund_name: str
+    premium_rate: float
+    apply_status: str
+    redeem_status: str
+    is_holding: bool
+
+
+def format_fund_row(row: FundRow) -> str:
+    """结构化日志输出"""
+    return (
+        f"| {row.fund_id:8} | {row.fund_name:16} | "
+        f"溢价: {row.premium_rate:6.2f}% | "
+        f"申购: {row.apply_status:8} | "
+        f"赎回: {row.redeem_status:8} | "
+        f"{'持有' if row.is_holding else '未持有':4} |"
+    )
+
+
+def process_rows(
+    rows: List[Dict],
+    parse_row: Callable[[Dict, FrozenSet[str]], Optional[FundRow]],
+    near_close: bool,
+    category: Optional[str] = None,
+) -> List[Tuple[str, float, str, str]]:
+    """
+    解析一个分类的数据，按编译后的通知规则判断通知条件
+
+    :param rows: 集思录返回的rows
+    :param parse_row: 解析单行数据的函数(数据, 持有的基金)，无效数据返回None
+    :param near_close: 是否临近收盘
+    :param category: 分类名，指定时只重新判断与上个周期相比有变化的行
+    :return: [(fund_id, 溢价率, 申购状态, 赎回状态)]，顺序与rows一致
+    """
+    # 整个分类使用同一版本的持仓和规则
+    snapshot = fund_index.snapshot()
+    holding_funds = snapshot.holding_funds
+    index = get_fingerprint_index(category) if category else None
+    label = category or 'unknown'
+    with index.lock if index else nullcontext():
+        if index:
+            index.begin_cycle(near_close, snapshot.version)
+
+        # 每行的判断结果：需通知时为((fund_id, 溢价率, 申购状态, 赎回状态), 日志内容)，否则为None
+        results = [None] * len(rows)
+        pending = []  # [(行号, 指纹, FundRow)]
+        seen_ids = []
+        invalid_ids = []
+
+        parse_start = time.perf_counter()
+        for i, row in enumerate(rows):
+            item = row.get('cell', {})
+            fingerprint = None
+            if index:
+                fund_id = item.get('fund_id', '未知基金')
+                seen_ids.append(fund_id)
+                fingerprint = row_fingerprint(item, fund_id in holding_funds)
+                cached = index.lookup(fund_id, fingerprint)
+                if cached is not MISS:
+                    results[i] = cached
+                    continue
+
+            fund = parse_row(item, holding_funds)
+            if fund is None:
+                invalid_ids.append(item.get('fund_id', '未知基金'))
+                if index:
+                    index.store(item.get('fund_id', '未知基金'), fingerprint, None)
+                continue
+            pending.append((i, fingerprint, fund))
+
+        PARSE_SECONDS.labels(label).observe(time.perf_counter() - parse_start)
+
+        add_premium_samples(fund for _, _, fund in pending)
+        if category:
+            # 未变化的行沿用上个周期的数据
+            latest_premiums.update(category, (fund for _, _, fund in pending),
+                                   seen_ids if index else None, invalid_ids)
+
+        rule_start = time.perf_counter()
+        match = snapshot.rules.matcher(near_close)
+        for i, fingerprint, fund in pending:
+            if match(fund.fund_id, fund.premium_rate, fund.apply_status, fund.redeem_status, fund.is_holding):
+                results[i] = (
+                    (fund.fund_id, fund.premium_rate, fund.apply_status, fund.redeem_status),
+                    format_fund_row(fund),
+                )
+            else:
+                logger.debug(format_fund_row(fund) + " ❌ 不满足条件")
+            if index:
+                index.store(fund.fund_id, fingerprint, results[i])
+        RULE_EVAL_SECONDS.labels(label).observe(time.perf_counter() - rule_start)
+
+        if index:
+            index.end_cycle(seen_ids)
+            logger.info("本周期变化 %d / %d 行", index.changed, index.total)
+
+    notify_list = []
+    for result in results:
+        if result is not None:
+            fund, log_msg = result
+            logger.info(log_msg + " ✅ 需通知")
+            notify_list.append(fund)
+
+    # 每个分类只更新一次计数，不在逐行的循环中统计
+    ROWS_PROCESSED.labels(label).inc(len(rows))
+    ROWS_SKIPPED.labels(label).inc(len(invalid_ids))
+    return notify_list
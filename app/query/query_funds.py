@@ -3,56 +3,146 @@ import random
 import requests
 import time
 import logging
+import threading
 import traceback
-from datetime import date
-from django.db.models import F
-from django.db import connection
+from contextlib import nullcontext
+from typing import Callable, Dict, Optional
+from django.db import connection, transaction
 
 from app.query.trading_time import is_trading_time
-from app.models import FundNotification
-from app.notify.notify import notify_handler
-from app.query.ashare_lof import get_ashare_lof_notify_list
-from app.query.qdii import get_qdii_notify_list
+from app.notify.ledger import notification_ledger
+from app.notify.dispatcher import notify_dispatcher
+from app.notify.notify import build_digest
+from app.notify.outbox import enqueue_notifications
+from app.common.http_client import http_client
+from app.common.leader import leader_lease
+from app.common.metrics import ALERTS_FIRED, record_db_time
+from app.common.resilience import cycle_deadline
+from app.query.premium_history import collect_premium_samples
+from app.query.fingerprint import invalidate_fingerprint_indexes
+from app.query.latest_premium import latest_premiums
+from app.query.snapshot_cache import fresh_snapshots
+from django.conf import settings
+from app.query.ashare_lof import LOF_CATEGORIES
+from app.query.qdii import QDII_CATEGORIES
+from app.query.fetch_funds import fetch_and_process
 
 logger = logging.getLogger('app')
 
-def has_notified_today(fund_id):
-    today = date.today()
-    exists = FundNotification.objects.filter(fund_id=fund_id, notify_date=today).exists()
-    return exists
+# 每个扫描周期查询的分类
+SCAN_CATEGORIES = {**LOF_CATEGORIES, **QDII_CATEGORIES}
 
-def add_notify_count_to_DB(fund_id):
-    today = date.today()
-    queryset = FundNotification.objects.filter(fund_id=fund_id, notify_date=today)
-    if queryset.exists():
-        queryset.update(notify_count=F('notify_count') + 1)
-    else:
-        FundNotification.objects.create(fund_id=fund_id, notify_date=today, notify_count=1)
+# 定时扫描和手动触发的扫描在同一进程中依次执行，不会同时运行
+_scan_lock = threading.Lock()
 
-def monitor_funds_and_notify():
+
+def reset_scan_state():
+    """
+    成为主节点时调用：其他进程执行扫描期间本进程的内存状态已过时
+    - 指纹索引清空，下个周期所有行重新解析，历史表不会缺少这段时间有变化的行
+    - 当日通知记录从数据库重新加载，不重复通知其他进程已通知的基金
+    - 最新数据重新加载其他进程写入的文件
+    """
+    invalidate_fingerprint_indexes()
+    notification_ledger.reset()
+    latest_premiums.refresh()
+    logger.info("Scan state reset after becoming leader")
+
+
+leader_lease.add_acquire_listener(reset_scan_state)
+
+
+def _alerts_committed(new_funds):
+    """通知记录提交后：推送本周期的提醒，按分类统计实际发出的提醒数"""
+    latest_premiums.publish(new_funds)
+    counts = {}
+    for category, _ in new_funds:
+        counts[category] = counts.get(category, 0) + 1
+    for category, count in counts.items():
+        ALERTS_FIRED.labels(category).inc(count)
+
+
+def monitor_funds_and_notify(ignore_trading_time=False,
+                             on_category_done: Optional[Callable[[str, float, int], None]] = None,
+                             use_snapshot_cache=False) -> Optional[Dict]:
+    """
+    查询所有分类，写入需发送的通知
+    :param ignore_trading_time: 非交易时间也执行
+    :param use_snapshot_cache: 复用TTL内的快照（手动触发的扫描）；定时扫描每个周期都重新请求
+    :param on_category_done: 每个分类处理完后调用 on_category_done(分类名, 耗时秒数, 需通知的基金数)
+    :return: 本周期的统计 {"categories": {分类名: {"seconds", "funds"}}, "funds", "notified", "messages", "seconds"}，
+             非交易时间不执行时返回None
+    """
     logger.debug("query funds start...")
     connection.close_if_unusable_or_obsolete()
 
-    if not is_trading_time():
+    if not ignore_trading_time and not is_trading_time():
         logger.debug("not trading time")
-        return
+        return None
+
+    with _scan_lock:
+        start = time.monotonic()
+        categories = {}
+
+        def category_done(name, seconds, funds):
+            categories[name] = {'seconds': round(seconds, 3), 'funds': funds}
+            if on_category_done is not None:
+                on_category_done(name, seconds, funds)
 
-    lof_list = get_ashare_lof_notify_list()
-    all_lofs = lof_list['stock_lof'] + lof_list['index_lof']
-    qdii_list = get_qdii_notify_list()
-    all_qdiis = qdii_list['hk_qdii'] + qdii_list['us_qdii'] + qdii_list['commodity_qdii']
+        # 本周期解析出的数据在通知发送后一次写入历史表；记录本周期每条SQL的耗时
+        with connection.execute_wrapper(record_db_time), collect_premium_samples():
+            # 五个分类并发查询，耗时取决于最慢的一个接口
+            with cycle_deadline(settings.SCAN_CYCLE_DEADLINE_SECONDS), \
+                    (nullcontext() if use_snapshot_cache else fresh_snapshots()):
+                notify_lists = fetch_and_process(SCAN_CATEGORIES, category_done)
+            all_funds = [(category, fund) for category, funds in notify_lists.items() for fund in funds]
 
-    all_funds = all_lofs + all_qdiis
-    for fund in all_funds:
-        fund_id, premium_rate, apply_status, redeem_status = fund
-        title = fund_id
-        msg = f"{premium_rate:.2f}% {apply_status} {redeem_status}"
+            # 是否已通知由内存记录判断
+            notified = notification_ledger.notified_today(fund[0] for _, fund in all_funds)
+            new_funds = []
+            for category, fund in all_funds:
+                if fund[0] not in notified:
+                    notified.add(fund[0])
+                    new_funds.append((category, fund))
 
-        if has_notified_today(fund_id):
-            continue
+            alerts = {}
+            messages = []  # [(标题, 内容)]
+            for category, fund in new_funds:
+                fund_id, premium_rate, apply_status, redeem_status = fund
+                title = fund_id
+                msg = f"{premium_rate:.2f}% {apply_status} {redeem_status}"
+                logger.info(f"Funds Notification - title: {title}, message: {msg}")
+                if settings.NOTIFY_DIGEST:
+                    alerts.setdefault(category, []).append((fund_id, msg))
+                else:
+                    messages.append((title, msg))
+            # 摘要模式下本周期的提醒合并发送
+            messages.extend(build_digest(alerts, settings.NOTIFY_DIGEST_MAX_CHARS, settings.NOTIFY_DIGEST_SPLIT))
 
-        add_notify_count_to_DB(fund_id)
-        logger.info(f"Funds Notification - title: {title}, message: {msg}")
-        notify_handler.send_message(msg, title)
+            # 通知记录和待发送的通知在同一个事务中写入，发送失败时可以重试，不会丢失
+            # 最新数据接口和推送每个周期只序列化一次；提醒在事务提交后才推送，不会推送回滚了的提醒
+            if new_funds:
+                try:
+                    with transaction.atomic():
+                        notification_ledger.record(fund[0] for _, fund in new_funds)
+                        enqueue_notifications(messages)
+                        transaction.on_commit(lambda: _alerts_committed(new_funds))
+                except Exception:
+                    # 内存中的记录已更新，重新从数据库加载；本周期的数据不带提醒发布
+                    notification_ledger.reset()
+                    latest_premiums.publish()
+                    raise
+                # 由发送线程异步发送
+                notify_dispatcher.wake()
+            else:
+                latest_premiums.publish()
 
-    logger.debug("query funds end...")
+        http_client.log_stats()
+        logger.debug("query funds end...")
+        return {
+            'categories': categories,
+            'funds': len(all_funds),
+            'notified': len(new_funds),
+            'messages': len(messages),
+            'seconds': round(time.monotonic() - start, 3),
+        }
@@ -0,0 +1,116 @@
+import contextvars
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+from django.conf import settings
+
+logger = logging.getLogger('app')
+
+_fresh = contextvars.ContextVar('snapshot_fresh', default=False)
+
+
+@contextmanager
+def fresh_snapshots():
+    """
+    定时扫描周期使用：不复用TTL内的快照，每个周期都请求集思录，只合并正在进行中的请求
+    收盘前的扫描间隔（SCAN_NEAR_CLOSE_INTERVAL_SECONDS）可能不大于TTL，复用快照会隔一个周期拿到上个周期的数据
+    """
+    token = _fresh.set(True)
+    try:
+        yield
+    finally:
+        _fresh.reset(token)
+
+
+class _Flight:
+    """正在进行中的一次查询，并发的调用方等待同一个结果"""
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+
+
+class SnapshotCache:
+    """
+    进程内的分类数据快照缓存，按分类URL缓存集思录返回的数据
+    - 快照在TTL内直接复用，避免手动触发的扫描重复请求集思录；定时扫描周期在fresh_snapshots()中不复用快照
+    - 同一URL的并发请求合并为一次（single-flight），其余调用方等待结果
+    - 查询失败（返回None）不缓存
+    """
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls, *args, **kwargs):
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = super(SnapshotCache, cls).__new__(cls, *args, **kwargs)
+                cls._instance._snapshots = {}
+                cls._instance._flights = {}
+                cls._instance._hits = 0
+                cls._instance._misses = 0
+                cls._instance._coalesced = 0
+        return cls._instance
+
+    def get(self, key: str, loader: Callable[[], Optional[Dict]]) -> Optional[Dict]:
+        """
+        读取快照，过期或不存在时调用loader加载
+        :param key: 分类URL
+        :param loader: 实际请求数据的函数
+        :return: 数据或None
+        """
+        ttl = settings.SNAPSHOT_CACHE_TTL
+        with self._lock:
+            snapshot = self._snapshots.get(key)
+            if snapshot is not None and not _fresh.get() and time.monotonic() - snapshot[0] < ttl:
+                self._hits += 1
+                return snapshot[1]
+
+            flight = self._flights.get(key)
+            if flight is not None:
+                self._coalesced += 1
+                leader = False
+            else:
+                self._misses += 1
+                flight = self._flights[key] = _Flight()
+                leader = True
+
+        if not leader:
+            flight.event.wait()
+            return flight.result
+
+        try:
+            flight.result = loader()
+        finally:
+            with self._lock:
+                if flight.result is not None:
+                    self._snapshots[key] = (time.monotonic(), flight.result)
+                del self._flights[key]
+            flight.event.set()
+        return flight.result
+
+    def invalidate(self, key: Optional[str] = None):
+        """清除指定URL的快照，key为None时清空全部"""
+        with self._lock:
+            if key is None:
+                self._snapshots.clear()
+            else:
+                self._snapshots.pop(key, None)
+
+    def stats(self) -> Dict:
+        """
+        缓存统计
+        :return: {'hits': 命中数, 'misses': 未命中数, 'coalesced': 合并的并发请求数, 'ages': {URL: 快照已存在秒数}}
+        """
+        now = time.monotonic()
+        with self._lock:
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'coalesced': self._coalesced,
+                'ages': {key: now - snapshot[0] for key, snapshot in self._snapshots.items()},
+            }
+
+
+snapshot_cache = SnapshotCache()
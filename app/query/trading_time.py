@@ -1,34 +1,71 @@
-from datetime import datetime, time
-import chinese_calendar
+from datetime import datetime, time, timedelta
 import logging
 import pytz
+from app.common.lazy import LazyModule
 logger = logging.getLogger('app')
 
+# 节假日数据只在判断交易日时加载
+chinese_calendar = LazyModule('chinese_calendar')
+
 china_tz = pytz.timezone('Asia/Shanghai')
 
-def is_trading_time():
-    now = datetime.now(china_tz)
+# A-share trading time 9:30-11:30, 13:00-15:00
+TRADING_SESSIONS = (
+    (time(9, 30), time(11, 30)),
+    (time(13, 0), time(15, 0)),
+)
+NEAR_CLOSE_START = time(14, 30)
+NEAR_CLOSE_END = time(14, 50)
+
+
+def china_today():
+    """北京时间的当前日期，通知记录按这个日期划分"""
+    return datetime.now(china_tz).date()
+
+
+def is_trading_day(current_date):
+    if current_date.weekday() >= 5:
+        return False
+    try:
+        return not chinese_calendar.is_holiday(current_date)
+    except NotImplementedError:
+        # chinese_calendar未收录的年份，按工作日处理
+        logger.warning('holiday data not available for %r', current_date)
+        return True
+
+
+def is_trading_time(now=None):
+    now = now or datetime.now(china_tz)
     current_time = now.time()
     current_date = now.date()
 
     logger.debug('time: %r, date: %r', current_time, current_date)
 
-    if now.weekday() >= 5:
+    if not is_trading_day(current_date):
         return False
 
-    if chinese_calendar.is_holiday(current_date):
-        return False
+    return any(start <= current_time <= end for start, end in TRADING_SESSIONS)
+
 
-    # A-share trading time 9:30-11:30, 13:00-15:00
-    trading_morning_start = time(9, 30)
-    trading_morning_end = time(11, 30)
-    trading_afternoon_start = time(13, 0)
-    trading_afternoon_end = time(15, 0)
-    return (trading_morning_start <= current_time <= trading_morning_end) or (trading_afternoon_start <= current_time <= trading_afternoon_end)
+def is_near_close(now=None):
+    now = (now or datetime.now(china_tz)).time()
+    return NEAR_CLOSE_START <= now <= NEAR_CLOSE_END
 
 
-def is_near_close():
-    start_time = time(14, 30)
-    end_time = time(14, 50)
-    now = datetime.now(china_tz).time()
-    return start_time <= now <= end_time
+def next_session_open(now):
+    """
+    获取now之后（含now）最近的开盘时间（上午或下午场）
+    :param now: 带时区的时间
+    :return: 带时区的开盘时间
+    """
+    now = now.astimezone(china_tz)
+    for days in range(0, 30):
+        current_date = now.date() + timedelta(days=days)
+        if not is_trading_day(current_date):
+            continue
+        for start, _ in TRADING_SESSIONS:
+            open_time = china_tz.localize(datetime.combine(current_date, start))
+            if open_time >= now:
+                return open_time
+    # 连续30天没有交易日（数据异常），一天后再检查
+    return now + timedelta(days=1)
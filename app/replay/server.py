@@ -0,0 +1,171 @@
+import json
+import logging
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+logger = logging.getLogger('app')
+
+# 路径 -> (录制文件名, 是否QDII)
+JISILU_ENDPOINTS = {
+    '/data/lof/stock_lof_list/': ('stock_lof_list.json', False),
+    '/data/lof/index_lof_list/': ('index_lof_list.json', False),
+    '/data/qdii/qdii_list/A': ('qdii_list_A.json', True),
+    '/data/qdii/qdii_list/E': ('qdii_list_E.json', True),
+    '/data/qdii/qdii_list/C': ('qdii_list_C.json', True),
+}
+
+# 合成数据中包含的持有基金，让溢价超过阈值的行能触发通知
+SYNTHETIC_HOLDINGS = {
+    '/data/lof/stock_lof_list/': ['160632'],
+    '/data/lof/index_lof_list/': [],
+    '/data/qdii/qdii_list/A': ['160924', '501301', '501302'],
+    '/data/qdii/qdii_list/E': ['161831', '501305', '501306', '501307', '164705'],
+    '/data/qdii/qdii_list/C': ['160717', '501310'],
+}
+
+APPLY_STATUSES = ['开放申购', '暂停申购', '限100', '限1000']
+REDEEM_STATUSES = ['开放赎回', '暂停赎回']
+
+
+def synthetic_rows(path: str, count: int, rng: random.Random) -> List[Dict]:
+    """生成与集思录接口格式一致的合成数据"""
+    fund_ids = list(SYNTHETIC_HOLDINGS[path])
+    prefix = 900000 + list(JISILU_ENDPOINTS).index(path) * 10000
+    fund_ids += [str(prefix + i) for i in range(max(count - len(fund_ids), 0))]
+    return [{'id': fund_id, 'cell': _synthetic_cell(fund_id, path, rng)} for fund_id in fund_ids[:count]]
+
+
+def _synthetic_cell(fund_id: str, path: str, rng: random.Random) -> Dict:
+    premium = rng.gauss(0, 3)
+    is_qdii = JISILU_ENDPOINTS[path][1]
+    return {
+        'fund_id': fund_id,
+        'fund_nm': f'合成基金{fund_id}',
+        'discount_rt': f'{premium:.2f}%' if is_qdii else f'{premium:.2f}',
+        'apply_status': rng.choice(APPLY_STATUSES),
+        'redeem_status': rng.choice(REDEEM_STATUSES),
+    }
+
+
+class ReplayServer:
+    """
+    本地集思录/pushplus替身服务，用于离线测试和压测
+    - 集思录：返回fixtures_dir中录制的数据，没有录制文件时返回合成数据，
+      每次请求按change_ratio随机改变部分行
+    - pushplus：/send 接收消息并计数
+    - 支持注入固定延迟、随机抖动和错误
+    """
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, rows: int = 200,
+                 latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 change_ratio: float = 0.1, fixtures_dir: Optional[str] = None, seed: int = 0):
+        """
+        :param rows: 每个分类合成的行数
+        :param latency: 固定延迟（秒）
+        :param jitter: 随机抖动上限（秒）
+        :param error_rate: 返回HTTP 500的概率
+        :param change_ratio: 每次请求改变的合成行比例
+        :param fixtures_dir: 录制数据目录，文件名见JISILU_ENDPOINTS
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.change_ratio = change_ratio
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._payloads = {}
+        for path, (filename, _) in JISILU_ENDPOINTS.items():
+            fixture = os.path.join(fixtures_dir, filename) if fixtures_dir else None
+            if fixture and os.path.exists(fixture):
+                with open(fixture, encoding='utf-8') as f:
+                    self._payloads[path] = (json.load(f), False)
+            else:
+                self._payloads[path] = ({'rows': synthetic_rows(path, rows, self._rng)}, True)
+
+        self.rows_served = 0
+        self.messages = []
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='replay_server', daemon=True)
+        self._thread.start()
+        logger.info("Replay server listening on %s", self.url)
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def jisilu_payload(self, path: str) -> bytes:
+        with self._lock:
+            payload, synthetic = self._payloads[path]
+            if synthetic and self.change_ratio > 0:
+                path_rows = payload['rows']
+                for row in self._rng.sample(path_rows, int(len(path_rows) * self.change_ratio)):
+                    row['cell'] = _synthetic_cell(row['id'], path, self._rng)
+            self.rows_served += len(payload['rows'])
+            return json.dumps(payload, ensure_ascii=False).encode('utf-8')
+
+    def _delay(self):
+        with self._lock:
+            delay = self.latency + self._rng.uniform(0, self.jitter)
+            fail = self._rng.random() < self.error_rate
+        if delay > 0:
+            time.sleep(delay)
+        return fail
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                path = urlparse(self.path).path
+                if path not in JISILU_ENDPOINTS:
+                    return self._reply(404, b'{}')
+                if server._delay():
+                    return self._reply(500, b'{}')
+                self._reply(200, server.jisilu_payload(path))
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                body = self.rfile.read(length)
+                if urlparse(self.path).path != '/send':
+                    return self._reply(404, b'{}')
+                if server._delay():
+                    return self._reply(500, b'{}')
+                with server._lock:
+                    server.messages.append(json.loads(body or b'{}'))
+                self._reply(200, json.dumps({'code': 200, 'msg': '请求成功', 'data': 'replay'}).encode('utf-8'))
+
+            def _reply(self, code: int, body: bytes):
+                self.send_response(code)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug("replay: " + format, *args)
+
+        return Handler
@@ -1,8 +1,53 @@
-from django.test import TestCase
+import configparser
+import fcntl
+import json
+import os
+import random
+import subprocess
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+from unittest import mock
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils.timezone import now as django_now
 from app.query.ashare_lof import get_ashare_lof_notify_list
 from app.query.qdii import get_qdii_notify_list
 from app.query.query_funds import monitor_funds_and_notify
-from app.notify.notify import notify_handler
+from app.notify.notify import DIGEST_TRUNCATE, build_digest, notify_handler
+from app.notify.dispatcher import notify_dispatcher
+from app.query.snapshot_cache import fresh_snapshots, snapshot_cache
+from app.query.ashare_lof import process_lof_data
+from app.query.fingerprint import MISS, get_fingerprint_index, invalidate_fingerprint_indexes
+from app.replay.server import ReplayServer
+from app.crons.triggers import TradingSessionTrigger
+from app.query.trading_time import china_today, china_tz
+from app.common.resilience import cycle_deadline, resilient_fetch
+from app.query.notify_condition import (
+    build_notify_columns, check_notify_condition, check_notify_condition_batch, get_notify_rules,
+)
+from app.query.fund_index import fund_index
+from app.query.notify_rules import APPLY_OPEN, compile_rules
+from app.notify.ledger import get_notified_today, notification_ledger, record_notifications
+from app.models import (
+    FundNotification, FundPremiumDaily, FundPremiumSample, NotificationOutbox, ScanJob, SchedulerLease,
+)
+from app.crons.scan_jobs import run_pending_scan_jobs
+from app.query.latest_premium import latest_premiums
+from app.query.premium_events import premium_events
+from app.query.process_funds import FundRow
+from app.common.leader import leader_lease, leader_only
+from app.common.lazy import LazyModule
+from app.common.metrics import ALERTS_FIRED, FETCH_SECONDS, _dir_lock, metrics
+from django.apps import apps
+from django.core.management import call_command
+from io import StringIO
+from app.notify.outbox import enqueue_notifications
+from app.notify.channels import FileChannel, NotifyChannel, build_channels
+from app.query.premium_rollup import rollup_and_purge_premium_history
+from app.query.premium_history import (
+    REDEEM_OPEN, PremiumPoint, collect_premium_samples, get_premium_history,
+)
 
 # Create your tests here.
 class LofTestCase(TestCase):
@@ -79,3 +124,835 @@ class QdiiTestCase(TestCase):
             
             # 这里可以添加实际的通知发送逻辑
             #notify_handler.send_message(msg, title)
+
+
+class SnapshotCacheTestCase(TestCase):
+    @override_settings(SNAPSHOT_CACHE_TTL=60)
+    def test_concurrent_callers_share_one_fetch(self):
+        """并发请求同一URL只会查询一次，TTL内再次读取命中缓存"""
+        key = 'test://snapshot_cache/coalesce'
+        snapshot_cache.invalidate(key)
+        calls = []
+
+        def loader():
+            calls.append(1)
+            time.sleep(0.2)
+            return {'rows': []}
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(snapshot_cache.get(key, loader)))
+                   for _ in range(5)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{'rows': []}] * 5)
+
+        hits = snapshot_cache.stats()['hits']
+        self.assertEqual(snapshot_cache.get(key, loader), {'rows': []})
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(snapshot_cache.stats()['hits'], hits + 1)
+        self.assertIn(key, snapshot_cache.stats()['ages'])
+
+    @override_settings(SNAPSHOT_CACHE_TTL=60, SCAN_NEAR_CLOSE_INTERVAL_SECONDS=60)
+    def test_scheduled_cycles_always_fetch(self):
+        """收盘前每60秒一次的定时扫描每次都请求，手动扫描仍复用TTL内的快照"""
+        key = 'test://snapshot_cache/scheduled'
+        snapshot_cache.invalidate(key)
+        self.addCleanup(snapshot_cache.invalidate, key)
+        calls = []
+
+        def loader():
+            calls.append(1)
+            return {'rows': [len(calls)]}
+
+        for now in (1000, 1060, 1120, 1180):
+            with mock.patch('app.query.snapshot_cache.time.monotonic', return_value=now), fresh_snapshots():
+                self.assertEqual(snapshot_cache.get(key, loader), {'rows': [len(calls)]})
+        self.assertEqual(len(calls), 4)
+
+        with mock.patch('app.query.snapshot_cache.time.monotonic', return_value=1200):
+            self.assertEqual(snapshot_cache.get(key, loader), {'rows': [4]})
+        self.assertEqual(len(calls), 4)
+
+
+class FingerprintIndexTestCase(TestCase):
+    def _payload(self, discount_rt):
+        return {'rows': [
+            {'cell': {'fund_id': '160632', 'fund_nm': '持有基金', 'discount_rt': discount_rt,
+                      'apply_status': '开放申购', 'redeem_status': '开放赎回'}},
+            {'cell': {'fund_id': '161000', 'fund_nm': '其他基金', 'discount_rt': '0.10',
+                      'apply_status': '开放申购', 'redeem_status': '开放赎回'}},
+        ]}
+
+    def test_only_changed_rows_are_evaluated(self):
+        category = 'test_fingerprint'
+        index = get_fingerprint_index(category)
+        index.invalidate()
+        with mock.patch('app.query.ashare_lof.is_near_close', return_value=False):
+            first = process_lof_data(self._payload('6.00'), category)
+            self.assertEqual(index.changed, 2)
+
+            second = process_lof_data(self._payload('6.00'), category)
+            self.assertEqual(index.changed, 0)
+            self.assertEqual(first, second)
+            self.assertEqual(second, process_lof_data(self._payload('6.00')))
+
+            third = process_lof_data(self._payload('1.00'), category)
+            self.assertEqual(index.changed, 1)
+            self.assertEqual(third, [])
+
+        # 临近收盘状态变化时全量重新判断
+        with mock.patch('app.query.ashare_lof.is_near_close', return_value=True):
+            process_lof_data(self._payload('1.00'), category)
+            self.assertEqual(index.changed, 2)
+
+
+class PremiumHistoryTestCase(TestCase):
+    def test_changed_rows_are_recorded(self):
+        payload = FingerprintIndexTestCase._payload
+        category = 'test_premium_history'
+        get_fingerprint_index(category).invalidate()
+        with mock.patch('app.query.ashare_lof.is_near_close', return_value=False):
+            # 不在扫描周期内时不记录
+            process_lof_data(payload(self, '6.00'), category)
+            self.assertEqual(FundPremiumSample.objects.count(), 0)
+
+            get_fingerprint_index(category).invalidate()
+            with collect_premium_samples() as first:
+                process_lof_data(payload(self, '6.00'), category)
+            with collect_premium_samples() as second:
+                process_lof_data(payload(self, '6.00'), category)
+            with self.assertNumQueries(1), collect_premium_samples() as third:
+                process_lof_data(payload(self, '-1.50'), category)
+
+        self.assertEqual(len(first.samples), 2)
+        self.assertEqual(len(second.samples), 0)
+        self.assertEqual(len(third.samples), 1)
+        self.assertEqual(FundPremiumSample.objects.count(), 3)
+
+        history = get_premium_history(['160632', '161000', '000000'], third.ts, third.ts + timedelta(seconds=1))
+        self.assertEqual(set(history), {'160632', '161000'})
+        self.assertEqual([point.premium for point in history['160632']], [6.0, -1.5])
+        self.assertEqual(history['161000'], [PremiumPoint(first.ts, 0.1, APPLY_OPEN, REDEEM_OPEN)])
+        history = get_premium_history(['160632'], third.ts, third.ts + timedelta(seconds=1), include_previous=False)
+        self.assertEqual([point.premium for point in history['160632']], [-1.5])
+
+
+class PremiumRollupTestCase(TestCase):
+    def _sample(self, day, hour, minute, premium, fund_id='160632'):
+        FundPremiumSample.objects.create(
+            fund_id=fund_id, ts=china_tz.localize(datetime(*day, hour, minute)),
+            premium=premium, apply_code=APPLY_OPEN, redeem_code=REDEEM_OPEN,
+        )
+
+    @override_settings(PREMIUM_HISTORY_CHUNK_SIZE=2)
+    @mock.patch('app.query.premium_rollup.is_trading_time', return_value=False)
+    def test_rollup_and_purge(self, _):
+        # 上一个交易日的最后状态延续到开盘
+        self._sample((2024, 5, 31), 14, 0, 3.0)
+        self._sample((2024, 6, 3), 9, 40, 0.5)
+        self._sample((2024, 6, 3), 10, 0, 2.0)
+        self._sample((2024, 6, 3), 13, 30, -1.5)
+        self._sample((2024, 6, 3), 14, 0, 0.2, fund_id='161000')
+
+        rollup_and_purge_premium_history()
+
+        daily = FundPremiumDaily.objects.get(fund_id='160632', trade_date=date(2024, 6, 3))
+        self.assertEqual((daily.premium_open, daily.premium_high, daily.premium_low, daily.premium_close),
+                         (0.5, 2.0, -1.5, -1.5))
+        self.assertEqual(daily.sample_count, 3)
+        # 溢价阈值1.1：9:30-9:40、10:00-11:30、13:00-13:30；所需折价1.0：13:30-15:00
+        self.assertEqual(daily.seconds_above, 600 + 5400 + 1800)
+        self.assertEqual(daily.seconds_below, 5400)
+        self.assertEqual(FundPremiumDaily.objects.count(), 3)
+        # 已汇总且超过保留天数的采样被分批删除
+        self.assertEqual(FundPremiumSample.objects.count(), 0)
+
+    def test_refuse_during_trading_time(self):
+        self._sample((2024, 6, 3), 10, 0, 2.0)
+        with mock.patch('app.query.premium_rollup.is_trading_time', return_value=True):
+            rollup_and_purge_premium_history()
+        self.assertEqual(FundPremiumDaily.objects.count(), 0)
+        self.assertEqual(FundPremiumSample.objects.count(), 1)
+
+
+class ReplayServerTestCase(TestCase):
+    def test_notify_lists_from_replay_server(self):
+        """使用本地回放服务离线获取通知列表"""
+        with ReplayServer(rows=50) as server, override_settings(JISILU_BASE_URL=server.url, SNAPSHOT_CACHE_TTL=0):
+            result = {**get_ashare_lof_notify_list(), **get_qdii_notify_list()}
+            self.assertEqual(set(result), {'stock_lof', 'index_lof', 'hk_qdii', 'us_qdii', 'commodity_qdii'})
+            self.assertEqual(server.rows_served, 250)
+            for funds in result.values():
+                for fund_id, premium_rate, apply_status, redeem_status in funds:
+                    self.assertIsInstance(fund_id, str)
+                    self.assertIsInstance(premium_rate, float)
+
+    @override_settings(FETCH_RETRIES=0)
+    def test_error_injection(self):
+        with ReplayServer(rows=10, error_rate=1.0) as server, override_settings(JISILU_BASE_URL=server.url, SNAPSHOT_CACHE_TTL=0):
+            result = get_qdii_notify_list()
+            self.assertEqual(result, {'hk_qdii': [], 'us_qdii': [], 'commodity_qdii': []})
+            self.assertEqual(server.rows_served, 0)
+
+
+class TradingSessionTriggerTestCase(TestCase):
+    def test_next_fire_time(self):
+        trigger = TradingSessionTrigger(timedelta(minutes=5), timedelta(minutes=1))
+
+        def at(*args):
+            return china_tz.localize(datetime(*args))
+
+        cases = [
+            (at(2025, 4, 26, 10, 0), at(2025, 4, 28, 9, 30)),   # 周六 -> 周一开盘
+            (at(2025, 4, 23, 12, 0), at(2025, 4, 23, 13, 0)),   # 午休 -> 下午开盘
+            (at(2025, 4, 23, 14, 20), at(2025, 4, 23, 14, 25)),
+            (at(2025, 4, 23, 14, 27), at(2025, 4, 23, 14, 30)),  # 进入临近收盘窗口
+            (at(2025, 4, 23, 14, 30), at(2025, 4, 23, 14, 31)),
+            (at(2025, 4, 23, 14, 58), at(2025, 4, 24, 9, 30)),  # 收盘 -> 次日开盘
+            (at(2025, 4, 30, 15, 30), at(2025, 5, 6, 9, 30)),   # 五一假期
+        ]
+        for now, expected in cases:
+            self.assertEqual(trigger.get_next_fire_time(None, now), expected, now)
+
+
+class ResilientFetchTestCase(TestCase):
+    @override_settings(FETCH_RETRIES=2, FETCH_BACKOFF_BASE=0.01, CIRCUIT_FAILURE_THRESHOLD=2)
+    def test_retry_and_circuit_breaker(self):
+        calls = []
+
+        def flaky():
+            calls.append(1)
+            return {'rows': []} if len(calls) == 3 else None
+
+        self.assertEqual(resilient_fetch('test://resilience/flaky', flaky), {'rows': []})
+        self.assertEqual(len(calls), 3)
+
+        def failing():
+            calls.append(1)
+            return None
+
+        endpoint = 'test://resilience/failing'
+        calls.clear()
+        self.assertIsNone(resilient_fetch(endpoint, failing))
+        self.assertIsNone(resilient_fetch(endpoint, failing))
+        self.assertEqual(len(calls), 6)
+        # 熔断后直接失败，不再请求
+        self.assertIsNone(resilient_fetch(endpoint, failing))
+        self.assertEqual(len(calls), 6)
+
+    @override_settings(FETCH_RETRIES=5, FETCH_BACKOFF_BASE=1)
+    def test_cycle_deadline_bounds_retries(self):
+        start = time.monotonic()
+        with cycle_deadline(0.5):
+            self.assertIsNone(resilient_fetch('test://resilience/deadline', lambda: None))
+        self.assertLess(time.monotonic() - start, 0.5)
+
+
+class NotifyConditionBatchTestCase(TestCase):
+    def test_batch_matches_per_row(self):
+        """随机生成数据，批量判断与逐行判断结果逐一相同"""
+        rng = random.Random(20250423)
+        funds = fund_index.snapshot().funds
+        fund_ids = list(funds) + ['161000', '501000']
+        apply_statuses = ['开放申购', '暂停申购', '限100', '限大额', '未知状态', '']
+        redeem_statuses = ['开放赎回', '暂停赎回', '限制开放赎回', '未知状态', '']
+        # 包含阈值边界上的溢价率
+        edge_premiums = [5.0, 1.1, -1.0, -0.7, -1.1, 0.0] + [-fund.required_discount for fund in funds.values()]
+
+        for _ in range(200):
+            rows = []
+            for _ in range(rng.randint(0, 60)):
+                premium = rng.choice(edge_premiums) if rng.random() < 0.3 else round(rng.uniform(-8, 8), 2)
+                rows.append((rng.choice(fund_ids), premium, rng.choice(apply_statuses),
+                             rng.choice(redeem_statuses), rng.random() < 0.5))
+            columns = build_notify_columns(rows)
+            for near_close in (False, True):
+                expected = [
+                    check_notify_condition(
+                        fund_id=fund_id, premium_rate=premium, apply_status=apply_status,
+                        redeem_status=redeem_status, is_near_close=near_close, is_holding=is_holding)
+                    for fund_id, premium, apply_status, redeem_status, is_holding in rows
+                ]
+                self.assertEqual(check_notify_condition_batch(columns, near_close).tolist(), expected)
+                match = get_notify_rules().matcher(near_close)
+                self.assertEqual([match(*row) for row in rows], expected)
+
+    def test_compile_custom_rules(self):
+        rules = compile_rules({
+            'required_discount': {'fee_margin': 0.2, 'default': 2.0},
+            'rules': [
+                {'name': 'premium', 'near_close': None, 'premium_above': 3.0, 'apply': ['open']},
+                {'name': 'discount', 'holding': True, 'redeemable': True, 'discount_above': 'required'},
+            ],
+        }, {'501305': 0.1})
+        for near_close in (False, True):
+            self.assertTrue(rules.matches('161000', 3.5, '开放申购', '暂停赎回', near_close, False))
+            self.assertFalse(rules.matches('161000', 3.5, '限100', '暂停赎回', near_close, False))
+            self.assertTrue(rules.matches('501305', -0.4, '暂停申购', '开放赎回', near_close, True))
+            self.assertFalse(rules.matches('161000', -1.5, '暂停申购', '开放赎回', near_close, True))
+            self.assertTrue(rules.matches('161000', -2.5, '暂停申购', '开放赎回', near_close, True))
+        with self.assertRaises(ValueError):
+            compile_rules({'rules': [{'name': 'typo', 'premium_abve': 1.0}]}, {})
+        # 规则名写入生成的代码，不能包含换行等字符
+        with self.assertRaisesRegex(ValueError, 'name may only contain'):
+            compile_rules({'rules': [{'name': 'x\n    import os', 'premium_above': 1.0}]}, {})
+        with self.assertRaisesRegex(ValueError, 'name may only contain'):
+            compile_rules({'rules': [{'name': 'trailing\n', 'premium_above': 1.0}]}, {})
+
+
+class FundIndexTestCase(TestCase):
+    def test_reload_swaps_snapshot(self):
+        old = fund_index.snapshot()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'funds.json')
+            with open(path, 'w') as f:
+                json.dump({'funds': {'161000': {'holding': True, 'redemption_fee': 0.2}}}, f)
+
+            with override_settings(FUND_INDEX_FILE=path):
+                self.assertTrue(fund_index.reload())
+                new = fund_index.snapshot()
+                self.assertEqual(new.version, old.version + 1)
+                self.assertEqual(new.holding_funds, {'161000'})
+                self.assertAlmostEqual(new.funds['161000'].required_discount, 0.8)
+                # 旧快照不受影响
+                self.assertIn('160632', old.holding_funds)
+
+                # 配置有误时保留当前版本
+                with open(path, 'w') as f:
+                    f.write('{"funds": {"161000": {"holding": "yes"}}}')
+                os.utime(path, ns=(0, 0))
+                self.assertFalse(fund_index.reload())
+                self.assertIs(fund_index.snapshot(), new)
+
+        self.assertTrue(fund_index.reload())
+        self.assertEqual(fund_index.snapshot().holding_funds, old.holding_funds)
+
+
+class NotificationLedgerTestCase(TestCase):
+    def test_constant_queries_per_cycle(self):
+        fund_ids = [f'16{i:04d}' for i in range(50)]
+        record_notifications(fund_ids[:10])
+        with self.assertNumQueries(1):
+            notified = get_notified_today(fund_ids)
+        self.assertEqual(notified, set(fund_ids[:10]))
+        # 已存在的记录不会违反唯一约束，notify_count累加
+        with self.assertNumQueries(2):
+            record_notifications(fund_ids[5:])
+        self.assertEqual(FundNotification.objects.count(), 50)
+        counts = dict(FundNotification.objects.values_list('fund_id', 'notify_count'))
+        self.assertEqual((counts[fund_ids[0]], counts[fund_ids[5]], counts[fund_ids[10]]), (1, 2, 1))
+        with self.assertNumQueries(0):
+            self.assertEqual(get_notified_today([]), set())
+
+    def test_in_memory_ledger(self):
+        notification_ledger.reset()
+        self.addCleanup(notification_ledger.reset)
+        today = date(2024, 6, 3)
+        FundNotification.objects.create(fund_id='160632', notify_date=today, notify_count=1)
+        with mock.patch('app.notify.ledger.china_today', return_value=today):
+            # 第一次使用时从数据库加载
+            with self.assertNumQueries(1):
+                self.assertEqual(notification_ledger.notified_today(['160632', '161000']), {'160632'})
+            with self.assertNumQueries(2):
+                notification_ledger.record(['161000'])
+            with self.assertNumQueries(0):
+                self.assertEqual(notification_ledger.notified_today(['160632', '161000']), {'160632', '161000'})
+
+        # 北京时间跨天后重新加载
+        with mock.patch('app.notify.ledger.china_today', return_value=today + timedelta(days=1)):
+            self.assertEqual(notification_ledger.notified_today(['160632', '161000']), set())
+
+
+class LeaderLeaseTestCase(TestCase):
+    def setUp(self):
+        leader_lease.release()
+        self.addCleanup(leader_lease.release)
+
+    def test_single_leader_and_failover(self):
+        runs = []
+        job = leader_only(lambda: runs.append(1))
+
+        self.assertTrue(leader_lease.renew())
+        lease = SchedulerLease.objects.get()
+        self.assertEqual(lease.holder, leader_lease.holder)
+        job()
+        self.assertEqual(runs, [1])
+
+        # 其他进程持有未过期的租约，不能执行
+        SchedulerLease.objects.update(holder='other:1', expires_at=django_now() + timedelta(seconds=30))
+        self.assertFalse(leader_lease.renew())
+        job()
+        self.assertEqual(runs, [1])
+
+        # 租约过期后下一次续约即接管
+        SchedulerLease.objects.update(expires_at=django_now() - timedelta(seconds=1))
+        self.assertTrue(leader_lease.renew())
+        job()
+        self.assertEqual(runs, [1, 1])
+
+        # 释放后其他进程可以立即接管
+        leader_lease.release()
+        lease.refresh_from_db()
+        self.assertEqual(lease.holder, '')
+        self.assertLessEqual(lease.expires_at, django_now())
+
+    def test_regained_leadership_resets_scan_state(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        path = os.path.join(tmpdir.name, 'latest.json')
+        override = override_settings(LATEST_PREMIUM_FILE=path, LATEST_PREMIUM_RELOAD_SECONDS=3600)
+        override.enable()
+        self.addCleanup(override.disable)
+        latest_premiums.reset()
+        self.addCleanup(latest_premiums.reset)
+        self.addCleanup(notification_ledger.reset)
+
+        self.assertTrue(leader_lease.renew())
+        index = get_fingerprint_index('test_leader')
+        index.store('160632', 1, None)
+        self.assertEqual(notification_ledger.notified_today(['160632']), set())
+        self.assertEqual(latest_premiums.view().categories, {})
+
+        # 其他进程执行扫描期间：行有变化、发出了通知、写入了最新数据
+        SchedulerLease.objects.update(holder='other:1', expires_at=django_now() + timedelta(seconds=30))
+        self.assertFalse(leader_lease.renew())
+        FundNotification.objects.create(fund_id='160632', notify_date=china_today(), notify_count=1)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'updated_at': '2026-10-18T10:00:00+08:00', 'alerts': [], 'categories': {
+                'stock_lof': {'updated_at': '2026-10-18T10:00:00+08:00', 'rows': [{
+                    'fund_id': '160632', 'fund_name': '酒LOF', 'category': 'stock_lof', 'premium': 6.0,
+                    'apply_status': '开放申购', 'redeem_status': '开放赎回', 'holding': True}]}}}, f)
+
+        SchedulerLease.objects.update(expires_at=django_now() - timedelta(seconds=1))
+        self.assertTrue(leader_lease.renew())
+        self.assertIs(index.lookup('160632', 1), MISS)
+        self.assertEqual(notification_ledger.notified_today(['160632']), {'160632'})
+        self.assertIn('160632', latest_premiums.view().funds)
+
+
+class LazyImportTestCase(TestCase):
+    def test_lazy_module(self):
+        module = LazyModule('json')
+        self.assertIn('not loaded', repr(module))
+        self.assertEqual(module.dumps([1]), '[1]')
+        self.assertNotIn('not loaded', repr(module))
+
+    def test_scheduler_only_in_gunicorn_workers(self):
+        config = apps.get_app_config('app')
+        # gunicorn主进程（--preload）的sys.argv与worker相同
+        with mock.patch('sys.argv', ['/usr/local/bin/gunicorn', 'proj.wsgi:application']), \
+                mock.patch.dict(os.environ, {}, clear=False):
+            os.environ.pop('ARBITRAGE_GUNICORN_WORKER', None)
+            self.assertFalse(config._should_load_cronjobs())
+            os.environ['ARBITRAGE_GUNICORN_WORKER'] = '1'
+            self.assertTrue(config._should_load_cronjobs())
+
+    def test_profile_imports(self):
+        out = StringIO()
+        call_command('profile_imports', '--top', '3', stdout=out)
+        self.assertIn('ready for first request', out.getvalue())
+
+
+class NotifyDigestTestCase(TestCase):
+    def test_build_digest(self):
+        alerts = {
+            'us_qdii': [('513100', '6.00% 开放申购 开放赎回')],
+            'stock_lof': [('160632', '5.50% 暂停申购 开放赎回'), ('161000', '-2.00% 开放申购 开放赎回')],
+            'hk_qdii': [],
+        }
+        [(title, content)] = build_digest(alerts, 4000)
+        self.assertEqual(title, '基金提醒 3只')
+        self.assertEqual(content.split('<br>'), [
+            '【股票LOF】', '160632 5.50% 暂停申购 开放赎回', '161000 -2.00% 开放申购 开放赎回',
+            '【美股QDII】', '513100 6.00% 开放申购 开放赎回',
+        ])
+
+        messages = build_digest(alerts, 60)
+        self.assertEqual([title for title, _ in messages], ['基金提醒 3只 (1/3)', '基金提醒 3只 (2/3)', '基金提醒 3只 (3/3)'])
+        # 拆分后的每条消息都带分类标题
+        self.assertTrue(all(content.startswith('【') for _, content in messages))
+        self.assertTrue(all(len(content) <= 60 for _, content in messages))
+
+        [(_, content)] = build_digest(alerts, 60, DIGEST_TRUNCATE)
+        self.assertLessEqual(len(content), 60)
+        self.assertTrue(content.endswith('……另有2只基金未列出'))
+        self.assertEqual(build_digest({'hk_qdii': []}, 4000), [])
+
+
+class NotifyDispatcherTestCase(TransactionTestCase):
+    """发送线程使用自己的数据库连接，需要提交后的数据"""
+    def setUp(self):
+        notification_ledger.reset()
+        notify_dispatcher.shutdown(timeout=5)
+
+    def tearDown(self):
+        notify_dispatcher.shutdown(timeout=5)
+        notification_ledger.reset()
+
+    @override_settings(NOTIFY_RATE_PER_MINUTE=600, NOTIFY_RATE_BURST=1, NOTIFY_RETRY_BASE_SECONDS=0,
+                       NOTIFY_MAX_ATTEMPTS=3, NOTIFY_WORKERS=2)
+    def test_outbox_retry_and_rate_limit(self):
+        attempts = []
+
+        def send_message(message, title):
+            attempts.append(title)
+            if title == 'broken':
+                return False
+            if title == 'flaky':
+                # 第一次失败，重试成功
+                return attempts.count('flaky') > 1
+            return True
+
+        enqueue_notifications([('ok', 'msg'), ('ok', 'msg'), ('flaky', 'msg'), ('broken', 'msg')])
+        # 同一天相同的通知只写入一次
+        self.assertEqual(NotificationOutbox.objects.count(), 3)
+
+        def deliver(message, title, exclude=()):
+            return {'pushplus': send_message(message, title)}
+
+        with mock.patch.object(notify_handler, 'deliver', side_effect=deliver):
+            start = time.monotonic()
+            self.assertTrue(notify_dispatcher.flush(timeout=10))
+            elapsed = time.monotonic() - start
+
+        status = dict(NotificationOutbox.objects.values_list('title', 'status'))
+        self.assertEqual(status, {'ok': NotificationOutbox.SENT, 'flaky': NotificationOutbox.SENT,
+                                  'broken': NotificationOutbox.FAILED})
+        self.assertEqual(attempts.count('ok'), 1)
+        self.assertEqual(attempts.count('flaky'), 2)
+        self.assertEqual(attempts.count('broken'), 3)
+        # 每秒10条，突发1条：6次发送至少0.5秒
+        self.assertGreaterEqual(elapsed, 0.45)
+        self.assertIsNotNone(notify_dispatcher.stats()['latency_p99'])
+
+        # 重启后已发送的通知不会重复发送
+        notify_dispatcher.shutdown(timeout=5)
+        with mock.patch.object(notify_handler, 'deliver', side_effect=deliver):
+            self.assertTrue(notify_dispatcher.flush(timeout=5))
+        self.assertEqual(len(attempts), 6)
+
+    def test_one_message_per_cycle(self):
+        with ReplayServer(rows=50) as server, override_settings(
+            JISILU_BASE_URL=server.url, PUSHPLUS_URL=f'{server.url}/send', SNAPSHOT_CACHE_TTL=0,
+        ), mock.patch('app.query.ashare_lof.is_near_close', return_value=True), \
+                mock.patch('app.query.qdii.is_near_close', return_value=True):
+            monitor_funds_and_notify(ignore_trading_time=True)
+            self.assertTrue(notify_dispatcher.flush(timeout=10))
+            self.assertGreater(FundNotification.objects.count(), 1)
+            self.assertEqual(len(server.messages), 1)
+            self.assertIn('只', server.messages[0]['title'])
+            self.assertEqual(NotificationOutbox.objects.get().status, NotificationOutbox.SENT)
+
+
+class ScanJobTestCase(TestCase):
+    def test_trigger_and_status(self):
+        first = self.client.post('/test/')
+        self.assertEqual(first.status_code, 202)
+        self.assertTrue(first.json()['created'])
+        # 未完成时重复触发合并到同一个任务
+        second = self.client.post('/test/')
+        self.assertEqual(second.json()['job_id'], first.json()['job_id'])
+        self.assertFalse(second.json()['created'])
+        status_url = f"/test/jobs/{first.json()['job_id']}/"
+        self.assertEqual(self.client.get(status_url).json()['status'], 'pending')
+
+        with ReplayServer(rows=20) as server, override_settings(
+            JISILU_BASE_URL=server.url, SNAPSHOT_CACHE_TTL=0,
+        ), mock.patch('app.query.query_funds.is_trading_time', return_value=True), \
+                mock.patch.object(notify_dispatcher, 'wake'):
+            run_pending_scan_jobs()
+
+        data = self.client.get(status_url).json()
+        self.assertEqual(data['status'], 'succeeded')
+        self.assertEqual(data['progress']['done'], data['progress']['total'])
+        self.assertEqual(set(data['result']['categories']), set(data['progress']['categories']))
+        self.assertIsNone(ScanJob.objects.get().active)
+
+        # 完成后再触发创建新任务
+        third = self.client.post('/test/')
+        self.assertTrue(third.json()['created'])
+        self.assertNotEqual(third.json()['job_id'], first.json()['job_id'])
+        self.assertEqual(self.client.get('/test/jobs/999/').status_code, 404)
+
+    @override_settings(SCAN_JOB_PENDING_TIMEOUT_SECONDS=300)
+    def test_pending_job_expires(self):
+        """没有主节点执行的任务超时后标记为失败，之后的触发创建新任务"""
+        first = self.client.post('/test/').json()
+        ScanJob.objects.filter(id=first['job_id']).update(created_at=django_now() - timedelta(seconds=301))
+
+        second = self.client.post('/test/').json()
+        self.assertTrue(second['created'])
+        self.assertNotEqual(second['job_id'], first['job_id'])
+        expired = self.client.get(f"/test/jobs/{first['job_id']}/").json()
+        self.assertEqual(expired['status'], 'failed')
+        self.assertEqual(expired['error'], 'not picked up by any scheduler')
+
+
+class LatestPremiumTestCase(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        override = override_settings(LATEST_PREMIUM_FILE=os.path.join(self.tmpdir.name, 'latest.json'),
+                                     LATEST_PREMIUM_RELOAD_SECONDS=0)
+        override.enable()
+        self.addCleanup(override.disable)
+        latest_premiums.reset()
+        self.addCleanup(latest_premiums.reset)
+
+    def test_snapshot_api(self):
+        latest_premiums.update('stock_lof', [
+            FundRow('160632', '酒LOF', 6.0, '开放申购', '开放赎回', True),
+            FundRow('161725', '白酒LOF', -1.5, '暂停申购', '开放赎回', False),
+        ])
+        latest_premiums.update('us_qdii', [FundRow('513100', '纳指ETF', 3.2, '限100', '开放赎回', False)])
+        latest_premiums.publish()
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/premiums/')
+        data = response.json()
+        self.assertEqual([row['fund_id'] for row in data['categories']['stock_lof']['rows']], ['160632', '161725'])
+        etag = response['ETag']
+        self.assertEqual(self.client.get('/premiums/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        data = self.client.get('/premiums/', {'min_abs_premium': '3'}).json()
+        self.assertEqual([row['fund_id'] for rows in data['categories'].values() for row in rows['rows']],
+                         ['160632', '513100'])
+        data = self.client.get('/premiums/stock_lof/', {'holding': 'true'}).json()
+        self.assertEqual([row['fund_id'] for row in data['rows']], ['160632'])
+        self.assertEqual(self.client.get('/premiums/funds/513100/').json()['premium'], 3.2)
+        self.assertEqual(self.client.get('/premiums/funds/000000/').status_code, 404)
+        self.assertEqual(self.client.get('/premiums/hk_qdii/').status_code, 404)
+        self.assertEqual(self.client.get('/premiums/', {'min_abs_premium': 'x'}).status_code, 400)
+
+        # 未变化的行沿用上个周期的数据，解析失败的行移除
+        latest_premiums.update('stock_lof', [], present_ids=['161725', '160632'], removed_ids=['161725'])
+        latest_premiums.publish()
+        response = self.client.get('/premiums/stock_lof/')
+        self.assertEqual([row['fund_id'] for row in response.json()['rows']], ['160632'])
+        self.assertNotEqual(self.client.get('/premiums/')['ETag'], etag)
+
+        # 不执行扫描的进程从文件加载
+        etag = self.client.get('/premiums/')['ETag']
+        latest_premiums.reset()
+        response = self.client.get('/premiums/')
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(set(response.json()['categories']), {'stock_lof', 'us_qdii'})
+
+
+class PremiumPublishTestCase(TestCase):
+    def setUp(self):
+        override = override_settings(LATEST_PREMIUM_FILE='')
+        override.enable()
+        self.addCleanup(override.disable)
+        latest_premiums.reset()
+        self.addCleanup(latest_premiums.reset)
+        notification_ledger.reset()
+        self.addCleanup(notification_ledger.reset)
+        invalidate_fingerprint_indexes()
+        self.addCleanup(invalidate_fingerprint_indexes)
+
+    def _scan(self):
+        with ReplayServer(rows=200) as server, override_settings(
+            JISILU_BASE_URL=server.url,
+        ), mock.patch.object(notify_dispatcher, 'wake'):
+            return monitor_funds_and_notify(ignore_trading_time=True)
+
+    def test_alerts_published_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            result = self._scan()
+        self.assertGreater(result['notified'], 0)
+        # 事务提交前不推送提醒
+        self.assertEqual(latest_premiums.view().alerts, [])
+        fired = sum(ALERTS_FIRED.samples().values())
+        for callback in callbacks:
+            callback()
+        self.assertEqual(len(latest_premiums.view().alerts), result['notified'])
+        # 只统计提交了的提醒
+        self.assertEqual(sum(ALERTS_FIRED.samples().values()), fired + result['notified'])
+
+    def test_rolled_back_alerts_not_published(self):
+        with mock.patch('app.query.query_funds.enqueue_notifications', side_effect=RuntimeError('db down')), \
+                self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(RuntimeError):
+                self._scan()
+        view = latest_premiums.view()
+        self.assertEqual(view.alerts, [])
+        self.assertTrue(view.funds)
+
+
+class PremiumEventsTestCase(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        override = override_settings(LATEST_PREMIUM_FILE=os.path.join(self.tmpdir.name, 'latest.json'),
+                                     SSE_CLIENT_BUFFER=3, SSE_ALLOW_WSGI=True)
+        override.enable()
+        self.addCleanup(override.disable)
+        latest_premiums.reset()
+        self.addCleanup(latest_premiums.reset)
+
+    def test_changed_rows_and_alerts(self):
+        response = self.client.get('/premiums/events/', {'holding': 'true'})
+        self.addCleanup(response.close)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = iter(response.streaming_content)
+        self.assertEqual(next(stream), b"retry: 5000\n\n")
+
+        latest_premiums.update('stock_lof', [
+            FundRow('160632', '酒LOF', 6.0, '开放申购', '开放赎回', True),
+            FundRow('161725', '白酒LOF', -1.5, '暂停申购', '开放赎回', False),
+        ])
+        latest_premiums.publish([('stock_lof', ('160632', 6.0, '开放申购', '开放赎回'))])
+        chunk = next(stream).decode('utf-8')
+        self.assertIn('event: premium', chunk)
+        self.assertIn('event: alert', chunk)
+        self.assertIn('160632', chunk)
+        self.assertNotIn('161725', chunk)
+
+        # 只推送有变化的行
+        latest_premiums.update('stock_lof', [FundRow('160632', '酒LOF', 6.5, '开放申购', '开放赎回', True)],
+                               present_ids=['160632', '161725'])
+        latest_premiums.publish()
+        chunk = next(stream).decode('utf-8')
+        self.assertEqual(chunk.count('event: premium'), 1)
+        self.assertIn('6.5', chunk)
+
+    def test_wsgi_stream(self):
+        # 默认不在WSGI下推送，不占用同步worker
+        with override_settings(SSE_ALLOW_WSGI=False):
+            self.assertEqual(self.client.get('/premiums/events/').status_code, 503)
+
+        # 开启后到达最长时间自动结束，释放连接
+        with override_settings(SSE_WSGI_MAX_SECONDS=0.3, SSE_HEARTBEAT_SECONDS=0.1):
+            response = self.client.get('/premiums/events/')
+            self.addCleanup(response.close)
+            start = time.monotonic()
+            chunks = list(response.streaming_content)
+        self.assertLess(time.monotonic() - start, 2)
+        self.assertEqual(chunks[0], b"retry: 5000\n\n")
+        self.assertEqual(premium_events.client_count, 0)
+
+    def test_slow_client_dropped(self):
+        response = self.client.get('/premiums/events/')
+        self.addCleanup(response.close)
+        stream = iter(response.streaming_content)
+        next(stream)
+        self.assertEqual(premium_events.client_count, 1)
+        latest_premiums.update('us_qdii', [FundRow(f'51310{i}', 'ETF', 3.0, '限100', '开放赎回', False)
+                                           for i in range(5)])
+        latest_premiums.publish()
+        self.assertEqual(premium_events.client_count, 0)
+        self.assertIn(b'event: dropped', next(stream))
+
+
+class MetricsTestCase(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        override = override_settings(METRICS_DIR=self.tmpdir.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_render_and_merge_processes(self):
+        FETCH_SECONDS.labels('/data/test/').observe(0.03)
+        FETCH_SECONDS.labels('/data/test/').observe(7)
+        ALERTS_FIRED.labels('test_category').inc(2)
+
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = response.content.decode('utf-8')
+        self.assertIn('# TYPE arbitrage_fetch_seconds histogram', body)
+        self.assertIn('arbitrage_fetch_seconds_bucket{endpoint="/data/test/",le="0.05"} 1', body)
+        self.assertIn('arbitrage_fetch_seconds_bucket{endpoint="/data/test/",le="+Inf"} 2', body)
+        self.assertIn('arbitrage_fetch_seconds_count{endpoint="/data/test/"} 2', body)
+        self.assertIn('arbitrage_alerts_fired_total{category="test_category"} 2', body)
+
+        # 其他进程（如独立扫描进程）写入的数据与本进程相加
+        metrics.flush()
+        with open(os.path.join(self.tmpdir.name, metrics.file_name)) as f:
+            other = f.read()
+        with open(os.path.join(self.tmpdir.name, 'other.json'), 'w') as f:
+            f.write(other)
+        body = self.client.get('/metrics').content.decode('utf-8')
+        self.assertIn('arbitrage_fetch_seconds_count{endpoint="/data/test/"} 4', body)
+        self.assertIn('arbitrage_alerts_fired_total{category="test_category"} 4', body)
+
+    def test_exited_process_files_merged(self):
+        """已退出进程的文件合并到exited.json后删除，合计不变"""
+        ALERTS_FIRED.labels('test_exited').inc(3)
+        snapshot = json.dumps({'arbitrage_alerts_fired_total': {'["test_exited"]': 2}})
+        pids = []
+        for _ in range(2):
+            process = subprocess.Popen(['true'])
+            process.wait()
+            pids.append(process.pid)
+        for pid in pids:
+            with open(os.path.join(self.tmpdir.name, f'{metrics.marker}_{pid}_deadbeef.json'), 'w') as f:
+                f.write(snapshot)
+        # 其他容器（PID命名空间）的文件无法检查进程是否存在，视为仍在运行
+        other_namespace = f'other-host-1_{pids[0]}_deadbeef.json'
+        with open(os.path.join(self.tmpdir.name, other_namespace), 'w') as f:
+            f.write(snapshot)
+
+        metrics.flush()
+        self.assertEqual(sorted(name for name in os.listdir(self.tmpdir.name) if name.endswith('.json')),
+                         sorted(['exited.json', other_namespace, metrics.file_name]))
+        body = self.client.get('/metrics').content.decode('utf-8')
+        self.assertIn('arbitrage_alerts_fired_total{category="test_exited"} 9', body)
+
+    def test_scrape_waits_for_merge(self):
+        """合并已退出进程的文件期间读取方等待，不会同时读到exited.json和已合并的文件"""
+        metrics.flush()
+        loaded = []
+        with _dir_lock(self.tmpdir.name, fcntl.LOCK_EX):
+            reader = threading.Thread(target=lambda: loaded.append(metrics._load_others()))
+            reader.start()
+            reader.join(0.2)
+            self.assertTrue(reader.is_alive())
+        reader.join(5)
+        self.assertEqual(loaded, [[]])
+
+
+class NotifyChannelTestCase(TestCase):
+    def test_concurrent_fan_out(self):
+        class SlowChannel(NotifyChannel):
+            name = 'slow'
+
+            def _send(self, title, message):
+                time.sleep(1)
+                return True
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'notify.jsonl')
+            file_channel = FileChannel(path, timeout=5)
+            slow_channel = SlowChannel(timeout=0.2)
+            with mock.patch.object(notify_handler, 'channels', [slow_channel, file_channel]):
+                start = time.monotonic()
+                results = notify_handler.deliver('【股票LOF】<br>160632 6.00%', '基金提醒 1只')
+                # 慢渠道超时不影响其他渠道
+                self.assertLess(time.monotonic() - start, 0.8)
+                self.assertEqual(results, {'slow': False, 'file': True})
+
+                # 重试时跳过已发送成功的渠道
+                self.assertEqual(notify_handler.deliver('msg', 'title', exclude={'slow'}), {'file': True})
+                stats = notify_handler.channel_stats()
+
+            with open(path, encoding='utf-8') as f:
+                lines = [json.loads(line) for line in f]
+            self.assertEqual([line['content'] for line in lines], ['【股票LOF】\n160632 6.00%', 'msg'])
+            self.assertEqual(stats['file']['success'], 2)
+            self.assertEqual(stats['slow'], {'success': 0, 'failure': 1, 'latency_p50': None, 'latency_p99': None})
+
+    def test_build_channels(self):
+        cfg = configparser.ConfigParser()
+        cfg.read_string("[DEFAULT]\ntoken = abc\n[webhook]\nurl = http://127.0.0.1/hook\ntimeout = 3\n"
+                        "[smtp]\nhost = smtp.example.com\nfrom = bot@example.com\nto = a@example.com, b@example.com\n")
+        channels = build_channels(cfg)
+        self.assertEqual([channel.name for channel in channels], ['pushplus', 'webhook', 'smtp'])
+        self.assertEqual(channels[1].timeout, 3)
+        self.assertEqual(channels[2].recipients, ['a@example.com', 'b@example.com'])
@@ -1,6 +1,14 @@
 from django.urls import include, path
-from app.views import TestView
+from app.views import (
+    CategoryPremiumView, FundPremiumView, LatestPremiumView, MetricsView, PremiumEventsView, ScanJobView, TestView,
+)
 
 urlpatterns = [
+    path('metrics', MetricsView.as_view(), name='metrics'),
     path('test/', TestView.as_view(), name='test'),
+    path('test/jobs/<int:job_id>/', ScanJobView.as_view(), name='scan_job'),
+    path('premiums/events/', PremiumEventsView.as_view(), name='premium_events'),
+    path('premiums/', LatestPremiumView.as_view(), name='latest_premiums'),
+    path('premiums/funds/<str:fund_id>/', FundPremiumView.as_view(), name='fund_premium'),
+    path('premiums/<str:category>/', CategoryPremiumView.as_view(), name='category_premiums'),
 ]
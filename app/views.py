@@ -1,17 +1,155 @@
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views import View
 from rest_framework import status
 from rest_framework.views import APIView
 from rest_framework.response import Response
 
-from app.query.query_funds import monitor_funds_and_notify
+from app.crons.scan_jobs import enqueue_scan_job, scan_job_data
+from app.common.metrics import metrics
+from app.models import ScanJob
+from app.query.latest_premium import latest_premiums, row_filter
+from app.query.premium_events import premium_events
 
 # Create your views here.
 
 
 class TestView(APIView):
     def post(self, request, *args, **kwargs):
+        # 只创建扫描任务，由调度器执行，不占用worker；已有未完成的任务时返回该任务
+        job, created = enqueue_scan_job()
+        data = scan_job_data(job)
+        data['created'] = created
+        return Response(data, status=status.HTTP_202_ACCEPTED)
+
+
+class ScanJobView(APIView):
+    def get(self, request, job_id, *args, **kwargs):
+        job = ScanJob.objects.filter(id=job_id).first()
+        if job is None:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        return Response(scan_job_data(job))
+
+
+def premium_filter_params(params):
+    """
+    解析过滤条件 holding=true、min_abs_premium=x
+    :raise ValueError: min_abs_premium不是数字
+    """
+    holding = params.get('holding', '').lower() in ('1', 'true')
+    min_abs_premium = params.get('min_abs_premium')
+    return holding, float(min_abs_premium) if min_abs_premium else None
+
+
+class _LatestPremiumBase(APIView):
+    """
+    最新溢价率接口的基类：直接返回内存中预先序列化好的数据，不查询集思录和数据库
+    - ETag由数据版本和过滤条件决定，If-None-Match匹配时返回304
+    - 过滤条件：holding=true 只返回持有的基金，min_abs_premium=x 只返回|溢价率|>=x的基金
+    """
+    # 不做认证，避免读取session查询数据库
+    authentication_classes = []
+    permission_classes = []
+
+    def _filters(self, request):
+        holding, min_abs_premium = premium_filter_params(request.GET)
+        return row_filter(holding, min_abs_premium), f"{int(holding)}-{min_abs_premium}"
+
+    def _respond(self, request, etag: str, build_body):
+        etag = f'W/"{etag}"'
+        if etag in request.META.get('HTTP_IF_NONE_MATCH', ''):
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = HttpResponse(build_body(), content_type='application/json')
+        response['ETag'] = etag
+        response['Cache-Control'] = 'no-cache'
+        return response
+
+    @staticmethod
+    def _rows_body(category, match) -> str:
+        if match is None:
+            return category.body
+        return '[' + ','.join(row.fragment for row in category.rows if match(row)) + ']'
+
+    def get(self, request, *args, **kwargs):
+        try:
+            match, filter_key = self._filters(request)
+        except ValueError:
+            return Response({'error': 'min_abs_premium must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+        return self._get(request, latest_premiums.view(), match, filter_key, **kwargs)
+
+
+class LatestPremiumView(_LatestPremiumBase):
+    """所有分类，category=分类名 只返回该分类"""
+    def _get(self, request, view, match, filter_key):
+        names = [name for name in view.categories
+                 if request.GET.get('category') in (None, '', name)]
+
+        def build_body():
+            categories = ','.join(
+                f'{json.dumps(name)}:{{"updated_at":{json.dumps(view.categories[name].updated_at)},'
+                f'"rows":{self._rows_body(view.categories[name], match)}}}'
+                for name in names)
+            return f'{{"updated_at":{json.dumps(view.updated_at)},"categories":{{{categories}}}}}'
+
+        return self._respond(request, f"{view.etag}-{','.join(names)}-{filter_key}", build_body)
+
+
+class CategoryPremiumView(_LatestPremiumBase):
+    def _get(self, request, view, match, filter_key, category):
+        data = view.categories.get(category)
+        if data is None:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+
+        def build_body():
+            return (f'{{"category":{json.dumps(category)},"updated_at":{json.dumps(data.updated_at)},'
+                    f'"rows":{self._rows_body(data, match)}}}')
+
+        return self._respond(request, f"{view.etag}-{filter_key}", build_body)
+
+
+class FundPremiumView(_LatestPremiumBase):
+    def _get(self, request, view, match, filter_key, fund_id):
+        row = view.funds.get(fund_id)
+        if row is None or (match is not None and not match(row)):
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        return self._respond(request, hashlib.sha1(row.fragment.encode('utf-8')).hexdigest()[:16],
+                             lambda: row.fragment)
+
 
-        monitor_funds_and_notify()
+class PremiumEventsView(View):
+    """
+    推送有变化的基金（event: premium）和新提醒（event: alert），每个扫描周期一次
+    过滤条件：category、fund_id（逗号分隔）、holding、min_abs_premium
+    ASGI下等待时不占用线程；gunicorn同步worker下每个连接占用一个worker，需开启SSE_ALLOW_WSGI
+    """
+    def get(self, request, *args, **kwargs):
+        is_asgi = isinstance(request, ASGIRequest)
+        if not is_asgi and not settings.SSE_ALLOW_WSGI:
+            return JsonResponse({'error': 'server-sent events require an ASGI server'},
+                                status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        try:
+            holding, min_abs_premium = premium_filter_params(request.GET)
+        except ValueError:
+            return JsonResponse({'error': 'min_abs_premium must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+        categories = set(filter(None, request.GET.get('category', '').split(',')))
+        fund_ids = set(filter(None, request.GET.get('fund_id', '').split(',')))
 
+        client = premium_events.subscribe(row_filter(holding, min_abs_premium, categories, fund_ids))
+        if client is None:
+            return JsonResponse({'error': 'too many clients'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        stream = client.aiter() if is_asgi else iter(client)
+        response = StreamingHttpResponse(stream, content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
 
-        return Response(status=status.HTTP_200_OK)
 
+class MetricsView(View):
+    """Prometheus抓取的指标，本进程和其他进程的合计"""
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,13 @@
+import os
+
+
+def post_fork(server, worker):
+    """
+    worker启动时设置ARBITRAGE_GUNICORN_WORKER，app/apps.py据此只在worker中启动定时任务，
+    主进程（--preload时也会导入应用）中不会启动
+    """
+    os.environ['ARBITRAGE_GUNICORN_WORKER'] = '1'
+    if server.cfg.preload_app:
+        # 应用已在主进程中加载，worker中不会再执行AppConfig.ready()
+        from django.apps import apps
+        apps.get_app_config('app').load_cronjobs()
@@ -0,0 +1,17 @@
+"""
+独立扫描进程使用的精简配置：只加载ORM和app，不加载admin、auth、sessions、DRF和中间件
+
+python3 manage.py run_scanner --settings=proj.scanner_settings
+"""
+
+from proj.settings import *  # noqa
+
+INSTALLED_APPS = [
+    'app.apps.AppConfig',
+]
+
+MIDDLEWARE = []
+
+TEMPLATES = []
+
+AUTH_PASSWORD_VALIDATORS = []
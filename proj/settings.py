@@ -158,3 +158,85 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Fund scanning
+# 集思录和pushplus地址，压测时可指向本地回放服务（python3 manage.py bench_cycle）
+JISILU_BASE_URL = os.getenv('JISILU_BASE_URL', 'https://www.jisilu.cn')
+PUSHPLUS_URL = os.getenv('PUSHPLUS_URL', 'https://www.pushplus.plus/send')
+# 并发查询集思录各分类接口的最大线程数
+FETCH_MAX_WORKERS = int(os.getenv('FETCH_MAX_WORKERS', '5'))
+# 共享HTTP客户端连接池：缓存的host连接池数量、每个host最多保持的连接数
+HTTP_POOL_CONNECTIONS = int(os.getenv('HTTP_POOL_CONNECTIONS', '4'))
+HTTP_POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', '8'))
+# 扫描调度方式：interval 固定间隔；session 按交易时段调度（非交易时间休眠，临近收盘加快频率）
+SCAN_SCHEDULE = os.getenv('SCAN_SCHEDULE', 'interval')
+SCAN_INTERVAL_MINUTES = int(os.getenv('SCAN_INTERVAL_MINUTES', '7'))
+SCAN_SESSION_INTERVAL_SECONDS = int(os.getenv('SCAN_SESSION_INTERVAL_SECONDS', '300'))
+SCAN_NEAR_CLOSE_INTERVAL_SECONDS = int(os.getenv('SCAN_NEAR_CLOSE_INTERVAL_SECONDS', '60'))
+# 查询集思录的重试次数及指数退避（秒）
+FETCH_RETRIES = int(os.getenv('FETCH_RETRIES', '2'))
+FETCH_BACKOFF_BASE = float(os.getenv('FETCH_BACKOFF_BASE', '0.5'))
+FETCH_BACKOFF_MAX = float(os.getenv('FETCH_BACKOFF_MAX', '5'))
+# 请求耗时超过历史耗时该分位数时发出对冲请求，0表示关闭；至少积累FETCH_HEDGE_MIN_SAMPLES个样本后生效
+FETCH_HEDGE_PERCENTILE = float(os.getenv('FETCH_HEDGE_PERCENTILE', '95'))
+FETCH_HEDGE_MIN_SAMPLES = int(os.getenv('FETCH_HEDGE_MIN_SAMPLES', '20'))
+# 单个接口连续失败次数达到阈值后熔断，熔断持续时间（秒）
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', '3'))
+CIRCUIT_RESET_SECONDS = float(os.getenv('CIRCUIT_RESET_SECONDS', '120'))
+# 单次扫描周期中查询阶段的截止时间（秒），重试和对冲请求都不会超过它
+SCAN_CYCLE_DEADLINE_SECONDS = float(os.getenv('SCAN_CYCLE_DEADLINE_SECONDS', '90'))
+# 通知规则文件（阈值等）和基金配置文件（持仓、赎回费），首次使用时加载
+NOTIFY_RULES_FILE = os.getenv('NOTIFY_RULES_FILE', str(BASE_DIR / 'app' / 'query' / 'notify_rules.json'))
+FUND_INDEX_FILE = os.getenv('FUND_INDEX_FILE', str(BASE_DIR / 'app' / 'query' / 'funds.json'))
+# 检查上述文件是否修改的间隔（秒），修改后自动重新加载，0表示不检查
+FUND_INDEX_RELOAD_SECONDS = float(os.getenv('FUND_INDEX_RELOAD_SECONDS', '10'))
+# 分类数据快照缓存有效期（秒），只用于手动触发的扫描，定时扫描每个周期都重新请求；0表示不缓存（仍会合并并发请求）
+SNAPSHOT_CACHE_TTL = float(os.getenv('SNAPSHOT_CACHE_TTL', '60'))
+# 溢价率历史：每天收盘后（北京时间）汇总为日线，原始采样保留天数，清理时每批删除的行数
+PREMIUM_ROLLUP_HOUR = int(os.getenv('PREMIUM_ROLLUP_HOUR', '15'))
+PREMIUM_ROLLUP_MINUTE = int(os.getenv('PREMIUM_ROLLUP_MINUTE', '30'))
+PREMIUM_HISTORY_RETENTION_DAYS = int(os.getenv('PREMIUM_HISTORY_RETENTION_DAYS', '30'))
+PREMIUM_HISTORY_CHUNK_SIZE = int(os.getenv('PREMIUM_HISTORY_CHUNK_SIZE', '5000'))
+# 通知发送队列长度、发送线程数，退出时等待队列发送完的最长秒数
+NOTIFY_QUEUE_SIZE = int(os.getenv('NOTIFY_QUEUE_SIZE', '100'))
+NOTIFY_WORKERS = int(os.getenv('NOTIFY_WORKERS', '2'))
+NOTIFY_DRAIN_TIMEOUT = float(os.getenv('NOTIFY_DRAIN_TIMEOUT', '30'))
+# 通知摘要：每个扫描周期的提醒合并为一条消息（按分类分组）；单条消息最大长度，超长时 split 拆成多条 / truncate 截断
+NOTIFY_DIGEST = os.getenv('NOTIFY_DIGEST', 'true').lower() == 'true'
+NOTIFY_DIGEST_MAX_CHARS = int(os.getenv('NOTIFY_DIGEST_MAX_CHARS', '4000'))
+NOTIFY_DIGEST_SPLIT = os.getenv('NOTIFY_DIGEST_SPLIT', 'split')
+# 通知发送：outbox轮询间隔（秒），令牌桶限速（每分钟条数、突发条数），失败重试的指数退避（秒）和最大次数
+NOTIFY_OUTBOX_POLL_SECONDS = float(os.getenv('NOTIFY_OUTBOX_POLL_SECONDS', '5'))
+NOTIFY_RATE_PER_MINUTE = float(os.getenv('NOTIFY_RATE_PER_MINUTE', '10'))
+NOTIFY_RATE_BURST = int(os.getenv('NOTIFY_RATE_BURST', '5'))
+NOTIFY_RETRY_BASE_SECONDS = float(os.getenv('NOTIFY_RETRY_BASE_SECONDS', '30'))
+NOTIFY_RETRY_MAX_SECONDS = float(os.getenv('NOTIFY_RETRY_MAX_SECONDS', '1800'))
+NOTIFY_MAX_ATTEMPTS = int(os.getenv('NOTIFY_MAX_ATTEMPTS', '8'))
+# 通知渠道默认超时（秒），在/config.ini中配置渠道，各渠道可用timeout单独设置
+NOTIFY_CHANNEL_TIMEOUT = float(os.getenv('NOTIFY_CHANNEL_TIMEOUT', '30'))
+# 多进程、多机器部署时只有持有租约的进程执行扫描和发送通知：租约名、有效期（秒）、续约间隔（秒）
+LEADER_LEASE_NAME = os.getenv('LEADER_LEASE_NAME', 'fund_monitor')
+LEADER_LEASE_SECONDS = float(os.getenv('LEADER_LEASE_SECONDS', '30'))
+LEADER_RENEW_SECONDS = float(os.getenv('LEADER_RENEW_SECONDS', '10'))
+# 是否在gunicorn/runserver进程中启动定时任务；使用独立扫描进程（manage.py run_scanner）时设为false
+SCHEDULER_IN_WEB = os.getenv('SCHEDULER_IN_WEB', 'true').lower() == 'true'
+# 手动触发的扫描任务：主节点检查待执行任务的间隔（秒），本进程运行调度器时触发后立即执行
+SCAN_JOB_POLL_SECONDS = float(os.getenv('SCAN_JOB_POLL_SECONDS', '2'))
+# 手动扫描任务执行超过该时间（秒）仍未完成（进程退出等）时标记为失败，之后可以重新触发
+SCAN_JOB_TIMEOUT_SECONDS = float(os.getenv('SCAN_JOB_TIMEOUT_SECONDS', '600'))
+# 手动扫描任务等待超过该时间（秒）仍没有主节点执行（调度器都已停止）时标记为失败，之后可以重新触发
+SCAN_JOB_PENDING_TIMEOUT_SECONDS = float(os.getenv('SCAN_JOB_PENDING_TIMEOUT_SECONDS', '300'))
+# 最新溢价率接口：执行扫描的进程每个周期写入该文件，其他进程检查文件修改时间的最短间隔（秒）；文件路径为空时只使用本进程的数据
+LATEST_PREMIUM_FILE = os.getenv('LATEST_PREMIUM_FILE', '/tmp/arbitrage_latest_premium.json')
+LATEST_PREMIUM_RELOAD_SECONDS = float(os.getenv('LATEST_PREMIUM_RELOAD_SECONDS', '1'))
+# 溢价率变化推送（SSE）：最大连接数、每个连接最多缓存的事件数（超过时断开该连接）、心跳间隔（秒）
+SSE_MAX_CLIENTS = int(os.getenv('SSE_MAX_CLIENTS', '100'))
+SSE_CLIENT_BUFFER = int(os.getenv('SSE_CLIENT_BUFFER', '1000'))
+SSE_HEARTBEAT_SECONDS = float(os.getenv('SSE_HEARTBEAT_SECONDS', '15'))
+# WSGI（gunicorn同步worker）下每个连接占用一个worker，默认只在ASGI下提供推送；
+# 开启后每个连接最长SSE_WSGI_MAX_SECONDS秒，之后由客户端按retry自动重连
+SSE_ALLOW_WSGI = os.getenv('SSE_ALLOW_WSGI', 'false').lower() == 'true'
+SSE_WSGI_MAX_SECONDS = float(os.getenv('SSE_WSGI_MAX_SECONDS', '30'))
+# /metrics：各进程每METRICS_FLUSH_SECONDS秒把指标写入METRICS_DIR，由/metrics合计；目录为空时只返回本进程的指标
+METRICS_DIR = os.getenv('METRICS_DIR', '/tmp/arbitrage_metrics')
+METRICS_FLUSH_SECONDS = float(os.getenv('METRICS_FLUSH_SECONDS', '15'))